@@ -1,7 +1,9 @@
 from fastapi import APIRouter
 
 from .images import router as images_router
+from .jobs import router as jobs_router
 
 router = APIRouter(prefix="/v1")
 router.include_router(images_router)
+router.include_router(jobs_router)
 
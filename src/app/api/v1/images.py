@@ -1,143 +1,196 @@
 import asyncio
+import json
 import os
-from enum import StrEnum
-from typing import Optional
-from uuid import UUID
-
-import httpx
+import time
+from collections.abc import AsyncIterator
+from datetime import datetime
+from uuid import UUID, uuid4, uuid5
 
 # Add these imports to existing ones
-from fastapi import APIRouter, Depends, File, HTTPException, Path, UploadFile
-from fastapi.responses import Response
-from loguru import logger
-from pydantic import BaseModel, Field
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import insert, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...core.config import settings
-from ...core.db.database import get_db
+from ...core.db.database import async_engine, get_db
+from ...core.logger import logging
+from ...core.utils import metrics, server_timing
+from ...core.utils.blob_store import acquire_blob, store_blob, store_blobs
+from ...core.utils.export import EXPORT_MEDIA_TYPES, export_chunks, gzip_chunks
+from ...core.utils.flux import FluxClient, get_flux_client
+from ...core.utils.generation import (
+    GenerationError,
+    GenerationLimits,
+    iter_sample,
+    media_type_for,
+    open_sample,
+    passthrough_headers,
+    request_key,
+    take_client_token,
+    tee,
+    wait_for_sample,
+)
+from ...core.utils.http_cache import (
+    conditional_file_response,
+    file_etag,
+    is_not_modified,
+    not_modified_response,
+    revalidated_policy,
+)
+from ...core.utils.image_store import (
+    ImageWriter,
+    PendingImage,
+    extension_for,
+    get_image_writer,
+    image_url,
+)
+from ...core.utils.pagination import as_naive_utc, decode_cursor, encode_cursor
+from ...core.utils.poller import FluxPoller, get_flux_poller
+from ...core.utils.queue import get_queue_pool
+from ...core.utils.rate_limit import KeyedTokenBuckets, get_client_buckets
+from ...core.utils.result_cache import CachedImage, ResultCache, get_result_cache
+from ...core.utils.retention import delete_image_record, remove_image_files
+from ...core.utils.single_flight import SingleFlight
+from ...core.utils.storage import storage
+from ...core.utils.storage_layout import image_filename
+from ...core.utils.transforms import ImageTransformer, TransformOverloaded, get_image_transformer, negotiate_format
+from ...core.utils.uploads import (
+    BULK_UPLOAD_REQUEST_BODY,
+    MULTIPART_OVERHEAD,
+    SINGLE_FILE_REQUEST_BODY,
+    UPLOAD_TMP_DIR,
+    StreamedFile,
+    check_content_length,
+    stream_form,
+)
+from ...core.utils.variants import VariantPipeline, describe_variants, get_variant_pipeline
+from ...models.blob import Blob
 from ...models.image import Image
+from ...models.image_variant import ImageVariant
+from ...schemas.image import (
+    BatchGenerationItem,
+    BatchGenerationRequest,
+    ExportFormat,
+    FluxModel,
+    ImageFit,
+    ImageFormat,
+    ImageGenerationRequest,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["images"])
 
-API_BASE_URL = "https://api.bfl.ml/v1"
-
-class ImageGenerationResultStatus(StrEnum):
-    TASK_NOT_FOUND = "Task not found"
-    PENDING = "Pending"
-    REQUEST_MODERATED = "Request Moderated"
-    CONTENT_MODERATED = "Content Moderated"
-    READY = "Ready"
-    ERROR = "Error"
-
-
-class FluxModel(StrEnum):
-    FLUX_PRO_1_1 = "flux-pro-1.1"
-    FLUX_PRO = "flux-pro"
-    FLUX_DEV = "flux-dev"
-    FLUX_PRO_1_1_ULTRA = "flux-pro-1.1-ultra"
-    FLUX_PRO_1_0_FILL = "flux-pro-1.0-fill"
-    FLUX_PRO_1_0_CANYON = "flux-pro-1.0-canny"
-    FLUX_PRO_1_0_DEPTH = "flux-pro-1.0-depth"
-
-
-class ImageGenerationRequest(BaseModel):
-    prompt: str = Field(..., description="The prompt to generate the image from")
-    width: int = Field(default=1024, ge=64, le=2048, description="Image width in pixels")
-    height: int = Field(default=768, ge=64, le=2048, description="Image height in pixels")
-    prompt_upsampling: bool = Field(default=False, description="Whether to use prompt upsampling")
-    seed: Optional[int] = Field(default=None, description="Random seed for reproducible generations")
-    safety_tolerance: int = Field(
-        default=2,
-        ge=0,
-        le=3,
-        description="Safety filter tolerance level (0-3)"
-    )
-    output_format: str = Field(
-        default="jpeg",
-        pattern="^(jpeg|png)$",
-        description="Output format of the generated image"
-    )
+# Identical requests in flight at the same time share one upstream task
+sample_flights: SingleFlight[str] = SingleFlight()
+
+# Generations started by batches, shared across all of them
+batch_limits = GenerationLimits(settings)
+
+GENERATED_IMAGE_NAMESPACE = UUID("9d4f1f0e-7c1a-4d5e-9a3b-2f6c8e0b1d47")
+
+
+async def persist_cached(writer: ImageWriter, image_id: str, cached: CachedImage) -> str:
+    """Make sure a cached result is stored under `/uploads`, returning its filename."""
+    filename = image_filename(image_id, extension_for(cached.media_type))
+    if not await asyncio.to_thread(storage.exists, filename):
+        writer.submit(PendingImage(image_id, filename, cached.media_type, cached.content))
+    return filename
+
+
+def client_identity(request: Request) -> str:
+    """What a request counts against for the per-client rate limits: its `X-API-Key` if it sends one, else its IP."""
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else '-'}"
+
 
 @router.post("/generate-image")
 async def generate_image(
+    http_request: Request,
     request: ImageGenerationRequest,
-    model: FluxModel = FluxModel.FLUX_PRO_1_1
+    model: FluxModel = FluxModel.FLUX_PRO_1_1,
+    run_async: bool = Query(False, alias="async", description="Queue the generation and return a job id"),
+    client: FluxClient = Depends(get_flux_client),
+    poller: FluxPoller = Depends(get_flux_poller),
+    cache: ResultCache = Depends(get_result_cache),
+    writer: ImageWriter = Depends(get_image_writer),
+    client_limits: KeyedTokenBuckets = Depends(get_client_buckets),
 ) -> Response:
-    """Generate an image using the model."""
-    try:
-        async with httpx.AsyncClient() as client:
-            # Step 1: Start the image generation
-            generation_response = await client.post(
-                f"{API_BASE_URL}/{model.value}",
-                json=request.model_dump(),  # Convert Pydantic model to dict
-                headers={
-                    "Content-Type": "application/json",
-                    "X-Key": settings.FLUX_API_KEY
-                }
-            )
-            generation_data = generation_response.json()
-            task_id = generation_data.get("id")
-
-            if not task_id:
-                raise HTTPException(status_code=500, detail=f"Failed to start image generation: {generation_data}")
-
-            # Step 2: Poll for results
-            max_attempts = 15  # Maximum number of attempts
-            attempt = 0
-            while attempt < max_attempts:
-                result_response = await client.get(
-                    f"{API_BASE_URL}/get_result?id={task_id}"
-                )
-                result_data = result_response.json()
-                status = result_data.get("status")
-
-                if status == ImageGenerationResultStatus.READY:
-                    # Get the image data
-                    image_url = result_data.get("result").get("sample")
-                    image_response = await client.get(image_url)
-                    return Response(
-                        content=image_response.content,
-                        media_type="image/png"
-                    )
-                elif status == ImageGenerationResultStatus.ERROR:
-                    return Response(
-                        content="Image generation failed",
-                        status_code=500,
-                        media_type="text/plain"
-                    )
-                elif status == ImageGenerationResultStatus.TASK_NOT_FOUND:
-                    return Response(
-                        content="Task not found",
-                        status_code=404,
-                        media_type="text/plain"
-                    )
-                elif status == ImageGenerationResultStatus.REQUEST_MODERATED:
-                    return Response(
-                        content="Request was moderated due to content policy",
-                        status_code=400,
-                        media_type="text/plain"
-                    )
-                elif status == ImageGenerationResultStatus.CONTENT_MODERATED:
-                    return Response(
-                        content="Generated content was moderated due to content policy",
-                        status_code=400,
-                        media_type="text/plain"
-                    )
-                elif status == ImageGenerationResultStatus.PENDING:
-                    # Continue polling
-                    await asyncio.sleep(0.3)
-                    attempt += 1
-                    logger.info(f"Image generation status: {status}")
-                    logger.info(f"Attempt: {attempt}")
-                    continue
+    """Generate an image using the model.
+
+    Seeded requests are deterministic, so their results are served from the result cache when possible. Identical
+    requests arriving while one is already being generated wait for that generation instead of starting another.
 
+    The image is streamed back as it downloads and stored under `/uploads` in the background; the `X-Image-Id` and
+    `X-Image-Url` headers point at the stored copy.
+
+    Generations that are not served from the cache count against the rate limit of the client, see `client_identity`.
+    """
+    server_timing.handler_started()
+    client_id = client_identity(http_request)
+    if run_async:
+        pool = get_queue_pool()
+        try:
+            await take_client_token(client_limits, client_id)
+        except GenerationError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.message, headers=e.headers)
+        job = await pool.enqueue_job("generate_image_task", request.model_dump(), model.value)
+        if job is None:
+            raise HTTPException(status_code=409, detail="Generation job already queued")
+        return JSONResponse(status_code=202, content={"id": job.job_id, "status": "queued"})
+
+    key = request_key(request, model)
+    seeded = request.seed is not None
+    # Seeded results get a stable id, so every cache hit points at the same stored image
+    image_id = str(uuid5(GENERATED_IMAGE_NAMESPACE, key)) if seeded else str(uuid4())
+
+    if seeded:
+        cached = await cache.get(key)
+        if cached is not None:
+            filename = await persist_cached(writer, image_id, cached)
             return Response(
-                content="Timeout waiting for image generation",
-                status_code=408,
-                media_type="text/plain"
+                content=cached.content,
+                media_type=cached.media_type,
+                headers={"X-Cache": "HIT", "X-Image-Id": image_id, "X-Image-Url": image_url(filename)},
             )
 
+    try:
+        await take_client_token(client_limits, client_id)
+        sample_url = await sample_flights.do(key, lambda: wait_for_sample(client, poller, request, model))
+        image_response = await open_sample(client, sample_url, model)
+        media_type = image_response.headers.get("content-type", media_type_for(request))
+        filename = image_filename(image_id, extension_for(media_type))
+
+        async def on_complete(content: bytes) -> None:
+            if seeded:
+                await cache.put(key, content, media_type)
+            writer.submit(PendingImage(image_id, filename, media_type, content))
+
+        headers = {
+            **passthrough_headers(image_response),
+            "X-Image-Id": image_id,
+            "X-Image-Url": image_url(filename),
+        }
+        if seeded:
+            headers["X-Cache"] = "MISS"
+
+        return StreamingResponse(
+            tee(iter_sample(client, image_response), client.max_image_size, on_complete),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    except GenerationError as e:
+        return Response(
+            content=e.message,
+            status_code=e.status_code,
+            media_type="text/plain",
+            headers=e.headers,
+        )
+
     except Exception as e:
         return Response(
             content=f"Error generating image: {str(e)}",
@@ -146,77 +199,530 @@ async def generate_image(
         )
 
 
+async def generate_batch_item(
+    index: int,
+    item: BatchGenerationItem,
+    client: FluxClient,
+    poller: FluxPoller,
+    cache: ResultCache,
+    writer: ImageWriter,
+    client_limits: KeyedTokenBuckets,
+    client_id: str,
+) -> dict:
+    """Generate one image of a batch and store it, reporting the outcome instead of raising."""
+    request, model = item.request, item.model
+    key = request_key(request, model)
+    seeded = request.seed is not None
+    image_id = str(uuid5(GENERATED_IMAGE_NAMESPACE, key)) if seeded else str(uuid4())
+
+    try:
+        cached = await cache.get(key) if seeded else None
+        if cached is not None:
+            filename = await persist_cached(writer, image_id, cached)
+            return {"index": index, "status_code": 200, "id": image_id, "url": image_url(filename), "cache": "HIT"}
+
+        await take_client_token(client_limits, client_id)
+        async with batch_limits.slot(model):
+            sample_url = await sample_flights.do(key, lambda: wait_for_sample(client, poller, request, model))
+            image_response = await open_sample(client, sample_url, model)
+            media_type = image_response.headers.get("content-type", media_type_for(request))
+            content = b"".join([chunk async for chunk in iter_sample(client, image_response)])
+
+        filename = image_filename(image_id, extension_for(media_type))
+        if seeded:
+            await cache.put(key, content, media_type)
+        writer.submit(PendingImage(image_id, filename, media_type, content))
+        return {"index": index, "status_code": 200, "id": image_id, "url": image_url(filename), "cache": "MISS"}
+
+    except GenerationError as e:
+        failure = {"index": index, "status_code": e.status_code, "detail": e.message}
+        if e.retry_after is not None:
+            failure["retry_after"] = e.retry_after
+        return failure
+
+    except Exception as e:
+        logger.error(f"Error generating batch item {index}: {str(e)}")
+        return {"index": index, "status_code": 500, "detail": f"Error generating image: {str(e)}"}
+
+
+@router.post("/generate-images")
+async def generate_images(
+    http_request: Request,
+    batch: BatchGenerationRequest,
+    client: FluxClient = Depends(get_flux_client),
+    poller: FluxPoller = Depends(get_flux_poller),
+    cache: ResultCache = Depends(get_result_cache),
+    writer: ImageWriter = Depends(get_image_writer),
+    client_limits: KeyedTokenBuckets = Depends(get_client_buckets),
+) -> StreamingResponse:
+    """Generate a batch of images, streaming one NDJSON line per image as each one finishes.
+
+    Lines arrive in completion order and carry the `index` of their item, with the id and URL of the stored image or
+    the status code and detail of the failure. Generations run with the process-wide per-model and global limits of
+    `BatchGenerationSettings`, shared by all batches, and go through the same result cache and request coalescing as
+    single generations. Like those, they count against the rate limit of the client, items over it fail with 429.
+    Unfinished generations are cancelled if the client disconnects.
+    """
+    if len(batch.items) > settings.BATCH_GENERATION_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Batch has {len(batch.items)} items, at most {settings.BATCH_GENERATION_MAX_ITEMS} allowed"
+        )
+
+    client_id = client_identity(http_request)
+
+    async def results() -> AsyncIterator[bytes]:
+        tasks = [
+            asyncio.create_task(
+                generate_batch_item(index, item, client, poller, cache, writer, client_limits, client_id)
+            )
+            for index, item in enumerate(batch.items)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield (json.dumps(await next_result) + "\n").encode()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 
-# Add this function to handle file uploads
 def is_valid_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in settings.ALLOWED_EXTENSIONS
 
-@router.post("/upload/{image_id}")
+
+def validate_upload(field_name: str, filename: str) -> None:
+    if field_name != "file":
+        raise HTTPException(status_code=400, detail=f"Unexpected file field: {field_name}")
+    if not is_valid_file(filename):
+        raise HTTPException(
+            status_code=400,
+            detail="File type not allowed"
+        )
+
+
+@router.post("/upload/{image_id}", openapi_extra=SINGLE_FILE_REQUEST_BODY)
 async def upload_image(
+    request: Request,
     image_id: UUID = Path(..., description="The UUID for the image"),
-    file: UploadFile = File(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    variants: VariantPipeline = Depends(get_variant_pipeline),
 ) -> dict:
-    """Upload an image with a specific UUID and return its URL."""
+    """Upload an image with a specific UUID and return its URL.
+
+    The multipart body is parsed from the request stream here rather than by FastAPI, so the id and size checks run
+    before the file is accepted and the file goes to disk chunk by chunk instead of through memory.
+    """
+    server_timing.handler_started()
+    started = time.perf_counter()
     image_id_str = str(image_id)
-    try:
-        if not is_valid_file(file.filename):
-            raise HTTPException(
-                status_code=400,
-                detail="File type not allowed"
-            )
 
-        # Create uploads directory if it doesn't exist
-        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    # Check if UUID already exists
+    result = await db.execute(select(Image.id).where(Image.id == image_id_str))
+    if result.scalar_one_or_none():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image with ID {image_id_str} already exists"
+        )
 
-        # Generate unique filename using the provided UUID
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{image_id_str}.{ext}"
-        file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-
-        # Check if UUID already exists
-        result = await db.execute(select(Image).where(Image.id == image_id_str))
-        if result.scalar_one_or_none():
-            raise HTTPException(
-                status_code=400,
-                detail=f"Image with ID {image_id_str} already exists"
-            )
+    check_content_length(request, settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD)
 
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+    form = await stream_form(
+        request,
+        directory=os.path.join(settings.UPLOAD_DIR, UPLOAD_TMP_DIR),
+        max_file_size=settings.MAX_FILE_SIZE,
+        validate_file=validate_upload,
+    )
+    if not form.files:
+        raise HTTPException(status_code=422, detail="Missing file")
+    file = form.files[0]
 
-        # Create URL
-        url = f"{settings.BASE_URL}/uploads/{unique_filename}"
+    try:
+        # The image gets its own name, its bytes are stored once per distinct content
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        unique_filename = f"{image_id_str}.{ext}"
+        blob, stored = await store_blob(db, file, ext)
 
         # Create new image record with specified UUID
         db_image = Image(
             id=image_id_str,
             filename=unique_filename,
             original_filename=file.filename,
-            file_path=file_path,
-            url=url,
-            content_type=file.content_type
+            file_path=blob.file_path,
+            url=blob.url,
+            content_type=file.content_type,
+            blob_sha256=blob.sha256,
         )
 
         # Add and commit to database
         db.add(db_image)
         await db.commit()
-        await db.refresh(db_image)
+        variants.submit(image_id_str, blob.file_path, blob.sha256)
+        metrics.upload_seconds["single"].observe(time.perf_counter() - started)
 
         return {
             "id": str(db_image.id),  # Convert UUID to string for JSON response
             "url": db_image.url,
-            "filename": db_image.filename
+            "filename": db_image.filename,
+            "size": file.size,
+            "sha256": file.sha256,
+            "deduplicated": not stored,
         }
 
     except Exception as e:
-        # Clean up file if database operation fails
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        # A blob file left without a row is reclaimed by garbage collection, it may already be shared
+        await db.rollback()
+        form.cleanup()
         logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Error uploading file: {str(e)}"
         )
+
+
+def validate_bulk_upload(field_name: str, filename: str) -> None:
+    # File types are checked per item, so one bad file does not fail the whole batch
+    if field_name != "files":
+        raise HTTPException(status_code=400, detail=f"Unexpected file field: {field_name}")
+
+
+def bulk_upload_error(raw_id: str, file: StreamedFile, existing_ids: set[str], seen_ids: set[str]) -> str | None:
+    try:
+        image_id = str(UUID(raw_id))
+    except ValueError:
+        return f"Invalid image ID {raw_id}"
+    if image_id in existing_ids:
+        return f"Image with ID {image_id} already exists"
+    if image_id in seen_ids:
+        return f"Image ID {image_id} appears more than once"
+    if not is_valid_file(file.filename):
+        return "File type not allowed"
+    return None
+
+
+@router.post("/upload", openapi_extra=BULK_UPLOAD_REQUEST_BODY)
+async def upload_images(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    variants: VariantPipeline = Depends(get_variant_pipeline),
+) -> dict:
+    """Upload many images in one request and report the outcome of each.
+
+    The body holds the images as `files` parts and their UUIDs in `ids`, one per file in the same order, as repeated
+    fields or comma separated. Duplicate ids are found with one query, new content is moved into place with bounded
+    concurrency and all rows are inserted in one statement and one transaction. Files that are rejected (bad id, id
+    already taken, type not allowed) are reported in `results` without failing the others.
+    """
+    server_timing.handler_started()
+    started = time.perf_counter()
+    check_content_length(request, settings.MAX_BULK_UPLOAD_FILES * (settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD))
+
+    form = await stream_form(
+        request,
+        directory=os.path.join(settings.UPLOAD_DIR, UPLOAD_TMP_DIR),
+        max_file_size=settings.MAX_FILE_SIZE,
+        max_files=settings.MAX_BULK_UPLOAD_FILES,
+        validate_file=validate_bulk_upload,
+    )
+
+    try:
+        raw_ids = [
+            raw_id.strip() for value in form.fields.get("ids", []) for raw_id in value.split(",") if raw_id.strip()
+        ]
+        if not form.files:
+            raise HTTPException(status_code=422, detail="Missing files")
+        if len(raw_ids) != len(form.files):
+            raise HTTPException(status_code=422, detail=f"Got {len(raw_ids)} ids for {len(form.files)} files")
+
+        valid_ids = []
+        for raw_id in raw_ids:
+            try:
+                valid_ids.append(str(UUID(raw_id)))
+            except ValueError:
+                pass
+        result = await db.execute(select(Image.id).where(Image.id.in_(valid_ids)))
+        existing_ids = set(result.scalars())
+
+        results: list[dict] = []
+        accepted: list[tuple[int, str, StreamedFile, str]] = []
+        seen_ids: set[str] = set()
+        for raw_id, file in zip(raw_ids, form.files):
+            error = bulk_upload_error(raw_id, file, existing_ids, seen_ids)
+            if error is not None:
+                results.append({"id": raw_id, "status_code": 400, "detail": error})
+                continue
+
+            image_id_str = str(UUID(raw_id))
+            seen_ids.add(image_id_str)
+            accepted.append((len(results), image_id_str, file, file.filename.rsplit('.', 1)[1].lower()))
+            results.append({})
+
+        stored = await store_blobs(
+            db, [(file, ext) for _, _, file, ext in accepted], concurrency=settings.BULK_UPLOAD_CONCURRENCY
+        )
+
+        rows = []
+        for (index, image_id_str, file, ext), (blob, created) in zip(accepted, stored):
+            row = {
+                "id": image_id_str,
+                "filename": f"{image_id_str}.{ext}",
+                "original_filename": file.filename,
+                "file_path": blob.file_path,
+                "url": blob.url,
+                "content_type": file.content_type,
+                "blob_sha256": blob.sha256,
+            }
+            rows.append(row)
+            results[index] = {
+                "id": image_id_str,
+                "status_code": 200,
+                "url": blob.url,
+                "filename": row["filename"],
+                "size": file.size,
+                "sha256": file.sha256,
+                "deduplicated": not created,
+            }
+
+        if rows:
+            await db.execute(insert(Image), rows)
+        await db.commit()
+        for row in rows:
+            variants.submit(row["id"], row["file_path"], row["blob_sha256"])
+        metrics.upload_seconds["bulk"].observe(time.perf_counter() - started)
+
+        return {"uploaded": len(rows), "failed": len(results) - len(rows), "results": results}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error uploading files: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error uploading files: {str(e)}"
+        )
+    finally:
+        form.cleanup()
+
+
+@router.get("/blobs/{sha256}")
+async def get_blob(
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$", description="SHA-256 of the file content"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Pre-flight check for an upload: whether content with this hash is already stored.
+
+    When it is, the client can link a new image to it with `POST /upload/{image_id}/blob/{sha256}` instead of
+    sending the file again.
+    """
+    blob = await db.get(Blob, sha256)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    return {"sha256": blob.sha256, "size": blob.size, "content_type": blob.content_type, "url": blob.url}
+
+
+@router.post("/upload/{image_id}/blob/{sha256}")
+async def link_blob(
+    image_id: UUID = Path(..., description="The UUID for the image"),
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$", description="SHA-256 of the file content"),
+    filename: str | None = Query(None, description="Original filename of the image"),
+    db: AsyncSession = Depends(get_db),
+    variants: VariantPipeline = Depends(get_variant_pipeline),
+) -> dict:
+    """Create an image from content that is already stored, without transferring it."""
+    image_id_str = str(image_id)
+
+    result = await db.execute(select(Image.id).where(Image.id == image_id_str))
+    if result.scalar_one_or_none():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Image with ID {image_id_str} already exists"
+        )
+    if filename is not None and not is_valid_file(filename):
+        raise HTTPException(status_code=400, detail="File type not allowed")
+
+    blob = await acquire_blob(db, sha256)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    db_image = Image(
+        id=image_id_str,
+        filename=f"{image_id_str}.{blob.filename.rsplit('.', 1)[1]}",
+        original_filename=filename,
+        file_path=blob.file_path,
+        url=blob.url,
+        content_type=blob.content_type,
+        blob_sha256=blob.sha256,
+    )
+    db.add(db_image)
+    await db.commit()
+    # The variants of stored content usually exist already, only their rows are added
+    variants.submit(image_id_str, blob.file_path, blob.sha256)
+
+    return {
+        "id": image_id_str,
+        "url": db_image.url,
+        "filename": db_image.filename,
+        "size": blob.size,
+        "sha256": blob.sha256,
+        "deduplicated": True,
+    }
+
+
+@router.get("/images")
+async def list_images(
+    limit: int = Query(50, ge=1, le=200, description="Images per page"),
+    cursor: str | None = Query(None, description="The `next_cursor` of the previous page"),
+    content_type: str | None = Query(None, description="Only images of this media type, e.g. image/png"),
+    created_after: datetime | None = Query(None, description="Only images created at or after this time"),
+    created_before: datetime | None = Query(None, description="Only images created before this time"),
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    """List images, newest first, a page at a time.
+
+    Pages are fetched by keyset rather than offset: the cursor holds the `(created_at, id)` of the last image of the
+    previous page and the next page starts right after it in the index, so every page costs the same at any depth.
+    """
+    query = select(Image.id, Image.url, Image.content_type, Image.original_filename, Image.created_at)
+    if content_type is not None:
+        query = query.where(Image.content_type == content_type)
+    if created_after is not None:
+        query = query.where(Image.created_at >= as_naive_utc(created_after))
+    if created_before is not None:
+        query = query.where(Image.created_at < as_naive_utc(created_before))
+    if cursor is not None:
+        query = query.where(tuple_(Image.created_at, Image.id) < tuple_(*decode_cursor(cursor)))
+    # One row past the page tells whether there is a next one
+    query = query.order_by(Image.created_at.desc(), Image.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "url": row.url,
+                "content_type": row.content_type,
+                "original_filename": row.original_filename,
+                "created_at": row.created_at,
+            }
+            for row in page
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/images/export")
+async def export_images(
+    format: ExportFormat = Query(ExportFormat.NDJSON, description="NDJSON, one object per line, or CSV with a header"),
+    created_after: datetime | None = Query(None, description="Only images created at or after this time"),
+    created_before: datetime | None = Query(None, description="Only images created before this time"),
+    compress: bool = Query(False, description="Gzip the export"),
+) -> StreamingResponse:
+    """Export the metadata of every image, oldest first, streamed as it is read from the database.
+
+    Rows are read through a server-side cursor a batch at a time, so memory use does not grow with the table. For
+    incremental exports, pass the `created_at` of the last row of the previous export as `created_after`.
+    """
+    filename = f"images.{format.value}"
+    chunks = export_chunks(async_engine, format, as_naive_utc(created_after), as_naive_utc(created_before))
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if compress:
+        chunks, filename, media_type = gzip_chunks(chunks), f"{filename}.gz", "application/gzip"
+    return StreamingResponse(
+        chunks, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/images/{image_id}")
+async def get_image(
+    request: Request,
+    image_id: UUID = Path(..., description="The UUID for the image"),
+    w: int | None = Query(None, ge=1, le=settings.IMAGE_TRANSFORM_MAX_DIMENSION, description="Width of the box"),
+    h: int | None = Query(None, ge=1, le=settings.IMAGE_TRANSFORM_MAX_DIMENSION, description="Height of the box"),
+    fit: ImageFit = Query(ImageFit.CONTAIN, description="Fit inside the box, or fill it and crop"),
+    format: ImageFormat | None = Query(None, description="Output format, negotiated from Accept when left out"),
+    db: AsyncSession = Depends(get_db),
+    transformer: ImageTransformer = Depends(get_image_transformer),
+) -> Response:
+    """Serve an image, resized, cropped and transcoded on demand.
+
+    Without parameters the stored original is returned. Otherwise the image is scaled to fit the `w` x `h` box (or
+    with `fit=cover` to fill it, cropping the overflow) and encoded as `format`, or as the best format the client's
+    `Accept` header allows. Results are cached on disk, so each size and format is only made once.
+    """
+    db_image = await db.get(Image, str(image_id))
+    if db_image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # The image behind an id can be deleted and uploaded again, so its URLs are revalidated rather than immutable
+    cache_control = revalidated_policy(settings.CLIENT_CACHE_MAX_AGE)
+
+    filename = storage.filename(db_image.file_path)
+    if w is None and h is None and format is None:
+        etag = f'"{db_image.blob_sha256}"' if db_image.blob_sha256 is not None else None
+        redirect = storage.redirect(filename)
+        if redirect is not None:
+            # Clients read the file from the storage, content-addressed ones can still be confirmed current here
+            if etag is not None and is_not_modified(request.headers, etag):
+                return not_modified_response(etag, cache_control)
+            return redirect
+        if etag is None:
+            try:
+                etag = await file_etag(db_image.file_path)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Image file not found")
+        return conditional_file_response(request, db_image.file_path, db_image.content_type, etag, cache_control)
+
+    fmt = format or negotiate_format(request.headers.get("accept"), db_image.content_type)
+    source_key = db_image.blob_sha256 or db_image.id
+    headers = {} if format is not None else {"Vary": "Accept"}
+    # The key names the result, so a client's copy is confirmed current without making or looking up the result
+    etag = f'"{transformer.key(source_key, w, h, fit, fmt)}"'
+    if is_not_modified(request.headers, etag):
+        return not_modified_response(etag, cache_control, headers)
+
+    try:
+        transformed, hit = await transformer.get(filename, source_key, w, h, fit, fmt)
+    except TransformOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image file not found")
+
+    headers["X-Cache"] = "HIT" if hit else "MISS"
+    return conditional_file_response(request, transformed.path, transformed.media_type, etag, cache_control, headers)
+
+
+@router.delete("/images/{image_id}")
+async def delete_image(
+    image_id: UUID = Path(..., description="The UUID for the image"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """Delete an image, and its file once no other image shares it."""
+    deleted = await delete_image_record(db, str(image_id))
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    await db.commit()
+
+    await asyncio.to_thread(remove_image_files, deleted)
+    return {"id": str(image_id), "deleted": True}
+
+
+@router.get("/images/{image_id}/variants")
+async def get_image_variants(
+    image_id: UUID = Path(..., description="The UUID for the image"),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """List the resized variants of an image made so far, by name.
+
+    Variants are made in the background after an image is stored, so a freshly stored image may not have them yet.
+    """
+    db_image = await db.get(Image, str(image_id))
+    if db_image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    result = await db.execute(select(ImageVariant).where(ImageVariant.image_id == db_image.id))
+    return {"id": db_image.id, "url": db_image.url, "variants": describe_variants(list(result.scalars()))}
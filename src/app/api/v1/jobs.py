@@ -0,0 +1,89 @@
+import os
+from typing import Any
+
+from arq.connections import ArqRedis
+from arq.jobs import Job as ArqJob
+from arq.jobs import JobStatus
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+from ...core.config import settings
+from ...core.utils.generation import GenerationError
+from ...core.utils.queue import get_queue_pool
+from ...core.utils.storage import storage
+
+router = APIRouter(tags=["jobs"])
+
+
+async def get_job(job_id: str, pool: ArqRedis = Depends(get_queue_pool)) -> ArqJob:
+    job = ArqJob(job_id, pool)
+    if await job.status() == JobStatus.not_found:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job: ArqJob = Depends(get_job)) -> dict[str, Any]:
+    """Return the state of a queued generation job."""
+    status = await job.status()
+    response: dict[str, Any] = {"id": job.job_id, "status": status.value}
+
+    if status == JobStatus.complete:
+        result = await job.result_info()
+        if result is not None:
+            response.update(
+                {
+                    "success": result.success,
+                    "enqueue_time": result.enqueue_time,
+                    "start_time": result.start_time,
+                    "finish_time": result.finish_time,
+                }
+            )
+            if result.success:
+                response.update(
+                    {
+                        "image_id": result.result["id"],
+                        "url": result.result["url"],
+                        "variants": result.result.get("variants", {}),
+                    }
+                )
+            else:
+                response["error"] = str(result.result)
+
+    return response
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job: ArqJob = Depends(get_job)) -> Response:
+    """Return the generated image of a finished job."""
+    status = await job.status()
+    if status != JobStatus.complete:
+        return JSONResponse(
+            status_code=202,
+            content={"id": job.job_id, "status": status.value},
+            headers={"Retry-After": str(settings.GENERATION_JOB_RETRY_AFTER)},
+        )
+
+    result = await job.result_info()
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Result of job {job.job_id} has expired")
+
+    if not result.success:
+        status_code = result.result.status_code if isinstance(result.result, GenerationError) else 500
+        return Response(content=str(result.result), status_code=status_code, media_type="text/plain")
+
+    image: dict[str, Any] = result.result
+    headers = {"X-Image-Id": image["id"], "X-Image-Url": image["url"]}
+    redirect = storage.redirect(storage.filename(image["file_path"]), headers)
+    if redirect is not None:
+        return redirect
+    if not os.path.exists(image["file_path"]):
+        raise HTTPException(status_code=404, detail=f"Image of job {job.job_id} no longer exists")
+
+    return FileResponse(
+        image["file_path"],
+        media_type=image["content_type"],
+        filename=os.path.basename(image["filename"]),
+        content_disposition_type="inline",
+        headers=headers,
+    )
@@ -1,8 +1,10 @@
+from ...models.blob import Blob
 from ...models.image import Image  # Verify this import works
+from ...models.image_variant import ImageVariant
 from .base_class import Base
 
 # List of all models for metadata
-models = [Image]
+models = [Blob, Image, ImageVariant]
 
 # Re-export Base for convenience
 __all__ = ["Base", "models"]
@@ -1,22 +1,68 @@
 from collections.abc import AsyncGenerator
 from typing import Any
 
+from sqlalchemy import Connection, event, inspect, make_url, text
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 
-from ...core.config import settings
+from ...core.config import DatabaseSettings, settings
+from ..utils import metrics, server_timing
 from .base import Base
 
-# Create async engine for SQLite
-async_engine = create_async_engine(
-    settings.DATABASE_URI,
-    echo=settings.DB_ECHO,
-    # SQLite specific: enable foreign keys
-    connect_args={"check_same_thread": False}
-)
+
+def sqlite_pragmas(settings: DatabaseSettings) -> list[str]:
+    return [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+    ]
+
+
+def create_engine(settings: DatabaseSettings) -> AsyncEngine:
+    """Create the async engine for `DATABASE_URI`, tuned for its backend.
+
+    SQLite connections get the `SQLITE_*` pragmas as they are opened. Other backends get a connection pool sized and
+    kept healthy by the `DB_POOL_*` settings.
+    """
+    url = make_url(settings.DATABASE_URI)
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(
+            url,
+            echo=settings.DB_ECHO,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+
+    engine = create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        # The driver's own lock wait, matching busy_timeout for the statements run before it is set
+        connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT / 1000},
+    )
+    pragmas = sqlite_pragmas(settings)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:  # type: ignore
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+async_engine = create_engine(settings)
+server_timing.instrument_engine(async_engine.sync_engine)
+metrics.instrument_engine(async_engine.sync_engine)
 
 # Create session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -27,10 +73,55 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+def add_missing_columns(connection: Connection) -> None:
+    """Add columns added to models after their table was created, which `create_all` skips.
+
+    Only nullable columns without a server default can be added this way, existing rows get `NULL`.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable or column.server_default is not None:
+                raise RuntimeError(f"Column {table.name}.{column.name} is missing and cannot be added automatically")
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+            foreign_keys = list(column.foreign_keys)
+            if len(foreign_keys) == 1:
+                target = foreign_keys[0].column
+                ddl += f" REFERENCES {target.table.name}({target.name})"
+            connection.execute(text(ddl))
+
+
+def create_missing_indexes(connection: Connection) -> None:
+    """Create indexes added to models after their table was created, which `create_all` skips.
+
+    Indexes on columns the table still lacks are left out, run `add_missing_columns` first.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if all(column.name in existing for column in index.columns):
+                index.create(connection, checkfirst=True)
+
+
+def create_schema(connection: Connection) -> None:
+    """Create the tables of the models, bringing those created by earlier versions up to date."""
+    Base.metadata.create_all(connection)
+    add_missing_columns(connection)
+    create_missing_indexes(connection)
+
+
 async def init_db() -> None:
     """Initialize database tables"""
     async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_schema)
 
 async def get_db() -> AsyncGenerator[AsyncSession, Any]:
     """
@@ -55,7 +146,7 @@ async def check_db_connected() -> bool:
     """Check if database is connected"""
     try:
         async with AsyncSessionLocal() as session:
-            await session.execute("SELECT 1")
+            await session.execute(text("SELECT 1"))
         return True
     except Exception as e:
         print(f"Database connection failed: {e}")
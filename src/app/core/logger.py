@@ -1,6 +1,17 @@
+import atexit
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any
+
+from .config import LogFormatOption, LoggingSettings, settings
 
 LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
 if not os.path.exists(LOG_DIR):
@@ -8,13 +19,142 @@ if not os.path.exists(LOG_DIR):
 
 LOG_FILE_PATH = os.path.join(LOG_DIR, "app.log")
 
-LOGGING_LEVEL = logging.INFO
-LOGGING_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOGGING_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Id of the request (or arq job) being handled, attached to every record logged while handling it, `-` outside of one
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every `LogRecord` has, anything else was passed in `extra` and is output as a field of its own
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the id of the current request to records, as `request_id`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records below WARNING of the configured loggers and their children.
+
+    Parameters
+    ----------
+    rates: dict[str, float]
+        Share of records kept, from 0 to 1, by logger name. The most specific configured name applies.
+    """
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+        self._resolved: dict[str, float] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            parent = name
+            while parent not in self.rates and "." in parent:
+                parent = parent.rsplit(".", 1)[0]
+            rate = self._resolved[name] = self.rates.get(parent, 1.0)
+        return rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to a writer thread through a bounded queue, dropping them when it is full.
+
+    Only the message and traceback are rendered in the calling thread; serializing and writing happen on the thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with the fields passed in `extra` alongside the standard ones."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(settings: LoggingSettings) -> NonBlockingQueueHandler:
+    """Route every record through a queue to a writer thread outputting to stderr and the rotating log file.
+
+    Logging from the event loop never waits on I/O: records are filtered and queued in the caller, and formatted and
+    written by the thread. Replaces the handlers of the root logger and sends uvicorn's records through it too.
+    """
+    formatter = JsonFormatter() if settings.LOG_FORMAT == LogFormatOption.JSON else logging.Formatter(LOGGING_FORMAT)
+    file_handler = RotatingFileHandler(
+        LOG_FILE_PATH, maxBytes=settings.LOG_FILE_MAX_BYTES, backupCount=settings.LOG_FILE_BACKUP_COUNT
+    )
+    stream_handler = logging.StreamHandler(sys.stderr)
+    for output in (file_handler, stream_handler):
+        output.setFormatter(formatter)
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    handler.addFilter(RequestIdFilter())
+    listener = QueueListener(handler.queue, stream_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    propagate("uvicorn", "uvicorn.error", "uvicorn.access")
+    return handler
+
 
-logging.basicConfig(level=LOGGING_LEVEL, format=LOGGING_FORMAT)
+def propagate(*names: str) -> None:
+    """Send the records of loggers that libraries gave handlers of their own through the root logger instead."""
+    for name in names:
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
 
-file_handler = RotatingFileHandler(LOG_FILE_PATH, maxBytes=10485760, backupCount=5)
-file_handler.setLevel(LOGGING_LEVEL)
-file_handler.setFormatter(logging.Formatter(LOGGING_FORMAT))
 
-logging.getLogger("").addHandler(file_handler)
+handler = setup_logging(settings)
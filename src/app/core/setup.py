@@ -1,21 +1,173 @@
-from collections.abc import AsyncIterator, Callable
+from collections.abc import AsyncIterator, Callable, Mapping
 from contextlib import _AsyncGeneratorContextManager, asynccontextmanager
 from typing import Any
 
 import anyio
 import fastapi
+from arq import create_pool
+from arq.connections import RedisSettings
 from fastapi import APIRouter, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
-from fastapi.staticfiles import StaticFiles
+from redis.exceptions import RedisError
+from starlette.types import ASGIApp
 
+from ..middleware.client_cache_middleware import ClientCacheMiddleware
+from ..middleware.metrics_middleware import MetricsMiddleware
 from .config import (
     AppSettings,
+    ClientRateLimitSettings,
+    ClientSideCacheSettings,
+    DatabaseSettings,
     EnvironmentOption,
     EnvironmentSettings,
+    FluxClientSettings,
+    FluxPollerSettings,
     FluxSettings,
+    ImageTransformSettings,
+    ImageVariantSettings,
+    ImageWriterSettings,
+    MetricsSettings,
+    RedisQueueSettings,
+    ResultCacheSettings,
 )
+from .db.database import check_db_connected, close_db_connections, init_db
+from .logger import handler as log_handler
+from .logger import logging
+from .utils import flux, image_store, metrics, poller, queue, rate_limit, result_cache, transforms, variants
+from .utils.http_cache import CachedStaticFiles
+from .utils.storage import LocalStorage, StorageRedirects, storage
+from .utils.storage_layout import ShardedStaticFiles
+
+logger = logging.getLogger(__name__)
+
+
+# -------------- database --------------
+async def create_tables() -> None:
+    await init_db()
+    if not await check_db_connected():
+        raise Exception("Database connection failed")
+
+
+# -------------- flux --------------
+async def create_flux_client(settings: FluxSettings | FluxClientSettings) -> None:
+    flux.client = flux.FluxClient(api_key=settings.FLUX_API_KEY, settings=settings)  # type: ignore
+
+
+async def close_flux_client() -> None:
+    if flux.client is not None:
+        await flux.client.aclose()
+        flux.client = None
+
+
+async def start_flux_poller(settings: FluxPollerSettings) -> None:
+    poller.poller = poller.FluxPoller(client=flux.get_flux_client(), settings=settings)
+    poller.poller.start()
+
+
+async def stop_flux_poller() -> None:
+    if poller.poller is not None:
+        await poller.poller.stop()
+        poller.poller = None
+
+
+# -------------- client rate limits --------------
+async def create_client_rate_limits(settings: ClientRateLimitSettings) -> None:
+    rate_limit.client_buckets = rate_limit.KeyedTokenBuckets(settings=settings)
+
+
+# -------------- result cache --------------
+async def create_result_cache(settings: ResultCacheSettings) -> None:
+    result_cache.cache = result_cache.ResultCache(directory=settings.RESULT_CACHE_DIR, settings=settings)
+    await anyio.to_thread.run_sync(result_cache.cache.load)
+
+
+# -------------- image variants --------------
+async def start_variant_pipeline(settings: ImageVariantSettings) -> None:
+    variants.pipeline = variants.VariantPipeline(settings=settings)
+    variants.pipeline.start()
+
+
+async def stop_variant_pipeline() -> None:
+    if variants.pipeline is not None:
+        await variants.pipeline.stop()
+        variants.pipeline = None
+
+
+# -------------- image transforms --------------
+async def start_image_transformer(settings: ImageTransformSettings) -> None:
+    directory = settings.IMAGE_TRANSFORM_CACHE_DIR
+    transforms.transformer = transforms.ImageTransformer(directory=directory, settings=settings)
+    await anyio.to_thread.run_sync(transforms.transformer.start)
+
+
+async def stop_image_transformer() -> None:
+    if transforms.transformer is not None:
+        transforms.transformer.stop()
+        transforms.transformer = None
+
+
+# -------------- image writer --------------
+async def start_image_writer(settings: ImageWriterSettings) -> None:
+    on_stored = variants.pipeline.submit if variants.pipeline is not None else None
+    image_store.writer = image_store.ImageWriter(settings=settings, on_stored=on_stored)
+    image_store.writer.start()
+
+
+async def stop_image_writer() -> None:
+    if image_store.writer is not None:
+        await image_store.writer.stop()
+        image_store.writer = None
+
+
+# -------------- queue --------------
+async def create_redis_queue_pool(settings: RedisQueueSettings) -> None:
+    try:
+        queue.pool = await create_pool(RedisSettings(host=settings.REDIS_QUEUE_HOST, port=settings.REDIS_QUEUE_PORT))
+    except (OSError, RedisError) as e:
+        # The API stays usable without Redis; only the async job endpoints depend on the queue
+        logger.warning(f"Could not connect to the Redis queue, async generation jobs are disabled: {e}")
+
+
+async def close_redis_queue_pool() -> None:
+    if queue.pool is not None:
+        await queue.pool.aclose()
+        queue.pool = None
+
+
+# -------------- metrics --------------
+def component_stats() -> dict[str, Mapping[str, float]]:
+    """Stats of the running components, exported as gauges when metrics are scraped."""
+    stats: dict[str, Mapping[str, float]] = {}
+    if flux.client is not None:
+        stats["flux_submit_limiter"] = flux.client.submit_limiter.stats()
+        stats["flux_poll_limiter"] = flux.client.poll_limiter.stats()
+        stats["flux_download_limiter"] = flux.client.download_limiter.stats()
+        stats["flux_breaker"] = flux.client.breaker.stats()
+    if rate_limit.client_buckets is not None:
+        stats["client_rate_limits"] = rate_limit.client_buckets.stats()
+    if result_cache.cache is not None:
+        stats["result_cache"] = result_cache.cache.stats()
+    if transforms.transformer is not None:
+        stats["image_transform_cache"] = transforms.transformer.stats()
+    if variants.pipeline is not None:
+        stats["image_variant_queue"] = variants.pipeline.stats()
+    if image_store.writer is not None:
+        stats["image_writer_queue"] = image_store.writer.stats()
+    stats["log_queue"] = log_handler.stats()
+    return stats
+
+
+async def start_loop_lag_monitor(settings: MetricsSettings) -> None:
+    metrics.loop_lag_monitor = metrics.LoopLagMonitor(interval=settings.METRICS_LOOP_LAG_INTERVAL)
+    metrics.loop_lag_monitor.start()
+
+
+async def stop_loop_lag_monitor() -> None:
+    if metrics.loop_lag_monitor is not None:
+        await metrics.loop_lag_monitor.stop()
+        metrics.loop_lag_monitor = None
 
 
 # -------------- application --------------
@@ -30,6 +182,12 @@ def lifespan_factory(
         AppSettings
         | EnvironmentSettings
         | FluxSettings
+        | FluxClientSettings
+        | FluxPollerSettings
+        | RedisQueueSettings
+        | ResultCacheSettings
+        | ImageWriterSettings
+        | DatabaseSettings
     ),
 ) -> Callable[[FastAPI], _AsyncGeneratorContextManager[Any]]:
     """Factory to create a lifespan async context manager for a FastAPI app."""
@@ -37,7 +195,64 @@ def lifespan_factory(
     @asynccontextmanager
     async def lifespan(app: FastAPI) -> AsyncIterator[Any]:
         await set_threadpool_tokens()
-        yield
+
+        try:
+            if isinstance(settings, DatabaseSettings):
+                await create_tables()
+
+            if isinstance(settings, FluxClientSettings):
+                await create_flux_client(settings)
+
+                if isinstance(settings, FluxPollerSettings):
+                    await start_flux_poller(settings)
+
+            if isinstance(settings, ClientRateLimitSettings):
+                await create_client_rate_limits(settings)
+
+            if isinstance(settings, ResultCacheSettings):
+                await create_result_cache(settings)
+
+            if isinstance(settings, ImageVariantSettings):
+                await start_variant_pipeline(settings)
+
+            if isinstance(settings, ImageTransformSettings):
+                await start_image_transformer(settings)
+
+            if isinstance(settings, ImageWriterSettings):
+                await start_image_writer(settings)
+
+            if isinstance(settings, RedisQueueSettings):
+                await create_redis_queue_pool(settings)
+
+            if isinstance(settings, MetricsSettings):
+                await start_loop_lag_monitor(settings)
+
+            yield
+
+        finally:
+            if isinstance(settings, MetricsSettings):
+                await stop_loop_lag_monitor()
+
+            if isinstance(settings, ImageWriterSettings):
+                await stop_image_writer()
+
+            if isinstance(settings, ImageVariantSettings):
+                await stop_variant_pipeline()
+
+            if isinstance(settings, ImageTransformSettings):
+                await stop_image_transformer()
+
+            if isinstance(settings, RedisQueueSettings):
+                await close_redis_queue_pool()
+
+            if isinstance(settings, FluxPollerSettings):
+                await stop_flux_poller()
+
+            if isinstance(settings, FluxClientSettings):
+                await close_flux_client()
+
+            if isinstance(settings, DatabaseSettings):
+                await close_db_connections()
 
     return lifespan
 
@@ -45,7 +260,7 @@ def lifespan_factory(
 # -------------- application --------------
 def create_application(
     router: APIRouter,
-    settings: AppSettings | EnvironmentSettings | FluxSettings,
+    settings: AppSettings | EnvironmentSettings | FluxSettings | FluxClientSettings,
     **kwargs: Any,
 ) -> FastAPI:
     """Creates and configures a FastAPI application based on the provided settings.
@@ -63,9 +278,18 @@ def create_application(
         It determines the configuration applied:
 
         - AppSettings: Configures basic app metadata like name, description, contact, and license info.
+        - FluxClientSettings: Opens the shared Flux API connection pools on startup and closes them on shutdown.
+        - FluxPollerSettings: Runs the background engine that polls `get_result` for all in-flight generations.
+        - ClientRateLimitSettings: Limits how many generations each client may start, see `client_identity`.
+        - ResultCacheSettings: Loads the memory and disk cache of seeded generation results.
+        - ImageWriterSettings: Runs the write-behind queue persisting generated images.
+        - ImageVariantSettings: Runs the process pool making resized variants of stored images.
+        - ImageTransformSettings: Indexes the disk cache of on-demand transforms and runs their process pool.
         - DatabaseSettings: Adds event handlers for initializing database tables during startup.
         - RedisCacheSettings: Sets up event handlers for creating and closing a Redis cache pool.
-        - ClientSideCacheSettings: Integrates middleware for client-side caching.
+        - MetricsSettings: Serves Prometheus metrics on `/metrics` and samples event loop lag.
+        - ClientSideCacheSettings: Defaults responses to `CLIENT_CACHE_DEFAULT` and serves uploads with strong ETags,
+          immutable for content-addressed files.
         - RedisQueueSettings: Sets up event handlers for creating and closing a Redis queue pool.
         - RedisRateLimiterSettings: Sets up event handlers for creating and closing a Redis rate limiter pool.
         - EnvironmentSettings: Conditionally sets documentation URLs and integrates custom routes for API documentation
@@ -113,10 +337,26 @@ def create_application(
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Image-Id", "X-Image-Url", "X-Cache", "X-Process-Time", "Server-Timing", "X-Request-ID"],
     )
     application.include_router(router)
 
-    application.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+    if isinstance(settings, ClientSideCacheSettings):
+        application.add_middleware(ClientCacheMiddleware, default=settings.CLIENT_CACHE_DEFAULT)
+    static_files: ASGIApp
+    if not isinstance(storage, LocalStorage):
+        # Clients are sent to the storage for the files, their bytes never pass through the application
+        static_files = StorageRedirects(storage)
+    elif isinstance(settings, ClientSideCacheSettings):
+        static_files = CachedStaticFiles(directory=settings.UPLOAD_DIR, settings=settings)
+    else:
+        static_files = ShardedStaticFiles(directory=settings.UPLOAD_DIR)
+    application.mount("/uploads", static_files, name="uploads")
+
+    if isinstance(settings, MetricsSettings):
+        application.add_middleware(MetricsMiddleware)
+        application.add_route("/metrics", metrics.metrics_endpoint, include_in_schema=False)
+        metrics.register_component_stats(component_stats)
 
 
     if isinstance(settings, EnvironmentSettings):
@@ -0,0 +1,155 @@
+import asyncio
+import os
+from collections import Counter
+from typing import Any
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.blob import Blob
+from . import metrics, server_timing
+from .image_store import image_file_path, image_url
+from .storage import storage
+from .storage_layout import blob_filename
+from .uploads import StreamedFile
+
+
+async def acquire_blob(db: AsyncSession, sha256: str) -> Blob | None:
+    """Take a reference on the blob with this hash, if it is already stored."""
+    result = await db.execute(
+        update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count + 1).returning(Blob)
+    )
+    return result.scalar_one_or_none()
+
+
+async def store_blob(db: AsyncSession, file: StreamedFile, ext: str) -> tuple[Blob, bool]:
+    """Take a reference on the blob holding the content of a streamed upload, storing it first if it is new.
+
+    See `store_blobs`, of which this is the single file case.
+    """
+    (result,) = await store_blobs(db, [(file, ext)])
+    return result
+
+
+async def store_blobs(
+    db: AsyncSession,
+    uploads: list[tuple[StreamedFile, str]],
+    concurrency: int = 1,
+) -> list[tuple[Blob, bool]]:
+    """Take a reference on the blobs holding the content of streamed uploads, storing new content first.
+
+    Content that is already stored only costs a reference count update, its temporary file is discarded without
+    writing anything else to disk. New content is moved into place, at most `concurrency` files at a time, and all
+    rows are written with a single upsert, so uploads of the same new content racing each other still end up with one
+    blob referenced by all of them.
+
+    The temporary files are consumed either way. Nothing is committed, the caller commits the references together
+    with the rows that hold them.
+
+    Parameters
+    ----------
+    uploads: list[tuple[StreamedFile, str]]
+        Each streamed file with the extension to store it under if its content is new.
+    concurrency: int
+        How many files are moved into place at the same time.
+
+    Returns
+    -------
+    list[tuple[Blob, bool]]
+        For each upload, in order, its blob and whether this upload stored it.
+    """
+    counts = Counter(file.sha256 for file, _ in uploads)
+    result = await db.execute(select(Blob.sha256).where(Blob.sha256.in_(counts)))
+    existing = set(result.scalars())
+
+    # The first upload of each new content is moved into place, every other temporary file is discarded
+    moved: dict[str, StreamedFile] = {}
+    values: dict[str, dict[str, Any]] = {}
+    discarded = []
+    for file, ext in uploads:
+        if file.sha256 in values:
+            discarded.append(file.tmp_path)
+            continue
+        if file.sha256 in existing:
+            discarded.append(file.tmp_path)
+        else:
+            moved[file.sha256] = file
+
+        filename = blob_filename(file.sha256, ext)
+        values[file.sha256] = {
+            "sha256": file.sha256,
+            "filename": filename,
+            "file_path": image_file_path(filename),
+            "url": image_url(filename),
+            "content_type": file.content_type,
+            "size": file.size,
+            "ref_count": counts[file.sha256],
+        }
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def move(file: StreamedFile) -> None:
+        async with semaphore:
+            with server_timing.phase("disk"), metrics.disk_write_seconds["blob"].time():
+                await asyncio.to_thread(
+                    storage.put_file, file.tmp_path, values[file.sha256]["filename"], file.content_type
+                )
+
+    await asyncio.gather(*(move(file) for file in moved.values()))
+    await asyncio.to_thread(_remove_files, discarded)
+
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(Blob).values(list(values.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={"ref_count": Blob.ref_count + statement.excluded.ref_count},
+    ).returning(Blob)
+    result = await db.execute(statement, execution_options={"populate_existing": True})
+    blobs = {blob.sha256: blob for blob in result.scalars()}
+
+    # A racing upload may have stored the same content under another extension first
+    superseded = [
+        values[sha256]["file_path"] for sha256 in moved if blobs[sha256].file_path != values[sha256]["file_path"]
+    ]
+    if superseded:
+        await asyncio.to_thread(_delete_stored, superseded)
+
+    return [
+        (blobs[file.sha256], moved.get(file.sha256) is file and blobs[file.sha256].file_path not in superseded)
+        for file, _ in uploads
+    ]
+
+
+async def release_blob(db: AsyncSession, sha256: str) -> str | None:
+    """Drop a reference on a blob, deleting its row when it was the last one.
+
+    Returns the path of the file to delete once the transaction is committed, if the blob is gone.
+    """
+    result = await db.execute(
+        update(Blob)
+        .where(Blob.sha256 == sha256)
+        .values(ref_count=Blob.ref_count - 1)
+        .returning(Blob.ref_count, Blob.file_path)
+    )
+    row = result.one_or_none()
+    if row is None or row.ref_count > 0:
+        return None
+
+    # Only delete the row if no upload took a new reference in the meantime
+    deleted = await db.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.ref_count <= 0))
+    return row.file_path if deleted.rowcount else None
+
+
+def _delete_stored(file_paths: list[str]) -> None:
+    for file_path in file_paths:
+        storage.delete(storage.filename(file_path))
+
+
+def _remove_files(file_paths: list[str]) -> None:
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
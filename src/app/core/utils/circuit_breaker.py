@@ -0,0 +1,116 @@
+import time
+from collections import deque
+from enum import StrEnum
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+# States as numbers that can be graphed, from healthy to failing
+STATE_VALUES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """A call was refused without being attempted because the circuit is open."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return f"Circuit open, retry after {self.retry_after:.0f}s"
+
+
+class CircuitBreaker:
+    """Fails calls to a dependency fast while its recent error rate is too high.
+
+    Outcomes of the calls made in the last `window` seconds are kept. Once at least `min_calls` were made and the share
+    of failures reaches `failure_rate`, the circuit opens and `check` refuses every call for `open_duration` seconds.
+    After that a single probe call is let through: its success closes the circuit again, its failure reopens it.
+
+    Parameters
+    ----------
+    failure_rate: float
+        Share of failed calls, between 0 and 1, at which the circuit opens.
+    min_calls: int
+        Calls needed in the window before the failure rate is acted on.
+    window: float
+        Seconds of history the failure rate is computed over.
+    open_duration: float
+        Seconds calls are refused once the circuit opened.
+    """
+
+    def __init__(self, failure_rate: float, min_calls: int, window: float, open_duration: float) -> None:
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_duration = open_duration
+
+        self.state = CircuitState.CLOSED
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.rejected = 0
+
+    def check(self) -> None:
+        """Raise `CircuitOpenError` if a call must not be attempted now."""
+        if self.state == CircuitState.CLOSED:
+            return
+
+        now = time.monotonic()
+        remaining = self._opened_at + self.open_duration - now
+        if self.state == CircuitState.OPEN and remaining <= 0:
+            self.state = CircuitState.HALF_OPEN
+            self._probing = False
+
+        # A probe that never reported back (e.g. it was cancelled) does not block the next one forever
+        probe_lost = now - self._probe_started > self.open_duration
+        if self.state == CircuitState.HALF_OPEN and (not self._probing or probe_lost):
+            self._probing = True
+            self._probe_started = now
+            return
+
+        self.rejected += 1
+        raise CircuitOpenError(max(remaining, 1.0))
+
+    def stats(self) -> dict[str, float]:
+        return {"state": STATE_VALUES[self.state], "rejected": self.rejected}
+
+    def record(self, success: bool) -> None:
+        now = time.monotonic()
+        if self.state == CircuitState.HALF_OPEN:
+            if success:
+                self._close()
+            else:
+                self._open(now)
+            return
+        if self.state == CircuitState.OPEN:
+            return
+
+        self._outcomes.append((now, success))
+        if not success:
+            self._failures += 1
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, expired_success = self._outcomes.popleft()
+            if not expired_success:
+                self._failures -= 1
+
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = CircuitState.OPEN
+        self._opened_at = now
+        self._probing = False
+
+    def _close(self) -> None:
+        self.state = CircuitState.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+        self._probing = False
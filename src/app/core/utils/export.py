@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import AsyncIterator, Iterable, Sequence
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Row, Select, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ...models.image import Image
+from ...schemas.image import ExportFormat
+
+# Rows fetched from the database per round trip, and encoded and sent per chunk
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MEDIA_TYPES = {ExportFormat.NDJSON: "application/x-ndjson", ExportFormat.CSV: "text/csv"}
+
+EXPORT_COLUMNS = tuple(column.name for column in Image.__table__.columns)
+
+
+def export_query(created_after: datetime | None = None, created_before: datetime | None = None) -> Select[Any]:
+    """Every image created in `[created_after, created_before)`, oldest first.
+
+    Ordered by `(created_at, id)` along their index, so exports are reproducible and an incremental export can start at
+    the `created_at` of the last row of the previous one.
+    """
+    query = select(*(Image.__table__.c[name] for name in EXPORT_COLUMNS))
+    if created_after is not None:
+        query = query.where(Image.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(Image.created_at < created_before)
+    return query.order_by(Image.created_at, Image.id)
+
+
+async def stream_rows(engine: AsyncEngine, query: Select[Any]) -> AsyncIterator[Sequence[Row[Any]]]:
+    """Batches of the rows of `query`, read through a server-side cursor.
+
+    Only one batch is held in memory at a time whatever the size of the result, and rows are plain tuples rather than
+    ORM objects, which would also be kept in the identity map of a session.
+    """
+    async with engine.connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+def _value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_ndjson(rows: Iterable[Row[Any]]) -> bytes:
+    return "".join(
+        json.dumps({name: _value(value) for name, value in zip(EXPORT_COLUMNS, row)}) + "\n" for row in rows
+    ).encode()
+
+
+def encode_csv(rows: Iterable[Row[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+def csv_header() -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_COLUMNS)
+    return buffer.getvalue().encode()
+
+
+async def export_chunks(
+    engine: AsyncEngine,
+    export_format: ExportFormat,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> AsyncIterator[bytes]:
+    """The images created in `[created_after, created_before)` encoded as NDJSON or CSV, one chunk per batch of rows."""
+    if export_format == ExportFormat.CSV:
+        encode = encode_csv
+        yield csv_header()
+    else:
+        encode = encode_ndjson
+    async for rows in stream_rows(engine, export_query(created_after, created_before)):
+        yield encode(rows)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a stream of chunks into one gzip member as they arrive."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
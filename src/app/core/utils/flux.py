@@ -0,0 +1,280 @@
+import asyncio
+import random
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import httpx
+
+from ...schemas.image import FluxModel, ImageGenerationRequest
+from ..config import FluxClientSettings
+from .circuit_breaker import CircuitBreaker
+from .rate_limit import TokenBucket
+
+# Upstream answers worth retrying, the request may succeed on another attempt
+RETRY_STATUSES = {502, 503, 504}
+
+# Failures that happen before the request was sent, so even a non-idempotent request can be retried safely
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class FluxRateLimited(Exception):
+    """The Flux API rejected a request with 429, asking us to wait `retry_after` seconds."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return f"Flux API rate limit exceeded, retry after {self.retry_after:.0f}s"
+
+
+class FluxClient:
+    """Long-lived HTTP client for the Flux API.
+
+    Control-plane traffic (submissions and `get_result` polls) and sample downloads use separate connection pools,
+    so a burst of multi-megabyte downloads can never starve polling of connections. Both pools keep connections
+    alive and negotiate HTTP/2 when enabled, which lets many in-flight generations share a handful of sockets.
+
+    Submissions, polls and downloads each take a token from their own bucket before every attempt, retries and hedged
+    downloads included, so we stay under the upstream rate limit instead of running into it. When upstream answers 429
+    anyway, the submission and poll buckets pause for its `Retry-After`.
+
+    Transient failures are retried with exponential backoff: polls and downloads on any transport error or 502/503/504,
+    submissions only when the request never left, so a task is never started twice. A sample download that gets no
+    response within `FLUX_HEDGE_DELAY` is raced by a second one. All calls go through a circuit breaker which, while
+    upstream is failing, refuses them with `CircuitOpenError` instead of letting them time out one by one.
+
+    Parameters
+    ----------
+    api_key: str
+        The key sent as `X-Key` on every control-plane request.
+    settings: FluxClientSettings
+        Pool sizes, timeouts and protocol options.
+    """
+
+    def __init__(self, api_key: str, settings: FluxClientSettings) -> None:
+        self.chunk_size = settings.FLUX_DOWNLOAD_CHUNK_SIZE
+        self.max_image_size = settings.FLUX_MAX_IMAGE_SIZE
+        self.rate_limit_timeout = settings.FLUX_RATE_LIMIT_TIMEOUT
+        self.default_retry_after = settings.FLUX_RETRY_AFTER
+        self.submit_limiter = TokenBucket(
+            settings.FLUX_SUBMIT_RATE, settings.FLUX_SUBMIT_BURST, settings.FLUX_RATE_LIMIT_QUEUE_SIZE
+        )
+        self.poll_limiter = TokenBucket(
+            settings.FLUX_POLL_RATE, settings.FLUX_POLL_BURST, settings.FLUX_RATE_LIMIT_QUEUE_SIZE
+        )
+        self.download_limiter = TokenBucket(
+            settings.FLUX_DOWNLOAD_RATE, settings.FLUX_DOWNLOAD_BURST, settings.FLUX_RATE_LIMIT_QUEUE_SIZE
+        )
+        self.retry_attempts = settings.FLUX_RETRY_ATTEMPTS
+        self.retry_backoff = settings.FLUX_RETRY_BACKOFF
+        self.retry_max_backoff = settings.FLUX_RETRY_MAX_BACKOFF
+        self.hedge_delay = settings.FLUX_HEDGE_DELAY
+        self.breaker = CircuitBreaker(
+            failure_rate=settings.FLUX_BREAKER_FAILURE_RATE,
+            min_calls=settings.FLUX_BREAKER_MIN_CALLS,
+            window=settings.FLUX_BREAKER_WINDOW,
+            open_duration=settings.FLUX_BREAKER_OPEN_DURATION,
+        )
+        self.api = httpx.AsyncClient(
+            base_url=settings.FLUX_API_BASE_URL,
+            headers={"X-Key": api_key},
+            http2=settings.FLUX_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.FLUX_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.FLUX_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.FLUX_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.FLUX_CONNECT_TIMEOUT,
+                read=settings.FLUX_READ_TIMEOUT,
+                write=settings.FLUX_WRITE_TIMEOUT,
+                pool=settings.FLUX_POOL_TIMEOUT,
+            ),
+        )
+        self.download = httpx.AsyncClient(
+            http2=settings.FLUX_HTTP2,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=settings.FLUX_DOWNLOAD_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.FLUX_DOWNLOAD_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.FLUX_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.FLUX_CONNECT_TIMEOUT,
+                read=settings.FLUX_DOWNLOAD_READ_TIMEOUT,
+                write=settings.FLUX_WRITE_TIMEOUT,
+                pool=settings.FLUX_POOL_TIMEOUT,
+            ),
+        )
+
+    async def submit(self, model: FluxModel, request: ImageGenerationRequest) -> dict[str, Any]:
+        """Start a generation task and return the raw response payload.
+
+        Raises
+        ------
+        RateLimitExceeded
+            If no submission token became available within `FLUX_RATE_LIMIT_TIMEOUT`.
+        FluxRateLimited
+            If upstream rejected the submission with 429.
+        CircuitOpenError
+            If upstream is considered down.
+        """
+        http_request = self.api.build_request("POST", f"/{model.value}", json=request.model_dump())
+        response = await self._send(
+            self.api, http_request, self.submit_limiter, self.rate_limit_timeout, idempotent=False
+        )
+        self._check_rate_limited(response)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        data: dict[str, Any] = response.json()
+        return data
+
+    async def get_result(self, task_id: str, timeout: float | None = None) -> dict[str, Any]:
+        """Fetch the current state of a generation task, waiting at most `timeout` seconds for each poll token."""
+        request = self.api.build_request("GET", "/get_result", params={"id": task_id})
+        response = await self._send(self.api, request, self.poll_limiter, timeout, idempotent=True)
+        self._check_rate_limited(response)
+        response.raise_for_status()
+        data: dict[str, Any] = response.json()
+        return data
+
+    def _check_rate_limited(self, response: httpx.Response) -> None:
+        if response.status_code != 429:
+            return
+
+        retry_after = parse_retry_after(response.headers.get("retry-after"), self.default_retry_after)
+        self.submit_limiter.pause(retry_after)
+        self.poll_limiter.pause(retry_after)
+        raise FluxRateLimited(retry_after)
+
+    async def stream_sample(self, url: str) -> httpx.Response:
+        """Open a generated sample for streaming; the caller must close the returned response.
+
+        If the download has no response after `FLUX_HEDGE_DELAY` seconds, a second one is started and whichever
+        responds first is used, the other is cancelled.
+        """
+        first = asyncio.create_task(self._open_sample(url))
+        if self.hedge_delay <= 0:
+            return await first
+
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        except BaseException:
+            await _discard([first])
+            raise
+        if done:
+            return first.result()
+
+        return await _first_response([first, asyncio.create_task(self._open_sample(url))])
+
+    async def _open_sample(self, url: str) -> httpx.Response:
+        request = self.download.build_request("GET", url)
+        return await self._send(
+            self.download, request, self.download_limiter, self.rate_limit_timeout, idempotent=True, stream=True
+        )
+
+    async def _send(
+        self,
+        client: httpx.AsyncClient,
+        request: httpx.Request,
+        limiter: TokenBucket,
+        timeout: float | None,
+        idempotent: bool,
+        stream: bool = False,
+    ) -> httpx.Response:
+        """Send a request through the circuit breaker, retrying transient failures.
+
+        Every attempt takes a token from `limiter`, waiting at most `timeout` seconds for it. Non-idempotent requests
+        are only retried when they failed before being sent. A retryable status that is still returned after the last
+        attempt is handed back to the caller like any other response.
+
+        Raises
+        ------
+        RateLimitExceeded
+            If no token became available within `timeout` for an attempt.
+        """
+        attempt = 0
+        while True:
+            await limiter.acquire(timeout)
+            self.breaker.check()
+            attempt += 1
+            try:
+                response = await client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                if attempt >= self.retry_attempts or not (idempotent or isinstance(e, NOT_SENT_ERRORS)):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record(True)
+                    return response
+                self.breaker.record(False)
+                if attempt >= self.retry_attempts or not idempotent:
+                    return response
+                await response.aclose()
+
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.retry_backoff * 2 ** (attempt - 1), self.retry_max_backoff)
+        return random.uniform(delay / 2, delay)
+
+    async def aclose(self) -> None:
+        await self.api.aclose()
+        await self.download.aclose()
+
+
+async def _first_response(tasks: list[asyncio.Task[httpx.Response]]) -> httpx.Response:
+    """Wait for the first of several equivalent requests to succeed, cancelling and closing the others."""
+    pending = set(tasks)
+    error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task.result()
+                    await _discard([t for t in tasks if t is not task])
+                    return winner
+                error = error or task.exception()
+    except BaseException:
+        await _discard(tasks)
+        raise
+
+    assert error is not None
+    raise error
+
+
+async def _discard(tasks: list[asyncio.Task[httpx.Response]]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is None:
+            await task.result().aclose()
+
+
+def parse_retry_after(value: str | None, default: float) -> float:
+    """Seconds to wait according to a `Retry-After` header, given either as seconds or as an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(UTC)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+client: FluxClient | None = None
+
+
+def get_flux_client() -> FluxClient:
+    """Dependency returning the application's shared `FluxClient`."""
+    if client is None:
+        raise RuntimeError("Flux client is not initialized")
+    return client
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+
+import httpx
+
+from ...schemas.image import FluxModel, ImageGenerationRequest, ImageGenerationResultStatus
+from ..config import BatchGenerationSettings
+from . import metrics, server_timing
+from .circuit_breaker import CircuitOpenError
+from .flux import FluxClient, FluxRateLimited
+from .poller import FluxPoller
+from .rate_limit import KeyedTokenBuckets, RateLimitExceeded
+
+# Terminal statuses other than READY and how they are reported to API clients
+STATUS_ERRORS: dict[str, tuple[int, str]] = {
+    ImageGenerationResultStatus.ERROR: (500, "Image generation failed"),
+    ImageGenerationResultStatus.TASK_NOT_FOUND: (404, "Task not found"),
+    ImageGenerationResultStatus.REQUEST_MODERATED: (400, "Request was moderated due to content policy"),
+    ImageGenerationResultStatus.CONTENT_MODERATED: (400, "Generated content was moderated due to content policy"),
+}
+
+
+class GenerationError(Exception):
+    """A generation that did not produce an image, with the HTTP status it maps to."""
+
+    def __init__(self, message: str, status_code: int = 500, retry_after: float | None = None) -> None:
+        # All values go to Exception.__init__ so the error survives pickling through the arq result backend
+        super().__init__(message, status_code, retry_after)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> dict[str, str]:
+        if self.retry_after is None:
+            return {}
+        return {"Retry-After": str(math.ceil(self.retry_after))}
+
+    def __str__(self) -> str:
+        return self.message
+
+
+async def wait_for_sample(
+    client: FluxClient,
+    poller: FluxPoller,
+    request: ImageGenerationRequest,
+    model: FluxModel,
+) -> str:
+    """Submit a generation, wait for it to finish and return the URL of the generated sample.
+
+    Raises
+    ------
+    GenerationError
+        If the task could not be started, timed out or finished without an image.
+    """
+    try:
+        with server_timing.phase("submit"), metrics.flux_submit_seconds[model].time():
+            generation_data = await client.submit(model, request)
+    except RateLimitExceeded:
+        raise GenerationError("Too many generations waiting for the Flux API, try again later", status_code=503)
+    except FluxRateLimited as e:
+        raise GenerationError("Flux API rate limit exceeded", status_code=503, retry_after=e.retry_after)
+    except CircuitOpenError as e:
+        raise GenerationError("Flux API is unavailable, try again later", status_code=503, retry_after=e.retry_after)
+    except httpx.TransportError as e:
+        raise GenerationError(f"Could not reach the Flux API: {e!r}", status_code=502)
+    except httpx.HTTPStatusError as e:
+        raise GenerationError(f"Flux API error: HTTP {e.response.status_code}", status_code=502)
+
+    task_id = generation_data.get("id")
+    if not task_id:
+        raise GenerationError(f"Failed to start image generation: {generation_data}")
+
+    try:
+        with server_timing.phase("poll"):
+            result_data = await poller.wait(task_id, model)
+    except TimeoutError:
+        raise GenerationError("Timeout waiting for image generation", status_code=408)
+
+    status = result_data.get("status")
+    if status == ImageGenerationResultStatus.READY:
+        sample: str = result_data["result"]["sample"]
+        return sample
+
+    status_code, message = STATUS_ERRORS.get(status, (500, f"Unexpected image generation status: {status}"))
+    raise GenerationError(message, status_code=status_code)
+
+
+async def take_client_token(client_limits: KeyedTokenBuckets, client_id: str) -> None:
+    """Count a generation against the rate limit of the client starting it.
+
+    Raises
+    ------
+    GenerationError
+        With status 429 if the client started too many generations lately.
+    """
+    try:
+        await client_limits.acquire(client_id)
+    except RateLimitExceeded:
+        raise GenerationError(
+            "Too many generations from this client, try again later",
+            status_code=429,
+            retry_after=1 / client_limits.rate,
+        )
+
+
+class GenerationLimits:
+    """Caps on the number of generations in flight, per model and overall.
+
+    A generation waits for a slot of its model before taking one of the global slots, so a model that is at its limit
+    never holds global slots other models could use.
+
+    Parameters
+    ----------
+    settings: BatchGenerationSettings
+        The global limit, the default per-model limit and per-model overrides.
+    """
+
+    def __init__(self, settings: BatchGenerationSettings) -> None:
+        self._global = asyncio.Semaphore(settings.BATCH_GENERATION_CONCURRENCY)
+        self._models = {
+            model: asyncio.Semaphore(
+                settings.BATCH_GENERATION_MODEL_LIMITS.get(model.value, settings.BATCH_GENERATION_MODEL_CONCURRENCY)
+            )
+            for model in FluxModel
+        }
+
+    @asynccontextmanager
+    async def slot(self, model: FluxModel) -> AsyncIterator[None]:
+        async with self._models[model], self._global:
+            yield
+
+
+def request_key(request: ImageGenerationRequest, model: FluxModel) -> str:
+    """Canonical hash of everything that determines the generated image."""
+    canonical = json.dumps({"model": model.value, **request.model_dump()}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def media_type_for(request: ImageGenerationRequest) -> str:
+    return f"image/{request.output_format}"
+
+
+async def open_sample(client: FluxClient, url: str, model: FluxModel) -> httpx.Response:
+    """Open a generated sample for streaming, rejecting it up front if it is larger than the configured cap.
+
+    The caller owns the returned response and must close it, `iter_sample` does so once the body is consumed.
+    """
+    try:
+        with server_timing.phase("download"), metrics.flux_download_seconds[model].time():
+            response = await client.stream_sample(url)
+    except RateLimitExceeded:
+        raise GenerationError("Too many downloads waiting for the Flux API, try again later", status_code=503)
+    except CircuitOpenError as e:
+        raise GenerationError("Flux API is unavailable, try again later", status_code=503, retry_after=e.retry_after)
+    except httpx.TransportError as e:
+        raise GenerationError(f"Failed to download generated image: {e!r}", status_code=502)
+
+    try:
+        if response.is_error:
+            raise GenerationError(f"Failed to download generated image: HTTP {response.status_code}", status_code=502)
+
+        content_length = response.headers.get("content-length")
+        if content_length is not None and int(content_length) > client.max_image_size:
+            raise GenerationError(
+                f"Generated image is {content_length} bytes, more than the {client.max_image_size} byte limit",
+                status_code=502,
+            )
+    except BaseException:
+        await response.aclose()
+        raise
+
+    return response
+
+
+async def iter_sample(client: FluxClient, response: httpx.Response) -> AsyncIterator[bytes]:
+    """Yield the body of an opened sample chunk by chunk and close it afterwards.
+
+    Chunks are only read from upstream when the consumer asks for the next one, so a slow client slows the upstream
+    read down instead of the body piling up in memory. Bodies without a trustworthy `Content-Length` are cut off at
+    the size cap.
+    """
+    size = 0
+    try:
+        async for chunk in response.aiter_bytes(client.chunk_size):
+            size += len(chunk)
+            if size > client.max_image_size:
+                raise GenerationError(
+                    f"Generated image exceeded the {client.max_image_size} byte limit", status_code=502
+                )
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def tee(
+    chunks: AsyncIterator[bytes],
+    max_size: int,
+    on_complete: Callable[[bytes], Awaitable[None]],
+) -> AsyncIterator[bytes]:
+    """Pass `chunks` through unchanged and hand the full body to `on_complete` once it was streamed completely.
+
+    Bodies larger than `max_size` are streamed but not collected.
+    """
+    buffer: list[bytes] | None = []
+    size = 0
+    async for chunk in chunks:
+        if buffer is not None:
+            size += len(chunk)
+            if size <= max_size:
+                buffer.append(chunk)
+            else:
+                buffer = None
+        yield chunk
+
+    if buffer is not None:
+        await on_complete(b"".join(buffer))
+
+
+def passthrough_headers(response: httpx.Response) -> dict[str, str]:
+    """Headers of an upstream sample that can be forwarded as-is to our client."""
+    headers = {}
+    # httpx decodes compressed bodies, so the upstream length only holds for identity-encoded samples
+    if "content-length" in response.headers and "content-encoding" not in response.headers:
+        headers["Content-Length"] = response.headers["content-length"]
+    return headers
+
+
+async def download_sample(client: FluxClient, url: str, model: FluxModel, file_path: str) -> tuple[str | None, int]:
+    """Stream a generated sample to `file_path`, returning its upstream content type and size."""
+    size = 0
+    response = await open_sample(client, url, model)
+    with open(file_path, "wb") as buffer:
+        async for chunk in iter_sample(client, response):
+            await asyncio.to_thread(buffer.write, chunk)
+            size += len(chunk)
+    return response.headers.get("content-type"), size
+
+
+def remove_file(file_path: str) -> None:
+    if os.path.exists(file_path):
+        os.remove(file_path)
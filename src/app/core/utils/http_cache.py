@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+from ..config import ClientSideCacheSettings
+from .storage_layout import BLOB_DIR, SHARD_PATTERN, VARIANT_DIR, ShardedStaticFiles
+
+# Paths under UPLOAD_DIR that name their content: blobs by their own hash, variants by the hash of their source. Flat
+# paths of files not moved into shards yet still match.
+_BLOB_PATH = re.compile(rf"^{BLOB_DIR}/({SHARD_PATTERN}/)?(?P<sha256>[0-9a-f]{{64}})\.\w+$")
+_CONTENT_ADDRESSED_PATH = re.compile(
+    rf"^({BLOB_DIR}/({SHARD_PATTERN}/)?[0-9a-f]{{64}}\.\w+|{VARIANT_DIR}/({SHARD_PATTERN}/)?[0-9a-f]{{64}}/[^/]+)$"
+)
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+_MAX_ETAGS = 10_000
+# Content hashes of files not named by them, by path, modification time and size
+_etags: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+
+
+def revalidated_policy(max_age: int) -> str:
+    return f"public, max-age={max_age}"
+
+
+def immutable_policy(max_age: int) -> str:
+    return f"public, max-age={max_age}, immutable"
+
+
+def is_not_modified(request_headers: Headers, etag: str, last_modified: str | None = None) -> bool:
+    """Whether a conditional request can be answered with `304 Not Modified`.
+
+    `If-None-Match` takes precedence over `If-Modified-Since`, which is only looked at when the former is absent.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_etag(path: str, stat_result: os.stat_result | None = None) -> str:
+    """Strong ETag of a file from the hash of its content, computed once per version of the file."""
+    if stat_result is None:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+    etag = _etags.get(key)
+    if etag is None:
+        etag = f'"{await asyncio.to_thread(_hash_file, path)}"'
+        _etags[key] = etag
+        if len(_etags) > _MAX_ETAGS:
+            _etags.popitem(last=False)
+    else:
+        _etags.move_to_end(key)
+    return etag
+
+
+class ContentFileResponse(FileResponse):
+    """`FileResponse` whose `If-Range` check also accepts the ETag it was given, not only one from mtime and size."""
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:  # type: ignore[override]
+        return http_if_range == self.headers.get("etag") or super()._should_use_range(http_if_range, stat_result)
+
+
+def conditional_file_response(
+    request: Request,
+    path: str,
+    media_type: str | None,
+    etag: str,
+    cache_control: str,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """Serve a file with the given validator and caching policy, or `304` when the client's copy is current.
+
+    Range requests are served by the returned `FileResponse`.
+    """
+    if is_not_modified(request.headers, etag):
+        return not_modified_response(etag, cache_control, headers)
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": cache_control}
+    return ContentFileResponse(path, media_type=media_type, headers=headers)
+
+
+def not_modified_response(etag: str, cache_control: str, headers: dict[str, str] | None = None) -> Response:
+    return NotModifiedResponse(MutableHeaders({**(headers or {}), "ETag": etag, "Cache-Control": cache_control}))
+
+
+class CachedStaticFiles(ShardedStaticFiles):
+    """`StaticFiles` for the upload directory with strong validators and a caching policy per kind of file.
+
+    Files whose path names their content (blobs and the variants of blobs) get `Cache-Control: immutable` with a
+    long max-age; other files may be replaced under the same URL and get a short max-age instead. Every file carries a
+    strong ETag derived from its content, the hash in its name for blobs, so revalidations made after a file was
+    rewritten with identical bytes still get `304 Not Modified`.
+
+    Parameters
+    ----------
+    directory: str
+        The upload directory.
+    settings: ClientSideCacheSettings
+        Max-age of content-addressed and of other files.
+    """
+
+    def __init__(self, *, directory: str, settings: ClientSideCacheSettings, **kwargs) -> None:
+        super().__init__(directory=directory, **kwargs)
+        self.revalidated = revalidated_policy(settings.CLIENT_CACHE_MAX_AGE)
+        self.immutable = immutable_policy(settings.CLIENT_CACHE_IMMUTABLE_MAX_AGE)
+
+    def file_response(
+        self,
+        full_path: str | os.PathLike[str],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        # Conditional requests are answered in `get_response`, once the content ETag is known
+        return ContentFileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, ContentFileResponse) or response.stat_result is None:
+            return response
+
+        path = path.replace(os.sep, "/")
+        blob = _BLOB_PATH.match(path)
+        if blob is not None:
+            etag = f'"{blob["sha256"]}"'
+        else:
+            etag = await file_etag(str(response.path), response.stat_result)
+        response.headers["etag"] = etag
+        response.headers["cache-control"] = self.immutable if _CONTENT_ADDRESSED_PATH.match(path) else self.revalidated
+
+        if is_not_modified(Headers(scope=scope), etag, response.headers.get("last-modified")):
+            return NotModifiedResponse(response.headers)
+        return response
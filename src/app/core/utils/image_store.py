@@ -0,0 +1,147 @@
+import asyncio
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.image import Image
+from ..config import ImageWriterSettings, settings
+from ..db.database import AsyncSessionLocal
+from ..logger import logging
+from . import metrics
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"image/jpeg": "jpeg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+
+
+@dataclass
+class PendingImage:
+    id: str
+    filename: str
+    content_type: str
+    content: bytes
+
+
+def extension_for(content_type: str) -> str:
+    return EXTENSIONS.get(content_type.split(";")[0].strip(), "bin")
+
+
+def image_file_path(filename: str) -> str:
+    """Location of a stored file, as recorded by its rows."""
+    return storage.location(filename)
+
+
+def image_url(filename: str) -> str:
+    return f"{settings.BASE_URL}/uploads/{filename}"
+
+
+async def record_image(
+    db: AsyncSession,
+    image_id: str,
+    filename: str,
+    content_type: str,
+    original_filename: str | None = None,
+) -> Image:
+    """Insert the `Image` row for a file already in the storage, or return the existing one.
+
+    Inserted in one statement that does nothing when the row exists, so concurrent writers of the same image don't
+    fail on the primary key.
+    """
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(Image).values(
+        id=image_id,
+        filename=filename,
+        original_filename=original_filename,
+        file_path=image_file_path(filename),
+        url=image_url(filename),
+        content_type=content_type,
+    )
+    await db.execute(statement.on_conflict_do_nothing(index_elements=[Image.id]))
+    await db.commit()
+    return (await db.execute(select(Image).where(Image.id == image_id))).scalar_one()
+
+
+class ImageWriter:
+    """Write-behind persistence of generated images.
+
+    Handlers hand finished images to `submit`, which never blocks: images are queued and written to the storage and
+    the `Image` table by background workers. When the bounded queue is full the image is dropped and logged rather
+    than delaying the response.
+
+    Parameters
+    ----------
+    settings: ImageWriterSettings
+        Queue size and number of concurrent writers.
+    on_stored: Callable[[str, str, str], object] | None
+        Called with the image id, file path and id again once an image is stored, e.g. to make its variants.
+    """
+
+    def __init__(
+        self, settings: ImageWriterSettings, on_stored: Callable[[str, str, str], object] | None = None
+    ) -> None:
+        self.on_stored = on_stored
+        self._queue: asyncio.Queue[PendingImage] = asyncio.Queue(maxsize=settings.IMAGE_WRITER_QUEUE_SIZE)
+        self._concurrency = settings.IMAGE_WRITER_CONCURRENCY
+        self._workers: list[asyncio.Task[None]] = []
+        self.dropped = 0
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._run(), name=f"image-writer-{i}") for i in range(self._concurrency)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush queued images, waiting at most `timeout` seconds, then stop the workers."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"Image writer stopped with {self._queue.qsize()} images still queued")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped}
+
+    def submit(self, image: PendingImage) -> bool:
+        try:
+            self._queue.put_nowait(image)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Image writer queue is full, not persisting generated image {image.id}")
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            image = await self._queue.get()
+            try:
+                await self.persist(image)
+            except Exception as e:
+                logger.error(f"Error persisting generated image {image.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def persist(self, image: PendingImage) -> None:
+        if not await asyncio.to_thread(storage.exists, image.filename):
+            with metrics.disk_write_seconds["image"].time():
+                await asyncio.to_thread(storage.put_bytes, image.filename, image.content, image.content_type)
+        async with AsyncSessionLocal() as db:
+            await record_image(db, image.id, image.filename, image.content_type)
+        if self.on_stored is not None:
+            self.on_stored(image.id, image_file_path(image.filename), image.id)
+
+
+writer: ImageWriter | None = None
+
+
+def get_image_writer() -> ImageWriter:
+    """Dependency returning the application's shared `ImageWriter`."""
+    if writer is None:
+        raise RuntimeError("Image writer is not initialized")
+    return writer
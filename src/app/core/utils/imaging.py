@@ -0,0 +1,131 @@
+# Image decoding and encoding, run in worker processes. Nothing here imports the rest of the application, so worker
+# processes start without loading settings, the database engine or the API.
+
+import os
+from uuid import uuid4
+
+from PIL import Image, ImageOps, features
+
+# Variant formats: Pillow format name, media type and whether the format can store an alpha channel
+FORMATS: dict[str, tuple[str, str, bool]] = {
+    "webp": ("WEBP", "image/webp", True),
+    "avif": ("AVIF", "image/avif", True),
+    "jpeg": ("JPEG", "image/jpeg", False),
+    "png": ("PNG", "image/png", True),
+}
+
+_FEATURES = {"webp": "webp", "avif": "avif"}
+
+
+def supported_formats() -> set[str]:
+    """Variant formats the installed Pillow can encode."""
+    return {fmt for fmt in FORMATS if fmt not in _FEATURES or features.check(_FEATURES[fmt])}
+
+
+def render_variants(source_path: str, specs: list[tuple[str, int, str, str]], quality: int) -> list[dict]:
+    """Write resized, re-encoded copies of an image.
+
+    The source is decoded once. JPEG sources are decoded straight at a reduced scale when the largest variant allows
+    it, and each variant is resized from the previous, larger one rather than from the full-size original. Variants
+    whose file already exists (shared content rendered before) are not rendered again, only measured.
+
+    Parameters
+    ----------
+    source_path: str
+        The stored original.
+    specs: list[tuple[str, int, str, str]]
+        For each variant its name, longest side in pixels, format (a key of `FORMATS`) and target path.
+    quality: int
+        Encoder quality for lossy formats.
+
+    Returns
+    -------
+    list[dict]
+        For each variant its name, media type, width, height and size in bytes.
+    """
+    results = []
+    missing = []
+    for name, size, fmt, path in specs:
+        if os.path.exists(path):
+            with Image.open(path) as existing:
+                results.append(_describe(name, fmt, path, existing.size))
+        else:
+            missing.append((name, size, fmt, path))
+    if not missing:
+        return results
+
+    largest = max(size for _, size, _, _ in missing)
+    with Image.open(source_path) as source:
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+
+        current = image
+        for name, size, fmt, path in sorted(missing, key=lambda spec: spec[1], reverse=True):
+            if max(current.size) > size:
+                current = current.copy()
+                current.thumbnail((size, size), Image.Resampling.LANCZOS)
+            _save(current, fmt, path, quality)
+            results.append(_describe(name, fmt, path, current.size))
+
+    return results
+
+
+def transform_image(
+    source_path: str,
+    target_path: str,
+    width: int | None,
+    height: int | None,
+    cover: bool,
+    fmt: str,
+    quality: int,
+) -> tuple[int, int]:
+    """Resize an image to fit (or with `cover`, fill and crop to) a box and encode it, returning its final size.
+
+    Either side of the box may be left out to scale by the other one. Images are never enlarged to fit a box.
+    """
+    with Image.open(source_path) as source:
+        if width or height:
+            source.draft("RGB", (width or height or 0, height or width or 0))
+        image = ImageOps.exif_transpose(source)
+
+        if cover and width and height:
+            # A box larger than the image is scaled down to it, so the crop keeps the box's aspect ratio
+            factor = min(1.0, image.width / width, image.height / height)
+            box = (max(1, round(width * factor)), max(1, round(height * factor)))
+            image = ImageOps.fit(image, box, Image.Resampling.LANCZOS)
+        elif width or height:
+            image.thumbnail((width or image.width, height or image.height), Image.Resampling.LANCZOS)
+
+        _save(image, fmt, target_path, quality)
+        return image.size
+
+
+def _save(image: Image.Image, fmt: str, path: str, quality: int) -> None:
+    pil_format, _, alpha = FORMATS[fmt]
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    mode = "RGBA" if alpha and has_alpha else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique to this writer, so processes rendering the same file don't interleave
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    try:
+        image.save(tmp_path, format=pil_format, quality=quality)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _describe(name: str, fmt: str, path: str, size: tuple[int, int]) -> dict:
+    return {
+        "name": name,
+        "content_type": FORMATS[fmt][1],
+        "width": size[0],
+        "height": size[1],
+        "size": os.path.getsize(path),
+    }
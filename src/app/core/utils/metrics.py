@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections.abc import Callable, Iterator, Mapping
+
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ...schemas.image import FluxModel, ImageGenerationResultStatus
+
+# Metrics are recorded through children bound to their labels once, here, so hot paths only index a dict and never
+# go through `labels()`. Label values are limited to the members of these enums and tuples.
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DISK_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = tuple(float(1024 * 4**i) for i in range(10))  # 1 KiB to 256 MiB
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Outcomes of generations: the terminal statuses of `get_result`, and giving up at the poll deadline
+GENERATION_OUTCOMES = tuple(status.value for status in ImageGenerationResultStatus) + ("Timeout",)
+DISK_WRITES = ("upload", "blob", "image")
+UPLOADS = ("single", "bulk")
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+_FLUX_SUBMIT = Histogram(
+    "flux_submit_seconds",
+    "Duration of Flux submissions, rate limit waits and retries included",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+_FLUX_POLL = Histogram(
+    "flux_poll_seconds",
+    "Duration of Flux get_result polls, rate limit waits included",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+_FLUX_DOWNLOAD = Histogram(
+    "flux_download_seconds",
+    "Time until a generated sample starts arriving, hedged requests included",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+_FLUX_POLLS_PER_GENERATION = Histogram(
+    "flux_polls_per_generation",
+    "get_result polls made for a generation until it finished",
+    ["model"],
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64),
+)
+_FLUX_GENERATIONS = Counter("flux_generations", "Generations by model and final status", ["model", "status"])
+
+flux_submit_seconds = {model: _FLUX_SUBMIT.labels(model.value) for model in FluxModel}
+flux_poll_seconds = {model: _FLUX_POLL.labels(model.value) for model in FluxModel}
+flux_download_seconds = {model: _FLUX_DOWNLOAD.labels(model.value) for model in FluxModel}
+flux_polls_per_generation = {model: _FLUX_POLLS_PER_GENERATION.labels(model.value) for model in FluxModel}
+flux_generations = {
+    (model, outcome): _FLUX_GENERATIONS.labels(model.value, outcome)
+    for model in FluxModel
+    for outcome in GENERATION_OUTCOMES
+}
+
+_UPLOAD_SECONDS = Histogram("upload_seconds", "Duration of upload requests", ["kind"], buckets=LATENCY_BUCKETS)
+upload_seconds = {kind: _UPLOAD_SECONDS.labels(kind) for kind in UPLOADS}
+upload_file_bytes = Histogram("upload_file_bytes", "Size of uploaded files", buckets=SIZE_BUCKETS)
+
+_DISK_WRITE = Histogram("disk_write_seconds", "Duration of disk writes by kind", ["kind"], buckets=DISK_BUCKETS)
+disk_write_seconds = {kind: _DISK_WRITE.labels(kind) for kind in DISK_WRITES}
+
+db_query_seconds = Histogram("db_query_seconds", "Duration of database statements", buckets=DB_BUCKETS)
+db_connection_seconds = Histogram(
+    "db_connection_seconds", "Time database connections are checked out of the pool", buckets=DB_BUCKETS
+)
+
+http_requests_in_progress = Gauge("http_requests_in_progress", "HTTP requests being handled")
+http_request_seconds = Histogram(
+    "http_request_seconds", "Time until the response of an HTTP request starts", buckets=LATENCY_BUCKETS
+)
+_HTTP_RESPONSES = Counter("http_responses", "HTTP responses by status class", ["status"])
+http_responses = [_HTTP_RESPONSES.labels(status_class) for status_class in STATUS_CLASSES]
+
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke up a sleeping task", buckets=LOOP_LAG_BUCKETS
+)
+
+
+class ComponentStatsCollector(Collector):
+    """Exposes the counters components already keep (`stats()` of limiters, caches, queues) as gauges.
+
+    Values are read when metrics are scraped, so components pay nothing extra while serving. Each component's stats
+    become gauges named `{component}_{stat}`.
+
+    Parameters
+    ----------
+    source: Callable[[], dict[str, Mapping[str, float]]]
+        Returns the stats of every running component, by component name.
+    """
+
+    def __init__(self, source: Callable[[], dict[str, Mapping[str, float]]]) -> None:
+        self.source = source
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for component, stats in self.source().items():
+            for name, value in stats.items():
+                yield GaugeMetricFamily(f"{component}_{name}", f"{name} of {component}", value=value)
+
+
+_component_stats: ComponentStatsCollector | None = None
+
+
+def register_component_stats(source: Callable[[], dict[str, Mapping[str, float]]]) -> None:
+    global _component_stats
+    if _component_stats is not None:
+        REGISTRY.unregister(_component_stats)
+    _component_stats = ComponentStatsCollector(source)
+    REGISTRY.register(_component_stats)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record the duration of statements run on `engine` and how long its connections are held."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore
+        db_query_seconds.observe(time.perf_counter() - context._metrics_started)
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy) -> None:  # type: ignore
+        connection_record.info["metrics_checked_out"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record) -> None:  # type: ignore
+        checked_out = connection_record.info.pop("metrics_checked_out", None)
+        if checked_out is not None:
+            db_connection_seconds.observe(time.perf_counter() - checked_out)
+
+
+class LoopLagMonitor:
+    """Measures event loop lag: how much later than asked a task sleeping `interval` seconds gets to run again.
+
+    Lag means callbacks are queued behind something blocking the loop or the loop is saturated; every request
+    handled in the meantime is delayed by as much.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="event-loop-lag")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            event_loop_lag_seconds.observe(max(0.0, loop.time() - started - self.interval))
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+loop_lag_monitor: LoopLagMonitor | None = None
@@ -0,0 +1,26 @@
+import base64
+import binascii
+from datetime import UTC, datetime
+
+from fastapi import HTTPException
+
+
+def encode_cursor(created_at: datetime, id: str) -> str:
+    """Opaque cursor pointing just past a row of a listing ordered by `(created_at, id)`."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def as_naive_utc(value: datetime | None) -> datetime | None:
+    """Timestamps are stored as naive UTC, so aware filter values are converted before comparing."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
@@ -0,0 +1,229 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+from ...schemas.image import FluxModel, ImageGenerationResultStatus
+from ..config import FluxPollerSettings
+from ..logger import logging
+from . import metrics
+from .circuit_breaker import CircuitOpenError
+from .flux import FluxClient, FluxRateLimited
+from .rate_limit import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# Weight given to the newest observation when updating a model's expected generation time
+EWMA_ALPHA = 0.2
+
+
+@dataclass
+class _PendingTask:
+    task_id: str
+    model: FluxModel
+    future: asyncio.Future[dict[str, Any]]
+    registered_at: float
+    deadline: float
+    next_poll_at: float
+    attempts: int = field(default=0)
+    # Whether a poll of the task is in flight, it is not due again until that one returns
+    polling: bool = field(default=False)
+
+
+class FluxPoller:
+    """Single background engine polling `get_result` for every in-flight generation.
+
+    Handlers register a task id with `wait` and await a future; one loop polls every task that is due, resolves the
+    futures of tasks that reached a terminal status and reschedules the rest. The first poll for a task is delayed
+    until close to the model's expected completion time, learned from previous completions, and later polls back
+    off exponentially with jitter so that many tasks submitted together don't poll in lockstep. Each poll runs in a
+    task of its own, so a slow `get_result` never delays the deadlines or polls of other tasks.
+
+    Parameters
+    ----------
+    client: FluxClient
+        The client used for `get_result` calls.
+    settings: FluxPollerSettings
+        Poll intervals, concurrency and per-model deadlines.
+    """
+
+    def __init__(self, client: FluxClient, settings: FluxPollerSettings) -> None:
+        self.client = client
+        self.settings = settings
+        self._pending: dict[str, _PendingTask] = {}
+        self._expected: dict[FluxModel, float] = {}
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(settings.FLUX_POLL_CONCURRENCY)
+        self._task: asyncio.Task[None] | None = None
+        self._polls: set[asyncio.Task[None]] = set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="flux-poller")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for poll in self._polls:
+            poll.cancel()
+        await asyncio.gather(*self._polls, return_exceptions=True)
+        self._polls.clear()
+
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Flux poller stopped"))
+        self._pending.clear()
+
+    def deadline_for(self, model: FluxModel) -> float:
+        return self.settings.FLUX_POLL_DEADLINES.get(model.value, self.settings.FLUX_POLL_DEADLINE)
+
+    def expected_duration(self, model: FluxModel) -> float:
+        return self._expected.get(model, self.settings.FLUX_POLL_EXPECTED_DURATION)
+
+    async def wait(self, task_id: str, model: FluxModel) -> dict[str, Any]:
+        """Wait for a task to leave the `Pending` state and return its last `get_result` payload.
+
+        Raises
+        ------
+        TimeoutError
+            If the task is still pending after the model's deadline.
+        """
+        if task_id in self._pending:
+            return await asyncio.shield(self._pending[task_id].future)
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        first_delay = max(self.settings.FLUX_POLL_MIN_INTERVAL, self.expected_duration(model) * 0.6)
+        pending = _PendingTask(
+            task_id=task_id,
+            model=model,
+            future=loop.create_future(),
+            registered_at=now,
+            deadline=now + self.deadline_for(model),
+            next_poll_at=now + self._jitter(first_delay),
+        )
+        self._pending[task_id] = pending
+        self._wakeup.set()
+
+        try:
+            return await pending.future
+        finally:
+            self._pending.pop(task_id, None)
+
+    def _jitter(self, delay: float) -> float:
+        spread = delay * self.settings.FLUX_POLL_JITTER
+        return delay + random.uniform(-spread, spread)
+
+    def _next_interval(self, attempts: int) -> float:
+        interval = self.settings.FLUX_POLL_MIN_INTERVAL * self.settings.FLUX_POLL_BACKOFF ** (attempts - 1)
+        return self._jitter(min(interval, self.settings.FLUX_POLL_MAX_INTERVAL))
+
+    def _observe(self, pending: _PendingTask, now: float) -> None:
+        elapsed = now - pending.registered_at
+        previous = self.expected_duration(pending.model)
+        self._expected[pending.model] = (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * elapsed
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+
+            due = []
+            for pending in list(self._pending.values()):
+                if pending.future.done():
+                    continue
+                if pending.deadline <= now:
+                    metrics.flux_generations[pending.model, "Timeout"].inc()
+                    pending.future.set_exception(
+                        TimeoutError(f"Task {pending.task_id} still pending after {now - pending.registered_at:.1f}s")
+                    )
+                elif pending.next_poll_at <= now and not pending.polling:
+                    due.append(pending)
+
+            for pending in due:
+                self._start_poll(pending)
+
+            upcoming = [
+                p.deadline if p.polling else min(p.next_poll_at, p.deadline)
+                for p in self._pending.values()
+                if not p.future.done()
+            ]
+            timeout = max(0.0, min(upcoming) - loop.time()) if upcoming else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except TimeoutError:
+                pass
+
+    def _start_poll(self, pending: _PendingTask) -> None:
+        pending.polling = True
+        poll = asyncio.create_task(self._poll(pending), name=f"flux-poll-{pending.task_id}")
+        self._polls.add(poll)
+
+        def done(poll: asyncio.Task[None]) -> None:
+            self._polls.discard(poll)
+            pending.polling = False
+            # The task was rescheduled, or resolved
+            self._wakeup.set()
+
+        poll.add_done_callback(done)
+
+    async def _poll(self, pending: _PendingTask) -> None:
+        async with self._semaphore:
+            try:
+                # No point waiting for a poll token past the task's deadline
+                timeout = max(0.0, pending.deadline - asyncio.get_running_loop().time())
+                with metrics.flux_poll_seconds[pending.model].time():
+                    result = await self.client.get_result(pending.task_id, timeout=timeout)
+            except FluxRateLimited as e:
+                pending.next_poll_at = asyncio.get_running_loop().time() + e.retry_after
+                return
+            except CircuitOpenError as e:
+                pending.next_poll_at = asyncio.get_running_loop().time() + e.retry_after
+                return
+            except (RateLimitExceeded, httpx.TransportError, httpx.HTTPStatusError) as e:
+                # The task keeps running upstream and is billed, so keep polling it until its deadline
+                logger.warning(f"Poll of task {pending.task_id} failed, retrying: {e!r}")
+                pending.next_poll_at = asyncio.get_running_loop().time() + self._next_interval(pending.attempts + 1)
+                return
+            except Exception as e:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+                return
+
+        if pending.future.done():
+            return
+
+        pending.attempts += 1
+        now = asyncio.get_running_loop().time()
+        status = result.get("status")
+        if status == ImageGenerationResultStatus.PENDING:
+            pending.next_poll_at = now + self._next_interval(pending.attempts)
+            logger.debug(f"Task {pending.task_id} pending after {pending.attempts} polls")
+            return
+
+        if status == ImageGenerationResultStatus.READY:
+            self._observe(pending, now)
+        metrics.flux_polls_per_generation[pending.model].observe(pending.attempts)
+        outcome = metrics.flux_generations.get((pending.model, status))
+        if outcome is not None:
+            outcome.inc()
+        pending.future.set_result(result)
+
+
+poller: FluxPoller | None = None
+
+
+def get_flux_poller() -> FluxPoller:
+    """Dependency returning the application's shared `FluxPoller`."""
+    if poller is None:
+        raise RuntimeError("Flux poller is not initialized")
+    return poller
@@ -0,0 +1,11 @@
+from arq.connections import ArqRedis
+from fastapi import HTTPException
+
+pool: ArqRedis | None = None
+
+
+def get_queue_pool() -> ArqRedis:
+    """Return the shared arq pool, failing with 503 when the queue is unavailable."""
+    if pool is None:
+        raise HTTPException(status_code=503, detail="Job queue is unavailable")
+    return pool
@@ -0,0 +1,221 @@
+import asyncio
+from collections import OrderedDict, deque
+
+from ..config import ClientRateLimitSettings
+
+
+class RateLimitExceeded(Exception):
+    """A token could not be had: the wait queue is full or the caller's deadline passed while queued."""
+
+
+class TokenBucket:
+    """Token bucket rate limiter with a first-come, first-served queue of waiting callers.
+
+    Tokens accrue at `rate` per second up to `burst`. A caller that finds no token waits in a FIFO queue, which a
+    single timer drains as tokens accrue, so callers are served in arrival order and nobody polls for tokens. `pause`
+    stops accrual for a while and empties the bucket, for when upstream asks us to back off with `Retry-After`.
+
+    Parameters
+    ----------
+    rate: float
+        Tokens added per second.
+    burst: int
+        Maximum number of tokens the bucket holds.
+    max_queue: int
+        Maximum number of waiting callers, beyond which `acquire` fails immediately.
+    """
+
+    def __init__(self, rate: float, burst: int, max_queue: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+
+        self._tokens = float(burst)
+        self._updated: float | None = None
+        self._paused_until = 0.0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._timer: asyncio.TimerHandle | None = None
+
+        self.acquired = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queued": len(self._waiters),
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_time,
+            "wait_seconds_max": self.max_wait_time,
+        }
+
+    async def acquire(self, timeout: float | None = None) -> float:
+        """Take a token, waiting at most `timeout` seconds for one, and return how long the caller waited.
+
+        Raises
+        ------
+        RateLimitExceeded
+            If the queue is full, or no token became available within `timeout`.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if not self._waiters and self._take(started):
+            self.acquired += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Rate limiter queue is full ({self.max_queue} waiting)")
+
+        future: asyncio.Future[None] = loop.create_future()
+        self._waiters.append(future)
+        self._schedule()
+        try:
+            async with asyncio.timeout(timeout):
+                await future
+        except TimeoutError:
+            self._abandon(future)
+            self.timeouts += 1
+            raise RateLimitExceeded(f"No rate limit token within {timeout:.1f}s")
+        except BaseException:
+            self._abandon(future)
+            raise
+
+        waited = loop.time() - started
+        self.acquired += 1
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds`, restarting from an empty bucket afterwards."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._refill(now)
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, now + seconds)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _refill(self, now: float) -> None:
+        if self._updated is not None:
+            since = max(self._updated, self._paused_until)
+            if now > since:
+                self._tokens = min(float(self.burst), self._tokens + (now - since) * self.rate)
+        self._updated = now
+
+    def _take(self, now: float) -> bool:
+        self._refill(now)
+        if now < self._paused_until or self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _abandon(self, future: asyncio.Future[None]) -> None:
+        if future.done() and not future.cancelled():
+            # The token was granted just as the caller gave up, hand it back
+            self._tokens = min(float(self.burst), self._tokens + 1)
+        else:
+            future.cancel()
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._timer is not None or not self._waiters:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._refill(now)
+        delay = max(0.0, self._paused_until - now) + max(0.0, 1 - self._tokens) / self.rate
+        self._timer = loop.call_later(delay, self._dispatch)
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        now = asyncio.get_running_loop().time()
+        while self._waiters:
+            if self._waiters[0].done():
+                self._waiters.popleft()
+                continue
+            if not self._take(now):
+                break
+            self._waiters.popleft().set_result(None)
+        self._schedule()
+
+
+class KeyedTokenBuckets:
+    """One `TokenBucket` per key, e.g. per client, so a busy key cannot use up the tokens of the others.
+
+    Buckets are made on first use and kept in least recently used order. Making room for a new one beyond `max_keys`
+    drops the least recently used idle bucket, or the least recently used one if all are busy, so memory stays bounded
+    however many keys show up. A key whose bucket was dropped starts again from a full one; callers already waiting on
+    a dropped bucket are still served by it.
+
+    Parameters
+    ----------
+    settings: ClientRateLimitSettings
+        Rate, burst and queue size of each bucket, and the number of buckets kept.
+    """
+
+    def __init__(self, settings: ClientRateLimitSettings) -> None:
+        self.rate = settings.CLIENT_RATE_LIMIT_RATE
+        self.burst = settings.CLIENT_RATE_LIMIT_BURST
+        self.max_queue = settings.CLIENT_RATE_LIMIT_QUEUE_SIZE
+        self.timeout = settings.CLIENT_RATE_LIMIT_TIMEOUT
+        self.max_keys = settings.CLIENT_RATE_LIMIT_MAX_CLIENTS
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.evicted = 0
+
+    def stats(self) -> dict[str, float]:
+        buckets = list(self._buckets.values())
+        return {
+            "keys": len(buckets),
+            "evicted": self.evicted,
+            "queued": sum(len(bucket._waiters) for bucket in buckets),
+            "rejected": sum(bucket.rejected for bucket in buckets),
+            "timeouts": sum(bucket.timeouts for bucket in buckets),
+        }
+
+    def bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            return bucket
+
+        while self._buckets and len(self._buckets) >= self.max_keys:
+            self._evict()
+        bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, self.max_queue)
+        return bucket
+
+    async def acquire(self, key: str) -> float:
+        """Take a token from the bucket of `key`, waiting at most `CLIENT_RATE_LIMIT_TIMEOUT` seconds.
+
+        Raises
+        ------
+        RateLimitExceeded
+            If the queue of the bucket is full, or no token became available in time.
+        """
+        return await self.bucket(key).acquire(self.timeout)
+
+    def _evict(self) -> None:
+        # Buckets with callers waiting on them go last, their key would start again from a full bucket
+        key = next((key for key, bucket in self._buckets.items() if not bucket._waiters), next(iter(self._buckets)))
+        del self._buckets[key]
+        self.evicted += 1
+
+
+client_buckets: KeyedTokenBuckets | None = None
+
+
+def get_client_buckets() -> KeyedTokenBuckets:
+    """Dependency returning the application's per-client generation rate limits."""
+    if client_buckets is None:
+        raise RuntimeError("Client rate limits are not initialized")
+    return client_buckets
@@ -0,0 +1,203 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from uuid import uuid4
+
+from ..config import ResultCacheSettings
+from ..logger import logging
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"image/jpeg": "jpeg", "image/png": "png"}
+
+
+@dataclass
+class CachedImage:
+    content: bytes
+    media_type: str
+    created_at: float
+
+
+@dataclass
+class _DiskEntry:
+    path: str
+    media_type: str
+    size: int
+    created_at: float
+
+
+class ResultCache:
+    """Content-addressed cache of generated images with a memory tier in front of a disk tier.
+
+    Both tiers are LRU and bounded by total bytes. Entries expire `RESULT_CACHE_TTL` seconds after they were stored.
+    A disk hit is promoted to memory. Disk I/O runs in worker threads so the event loop never blocks on it.
+
+    Parameters
+    ----------
+    directory: str
+        Where disk entries are stored, one `{key}.{ext}` file per entry.
+    settings: ResultCacheSettings
+        Tier sizes and TTL.
+    """
+
+    def __init__(self, directory: str, settings: ResultCacheSettings) -> None:
+        self.directory = directory
+        self.memory_size = settings.RESULT_CACHE_MEMORY_SIZE
+        self.disk_size = settings.RESULT_CACHE_DISK_SIZE
+        self.max_entry_size = settings.RESULT_CACHE_MAX_ENTRY_SIZE
+        self.ttl = settings.RESULT_CACHE_TTL
+
+        self._memory: OrderedDict[str, CachedImage] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, _DiskEntry] = OrderedDict()
+        self._disk_bytes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self) -> None:
+        """Index entries already on disk, oldest first so they are the first to be evicted."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for dir_entry in os.scandir(self.directory):
+            key, _, ext = dir_entry.name.partition(".")
+            media_type = next((mt for mt, e in EXTENSIONS.items() if e == ext), None)
+            if media_type is None or not dir_entry.is_file():
+                continue
+            stat = dir_entry.stat()
+            entries.append((key, _DiskEntry(dir_entry.path, media_type, stat.st_size, stat.st_mtime)))
+
+        for key, entry in sorted(entries, key=lambda item: item[1].created_at):
+            self._disk[key] = entry
+            self._disk_bytes += entry.size
+        _remove_files(self._evict_disk())
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def _expired(self, created_at: float) -> bool:
+        return created_at + self.ttl < time.time()
+
+    async def get(self, key: str) -> CachedImage | None:
+        image = self._memory.get(key)
+        if image is not None:
+            if not self._expired(image.created_at):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return image
+            self._drop_memory(key)
+
+        entry = self._disk.get(key)
+        if entry is not None and self._expired(entry.created_at):
+            await asyncio.to_thread(_remove_files, [self._drop_disk(key)])
+        elif entry is not None:
+            try:
+                content = await asyncio.to_thread(_read_file, entry.path)
+            except OSError:
+                if self._disk.get(key) is entry:
+                    self._drop_disk(key)
+            else:
+                if self._disk.get(key) is entry:
+                    self._disk.move_to_end(key)
+                self.disk_hits += 1
+                image = CachedImage(content, entry.media_type, entry.created_at)
+                self._put_memory(key, image)
+                return image
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, content: bytes, media_type: str) -> None:
+        if len(content) > self.max_entry_size or media_type not in EXTENSIONS:
+            return
+
+        image = CachedImage(content, media_type, time.time())
+        self._put_memory(key, image)
+
+        path = os.path.join(self.directory, f"{key}.{EXTENSIONS[media_type]}")
+        try:
+            await asyncio.to_thread(_write_file, path, content)
+        except OSError as e:
+            logger.warning(f"Could not write result cache entry {key}: {e}")
+            return
+
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key).size
+        self._disk[key] = _DiskEntry(path, media_type, len(content), image.created_at)
+        self._disk_bytes += len(content)
+        evicted = self._evict_disk()
+        if evicted:
+            await asyncio.to_thread(_remove_files, evicted)
+
+    def _put_memory(self, key: str, image: CachedImage) -> None:
+        if key in self._memory:
+            self._drop_memory(key)
+        self._memory[key] = image
+        self._memory_bytes += len(image.content)
+        while self._memory_bytes > self.memory_size:
+            self._drop_memory(next(iter(self._memory)))
+            self.evictions += 1
+
+    def _drop_memory(self, key: str) -> None:
+        self._memory_bytes -= len(self._memory.pop(key).content)
+
+    def _evict_disk(self) -> list[str]:
+        """Drop least recently used disk entries until the tier fits its budget, returning the files to delete."""
+        evicted = []
+        while self._disk_bytes > self.disk_size:
+            evicted.append(self._drop_disk(next(iter(self._disk))))
+            self.evictions += 1
+        return evicted
+
+    def _drop_disk(self, key: str) -> str:
+        entry = self._disk.pop(key)
+        self._disk_bytes -= entry.size
+        return entry.path
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _remove_files(paths: list[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _write_file(path: str, content: bytes) -> None:
+    # Unique to this writer, so concurrent writes of the same entry don't interleave
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove_files([tmp_path])
+        raise
+
+
+cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    """Dependency returning the application's shared `ResultCache`."""
+    if cache is None:
+        raise RuntimeError("Result cache is not initialized")
+    return cache
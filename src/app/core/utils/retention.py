@@ -0,0 +1,254 @@
+import asyncio
+import itertools
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.blob import Blob
+from ...models.image import Image
+from ...models.image_variant import ImageVariant
+from ..config import GarbageCollectionSettings
+from ..db.database import AsyncSessionLocal
+from ..logger import logging
+from .blob_store import release_blob
+from .storage import StoredFile, storage
+from .variants import remove_variants
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeletedImage:
+    # Location of the file to delete once the transaction is committed, `None` while other images share it
+    file_path: str | None
+    # Names the directory holding the variants, deleted along with the file
+    source_key: str
+
+
+async def delete_image_record(db: AsyncSession, image_id: str) -> DeletedImage | None:
+    """Delete the rows of an image and its variants, releasing its blob, or return `None` if there is no such image.
+
+    Files are left in place, for the caller to remove with `remove_image_files` once the transaction is committed.
+    """
+    await db.execute(delete(ImageVariant).where(ImageVariant.image_id == image_id))
+    result = await db.execute(delete(Image).where(Image.id == image_id).returning(Image.file_path, Image.blob_sha256))
+    row = result.one_or_none()
+    if row is None:
+        return None
+    file_path = await release_blob(db, row.blob_sha256) if row.blob_sha256 is not None else row.file_path
+    return DeletedImage(file_path=file_path, source_key=row.blob_sha256 or image_id)
+
+
+def remove_image_files(deleted: DeletedImage) -> None:
+    if deleted.file_path is not None:
+        storage.delete(storage.filename(deleted.file_path))
+        remove_variants(deleted.source_key)
+
+
+@dataclass
+class GarbageReport:
+    missing_images: int = 0  # Image rows deleted because their file was gone
+    missing_variants: int = 0  # Variant rows deleted because their file or their image was gone
+    orphan_files: int = 0  # Files deleted because no row pointed at them
+    expired_images: int = 0  # Images deleted for being older than GC_RETENTION_DAYS
+    evicted_images: int = 0  # Images deleted to bring the storage under GC_MAX_TOTAL_BYTES
+    reclaimed_bytes: int = 0
+    stored_bytes: int = 0  # Bytes left in the storage, as of the scan for orphan files
+
+
+class GarbageCollector:
+    """Reconciles the storage with the database and enforces the retention policies.
+
+    A run deletes, in order, rows whose file is gone, images past their retention, files no row points at, and the
+    oldest images while the storage holds more than its limit. Everything is done in batches of `GC_BATCH_SIZE`
+    separated by a pause of `GC_BATCH_PAUSE`, with at most `GC_IO_CONCURRENCY` storage calls at a time, so a run
+    never holds much in memory nor takes the disk or the database away from requests for long.
+
+    Files and rows younger than `GC_GRACE_PERIOD` are left alone: uploads store their file before recording its row
+    and variants are rendered after their source is recorded, so one may briefly exist without the other.
+
+    Parameters
+    ----------
+    settings: GarbageCollectionSettings
+        Retention policies, grace period, batch size, pause and concurrency.
+    """
+
+    def __init__(self, settings: GarbageCollectionSettings) -> None:
+        self.retention_days = settings.GC_RETENTION_DAYS
+        self.max_total_bytes = settings.GC_MAX_TOTAL_BYTES
+        self.grace_period = settings.GC_GRACE_PERIOD
+        self.batch_size = settings.GC_BATCH_SIZE
+        self.batch_pause = settings.GC_BATCH_PAUSE
+        self._io_slots = asyncio.Semaphore(settings.GC_IO_CONCURRENCY)
+
+    async def run(self) -> GarbageReport:
+        report = GarbageReport()
+        started = time.perf_counter()
+        await self.remove_missing_images(report)
+        await self.remove_missing_variants(report)
+        if self.retention_days > 0:
+            await self.expire_images(report)
+        await self.remove_orphan_files(report)
+        if self.max_total_bytes > 0:
+            await self.evict_images(report)
+        logger.info(f"Garbage collection done in {time.perf_counter() - started:.1f}s: {report}")
+        return report
+
+    async def remove_missing_images(self, report: GarbageReport) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_period)
+        last = None
+        while True:
+            query = (
+                select(Image.id, Image.file_path, Image.created_at)
+                .where(Image.created_at < cutoff, Image.file_path.is_not(None))
+                .order_by(Image.created_at, Image.id)
+                .limit(self.batch_size)
+            )
+            if last is not None:
+                query = query.where(tuple_(Image.created_at, Image.id) > tuple_(*last))
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(query)).all()
+            if not rows:
+                return
+            last = (rows[-1].created_at, rows[-1].id)
+
+            found = await self._map(storage.exists, [storage.filename(row.file_path) for row in rows])
+            missing = [row.id for row, exists in zip(rows, found) if not exists]
+            if missing:
+                logger.warning(f"Deleting {len(missing)} images whose file is gone")
+                report.reclaimed_bytes += await self._delete_images(missing)
+                report.missing_images += len(missing)
+            await self._pause()
+
+    async def remove_missing_variants(self, report: GarbageReport) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_period)
+        last_id = 0
+        while True:
+            # Variants rendered while their image was being deleted outlive it
+            query = (
+                select(ImageVariant.id, ImageVariant.file_path, Image.id.is_(None).label("orphaned"))
+                .outerjoin(Image, Image.id == ImageVariant.image_id)
+                .where(ImageVariant.id > last_id, ImageVariant.created_at < cutoff, ImageVariant.file_path.is_not(None))
+                .order_by(ImageVariant.id)
+                .limit(self.batch_size)
+            )
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(query)).all()
+                if not rows:
+                    return
+                last_id = rows[-1].id
+
+                found = await self._map(storage.exists, [storage.filename(row.file_path) for row in rows])
+                missing = [row.id for row, exists in zip(rows, found) if row.orphaned or not exists]
+                if missing:
+                    await db.execute(delete(ImageVariant).where(ImageVariant.id.in_(missing)))
+                    await db.commit()
+                    report.missing_variants += len(missing)
+            await self._pause()
+
+    async def expire_images(self, report: GarbageReport) -> None:
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Image.id)
+                    .where(Image.created_at < cutoff)
+                    .order_by(Image.created_at, Image.id)
+                    .limit(self.batch_size)
+                )
+                expired = list(result.scalars())
+            if not expired:
+                return
+            report.reclaimed_bytes += await self._delete_images(expired)
+            report.expired_images += len(expired)
+            await self._pause()
+
+    async def remove_orphan_files(self, report: GarbageReport) -> None:
+        cutoff = time.time() - self.grace_period
+        files = storage.iter_files()
+        while True:
+            batch = await asyncio.to_thread(_take, files, self.batch_size)
+            if not batch:
+                return
+            by_location = {storage.location(file.filename): file for file in batch}
+            referenced = await self._referenced(list(by_location))
+
+            orphans = []
+            for location, file in by_location.items():
+                if location in referenced or file.modified >= cutoff:
+                    report.stored_bytes += file.size
+                else:
+                    orphans.append(file)
+            if orphans:
+                await self._map(storage.delete, [file.filename for file in orphans])
+                report.orphan_files += len(orphans)
+                report.reclaimed_bytes += sum(file.size for file in orphans)
+            await self._pause()
+
+    async def evict_images(self, report: GarbageReport) -> None:
+        while report.stored_bytes > self.max_total_bytes:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Image.id).order_by(Image.created_at, Image.id).limit(self.batch_size))
+                oldest = list(result.scalars())
+            if not oldest:
+                return
+            # One at a time, as how much deleting an image frees is only known once its blob is released
+            for image_id in oldest:
+                reclaimed = await self._delete_images([image_id])
+                report.reclaimed_bytes += reclaimed
+                report.stored_bytes -= reclaimed
+                report.evicted_images += 1
+                if report.stored_bytes <= self.max_total_bytes:
+                    return
+            await self._pause()
+
+    async def _delete_images(self, image_ids: list[str]) -> int:
+        """Delete images and the files no other image shares, returning how many bytes were freed."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ImageVariant.image_id, func.coalesce(func.sum(ImageVariant.size), 0))
+                .where(ImageVariant.image_id.in_(image_ids))
+                .group_by(ImageVariant.image_id)
+            )
+            variant_bytes = dict(result.tuples().all())
+            deleted: dict[str, DeletedImage] = {}
+            filenames = []
+            for image_id in image_ids:
+                record = await delete_image_record(db, image_id)
+                if record is not None and record.file_path is not None:
+                    deleted[image_id] = record
+                    filenames.append(storage.filename(record.file_path))
+            await db.commit()
+
+        sizes = await self._map(storage.size, filenames)
+        await self._map(remove_image_files, list(deleted.values()))
+        return sum(size or 0 for size in sizes) + sum(variant_bytes.get(image_id, 0) for image_id in deleted)
+
+    async def _referenced(self, locations: list[str]) -> set[str]:
+        """Which of `locations` a row points at."""
+        referenced: set[str] = set()
+        async with AsyncSessionLocal() as db:
+            for column in (Image.file_path, Blob.file_path, ImageVariant.file_path):
+                result = await db.execute(select(column).where(column.in_(locations)).distinct())
+                referenced.update(result.scalars())
+        return referenced
+
+    async def _map(self, function: Callable[[Any], Any], args: list[Any]) -> list[Any]:
+        async def call(arg: Any) -> Any:
+            async with self._io_slots:
+                return await asyncio.to_thread(function, arg)
+
+        return await asyncio.gather(*(call(arg) for arg in args))
+
+    async def _pause(self) -> None:
+        if self.batch_pause > 0:
+            await asyncio.sleep(self.batch_pause)
+
+
+def _take(files: Iterator[StoredFile], count: int) -> list[StoredFile]:
+    return list(itertools.islice(files, count))
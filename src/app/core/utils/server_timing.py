@@ -0,0 +1,96 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Phases reported in the `Server-Timing` header, in this order, with their descriptions
+PHASES: dict[str, str] = {
+    "validation": "Request parsing and validation",
+    "submit": "Upstream submit",
+    "poll": "Poll wait",
+    "download": "Image download",
+    "db": "Database",
+    "disk": "Disk write",
+}
+
+
+class ServerTiming:
+    """Time spent in each phase of one request, summed over every time the phase was entered.
+
+    Phases that ran concurrently (e.g. the files of a bulk upload) are summed too, so their total can exceed the time
+    the request took.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.durations: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self) -> str:
+        """The `Server-Timing` header value, durations in milliseconds, closed by the total time so far."""
+        metrics = [
+            f'{name};dur={self.durations[name] * 1000:.1f};desc="{description}"'
+            for name, description in PHASES.items()
+            if name in self.durations
+        ]
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_current: ContextVar[ServerTiming | None] = ContextVar("server_timing", default=None)
+
+
+def activate(timing: ServerTiming) -> Token[ServerTiming | None]:
+    """Make `timing` collect the phases of the current request, until the token is reset."""
+    return _current.set(timing)
+
+
+def deactivate(token: Token[ServerTiming | None]) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Add the time spent in the block to phase `name` of the current request, if it is being timed.
+
+    Tasks started from a request inherit its timing; outside of a request (background tasks, the arq worker) this does
+    nothing.
+    """
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def handler_started() -> None:
+    """Record the time from the start of the request until now as its validation phase, called first in handlers."""
+    timing = _current.get()
+    if timing is not None:
+        timing.add("validation", timing.elapsed())
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Add the time spent executing statements on `engine` to the db phase of the request issuing them."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore
+        context._server_timing_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:  # type: ignore
+        timing = _current.get()
+        if timing is not None:
+            timing.add("db", time.perf_counter() - context._server_timing_started)
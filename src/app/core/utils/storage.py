@@ -0,0 +1,347 @@
+import asyncio
+import os
+import shutil
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any
+from uuid import uuid4
+
+from starlette.responses import PlainTextResponse, RedirectResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from ..config import ObjectStorageSettings, StorageBackendOption, settings
+from .uploads import UPLOAD_TMP_DIR
+
+
+@dataclass
+class StoredFile:
+    filename: str
+    size: int
+    modified: float  # When the file was last written or moved, in seconds since the epoch
+
+
+class StorageBackend(ABC):
+    """Where stored files (originals, blobs and variants) live.
+
+    Files are named by their path relative to the root of the storage, e.g. `blobs/ab/cd/abcd....png`. Rows record
+    the `location` of their file, which backends map back to the name. Methods block on I/O and are meant to be run
+    in a worker thread.
+    """
+
+    @abstractmethod
+    def location(self, filename: str) -> str:
+        """What rows record as the `file_path` of a stored file."""
+
+    @abstractmethod
+    def filename(self, location: str) -> str:
+        """The name of the file at a `location`."""
+
+    @abstractmethod
+    def exists(self, filename: str) -> bool: ...
+
+    @abstractmethod
+    def size(self, filename: str) -> int | None:
+        """The size in bytes of a stored file, or `None` if there is none."""
+
+    @abstractmethod
+    def iter_files(self) -> Iterator[StoredFile]:
+        """Every stored file, lazily.
+
+        Files and directories starting with a dot, such as `.gitkeep` or per-node caches, are left out.
+        """
+
+    @abstractmethod
+    def staging_path(self, filename: str) -> str:
+        """A local path to write a file to before handing it to `put_file` under `filename`."""
+
+    @abstractmethod
+    def put_file(self, source_path: str, filename: str, content_type: str | None) -> None:
+        """Store a local file under `filename`, consuming it."""
+
+    @abstractmethod
+    def put_bytes(self, filename: str, content: bytes, content_type: str | None) -> None: ...
+
+    @abstractmethod
+    def delete(self, filename: str) -> None:
+        """Delete a stored file, if it exists."""
+
+    @abstractmethod
+    def delete_directory(self, directory: str) -> None:
+        """Delete every stored file under `directory`."""
+
+    @abstractmethod
+    def fetch(self, filename: str) -> str:
+        """A local path holding the content of a stored file, raising `FileNotFoundError` if there is none."""
+
+    def discard(self, path: str) -> None:
+        """Release a path returned by `fetch`."""
+
+    def redirect(self, filename: str, headers: dict[str, str] | None = None) -> Response | None:
+        """A redirect for clients to read the file from the storage directly, or `None` if the application serves it."""
+        return None
+
+    @asynccontextmanager
+    async def local_copy(self, filename: str) -> AsyncIterator[str]:
+        """A local path holding the content of a stored file for the duration of the block."""
+        path = await asyncio.to_thread(self.fetch, filename)
+        try:
+            yield path
+        finally:
+            await asyncio.to_thread(self.discard, path)
+
+
+class LocalStorage(StorageBackend):
+    """Files stored under a directory of the local filesystem, `UPLOAD_DIR`."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def location(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def filename(self, location: str) -> str:
+        return os.path.relpath(location, self.directory).replace(os.sep, "/")
+
+    def exists(self, filename: str) -> bool:
+        return os.path.exists(self.location(filename))
+
+    def size(self, filename: str) -> int | None:
+        try:
+            return os.path.getsize(self.location(filename))
+        except FileNotFoundError:
+            return None
+
+    def iter_files(self) -> Iterator[StoredFile]:
+        for directory, directories, filenames in os.walk(self.directory):
+            directories[:] = [name for name in directories if not name.startswith(".")]
+            for name in filenames:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # Linking a file changes its ctime but not its mtime, a file just linked into place is new here too
+                yield StoredFile(self.filename(path), stat.st_size, max(stat.st_mtime, stat.st_ctime))
+
+    def staging_path(self, filename: str) -> str:
+        # Written in place, so `put_file` has nothing left to do
+        path = self.location(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def put_file(self, source_path: str, filename: str, content_type: str | None) -> None:
+        path = self.location(filename)
+        if source_path != path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(source_path, path)
+
+    def put_bytes(self, filename: str, content: bytes, content_type: str | None) -> None:
+        """Write a file atomically, so readers never see a partial one."""
+        path = self.location(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique to this writer, so concurrent writes of the same file don't interleave
+        tmp_path = f"{path}.{uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as buffer:
+                buffer.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def delete(self, filename: str) -> None:
+        try:
+            os.remove(self.location(filename))
+        except FileNotFoundError:
+            pass
+
+    def delete_directory(self, directory: str) -> None:
+        shutil.rmtree(self.location(directory), ignore_errors=True)
+
+    def fetch(self, filename: str) -> str:
+        path = self.location(filename)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+
+class S3Storage(StorageBackend):
+    """Files stored as objects of an S3-compatible bucket, shared by every node of the application.
+
+    Files are uploaded in parts of `S3_PART_SIZE`, at most `S3_UPLOAD_CONCURRENCY` at a time, so an upload never
+    holds more than that many parts in memory whatever the size of the file. Reads are redirected to pre-signed URLs,
+    so image bytes go from the bucket to clients without passing through the application.
+
+    Parameters
+    ----------
+    settings: ObjectStorageSettings
+        Bucket, key prefix, endpoint, credentials, part size and lifetime of pre-signed URLs.
+    directory: str
+        Local directory holding files while they are written before an upload or read after a download.
+    """
+
+    def __init__(self, settings: ObjectStorageSettings, directory: str) -> None:
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ModuleNotFoundError as e:
+            raise RuntimeError("The S3 storage backend requires boto3, install the s3 extra") from e
+        if not settings.S3_BUCKET:
+            raise RuntimeError("S3_BUCKET must be set to use the S3 storage backend")
+
+        self.directory = directory
+        self.bucket = settings.S3_BUCKET
+        self.prefix = settings.S3_PREFIX
+        self.presigned_url_ttl = settings.S3_PRESIGNED_URL_TTL
+        # boto3 clients are thread-safe, one is shared by every worker thread
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            config=Config(max_pool_connections=max(10, 4 * settings.S3_UPLOAD_CONCURRENCY)),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_PART_SIZE,
+            multipart_chunksize=settings.S3_PART_SIZE,
+            max_concurrency=settings.S3_UPLOAD_CONCURRENCY,
+            max_io_queue=settings.S3_UPLOAD_CONCURRENCY,
+        )
+
+    def key(self, filename: str) -> str:
+        return f"{self.prefix}{filename}"
+
+    def location(self, filename: str) -> str:
+        return f"s3://{self.bucket}/{self.key(filename)}"
+
+    def filename(self, location: str) -> str:
+        return location.removeprefix(f"s3://{self.bucket}/").removeprefix(self.prefix)
+
+    def exists(self, filename: str) -> bool:
+        return self.size(filename) is not None
+
+    def size(self, filename: str) -> int | None:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.key(filename))
+        except self.client.exceptions.ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return response["ContentLength"]
+
+    def iter_files(self) -> Iterator[StoredFile]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                filename = item["Key"].removeprefix(self.prefix)
+                if not any(part.startswith(".") for part in filename.split("/")):
+                    yield StoredFile(filename, item["Size"], item["LastModified"].timestamp())
+
+    def staging_path(self, filename: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{uuid4().hex}.part")
+
+    def put_file(self, source_path: str, filename: str, content_type: str | None) -> None:
+        try:
+            self.client.upload_file(
+                source_path,
+                self.bucket,
+                self.key(filename),
+                ExtraArgs=_object_args(content_type),
+                Config=self.transfer_config,
+            )
+        finally:
+            os.remove(source_path)
+
+    def put_bytes(self, filename: str, content: bytes, content_type: str | None) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.key(filename), Body=content, **_object_args(content_type))
+
+    def delete(self, filename: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(filename))
+
+    def delete_directory(self, directory: str) -> None:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.key(directory)}/"):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+
+    def fetch(self, filename: str) -> str:
+        path = self.staging_path(filename)
+        try:
+            self.client.download_file(self.bucket, self.key(filename), path, Config=self.transfer_config)
+        except self.client.exceptions.ClientError as e:
+            os.remove(path)
+            if _is_not_found(e):
+                raise FileNotFoundError(self.location(filename)) from e
+            raise
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def discard(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def signed_url(self, filename: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(filename)}, ExpiresIn=self.presigned_url_ttl
+        )
+
+    def redirect(self, filename: str, headers: dict[str, str] | None = None) -> Response:
+        """Redirect to a pre-signed URL of the file, which clients may reuse for half its lifetime."""
+        headers = {**(headers or {}), "Cache-Control": f"private, max-age={self.presigned_url_ttl // 2}"}
+        return RedirectResponse(self.signed_url(filename), status_code=307, headers=headers)
+
+
+def _object_args(content_type: str | None) -> dict[str, Any]:
+    return {"ContentType": content_type} if content_type else {}
+
+
+def _is_not_found(error: Any) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+class StorageRedirects:
+    """ASGI app serving `/uploads/{filename}` as redirects to the storage, for backends clients read from directly.
+
+    URLs recorded for stored files stay the same whichever backend holds them.
+    """
+
+    def __init__(self, storage: StorageBackend) -> None:
+        self.storage = storage
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return
+        filename = scope["path"].removeprefix(scope.get("root_path", "")).lstrip("/")
+        if scope["method"] not in ("GET", "HEAD"):
+            response: Response = PlainTextResponse("Method Not Allowed", status_code=405)
+        elif not filename or ".." in filename.split("/"):
+            response = PlainTextResponse("Not Found", status_code=404)
+        else:
+            response = self.storage.redirect(filename) or PlainTextResponse("Not Found", status_code=404)
+        await response(scope, receive, send)
+
+
+def create_storage(settings: ObjectStorageSettings, directory: str) -> StorageBackend:
+    """The configured storage backend, `LocalStorage` under `directory` unless another one is selected."""
+    if settings.STORAGE_BACKEND == StorageBackendOption.S3:
+        return S3Storage(settings, os.path.join(directory, UPLOAD_TMP_DIR))
+    return LocalStorage(directory)
+
+
+# Created on import, like the database engine, as file locations are needed outside of requests (workers, scripts)
+storage = create_storage(settings, settings.UPLOAD_DIR)
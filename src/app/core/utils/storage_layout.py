@@ -0,0 +1,83 @@
+import os
+import re
+
+from starlette.staticfiles import StaticFiles
+
+# Files under UPLOAD_DIR are spread over two levels of sub-directories named after the first characters of the key
+# (image id or content hash) they are stored under, `ab/cd/abcd...`, so no directory grows past a few thousand
+# entries. Paths are recorded in the database, so changing these requires migrating the stored files.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+# Sub-directory of UPLOAD_DIR holding content-addressed files, one per distinct content
+BLOB_DIR = "blobs"
+# Sub-directory of UPLOAD_DIR holding derivatives, one directory per source
+VARIANT_DIR = "variants"
+
+# Regular expression matching the shard directories of a hexadecimal key, for callers recognizing stored paths
+SHARD_PATTERN = "/".join([f"[0-9a-f]{{{SHARD_WIDTH}}}"] * SHARD_LEVELS)
+
+_SHARDABLE_KEY = re.compile(rf"^[0-9a-f]{{{SHARD_LEVELS * SHARD_WIDTH}}}")
+
+
+def shard(key: str) -> str:
+    """The shard directories of `key`, e.g. `ab/cd` for `abcdef...`."""
+    return "/".join(key[level * SHARD_WIDTH : (level + 1) * SHARD_WIDTH] for level in range(SHARD_LEVELS))
+
+
+def image_filename(image_id: str, ext: str) -> str:
+    return f"{shard(image_id)}/{image_id}.{ext}"
+
+
+def blob_filename(sha256: str, ext: str) -> str:
+    return f"{BLOB_DIR}/{shard(sha256)}/{sha256}.{ext}"
+
+
+def variant_directory(source_key: str) -> str:
+    return f"{VARIANT_DIR}/{shard(source_key)}/{source_key}"
+
+
+def variant_filename(source_key: str, name: str, fmt: str) -> str:
+    return f"{variant_directory(source_key)}/{name}.{fmt}"
+
+
+def sharded_path(path: str) -> str | None:
+    """Where a file stored under the flat layout (`{id}.{ext}`, `blobs/{sha256}.{ext}`, `variants/{key}/{name}`)
+    lives in the sharded one, or `None` for paths that are not of the flat layout.
+
+    Parameters
+    ----------
+    path: str
+        Path relative to UPLOAD_DIR, with `/` separators.
+    """
+    parts = path.split("/")
+    if len(parts) == 1:
+        key, filename = parts[0].split(".", 1)[0], parts[0]
+        sharded = image_filename(key, filename.split(".", 1)[1]) if "." in filename else None
+    elif len(parts) == 2 and parts[0] == BLOB_DIR and "." in parts[1]:
+        key, ext = parts[1].split(".", 1)
+        sharded = blob_filename(key, ext)
+    elif len(parts) == 3 and parts[0] == VARIANT_DIR:
+        key = parts[1]
+        sharded = f"{variant_directory(key)}/{parts[2]}"
+    else:
+        return None
+    return sharded if _SHARDABLE_KEY.match(key) else None
+
+
+class ShardedStaticFiles(StaticFiles):
+    """`StaticFiles` for the upload directory that also serves files under the URLs they had in the flat layout.
+
+    URLs handed out before files were moved into shards, or recorded by rows not migrated yet, keep working. Hidden
+    files and directories, such as uploads still streaming in, are never served.
+    """
+
+    def lookup_path(self, path: str) -> tuple[str, os.stat_result | None]:
+        if any(part.startswith(".") for part in path.replace(os.sep, "/").split("/")):
+            return "", None
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None:
+            sharded = sharded_path(path.replace(os.sep, "/"))
+            if sharded is not None:
+                return super().lookup_path(sharded)
+        return full_path, stat_result
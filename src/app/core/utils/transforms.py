@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from ...schemas.image import ImageFit, ImageFormat
+from ..config import ImageTransformSettings
+from ..logger import logging
+from .imaging import FORMATS, supported_formats, transform_image
+from .single_flight import SingleFlight
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+# Formats offered to clients that accept them, best first, before falling back to the source's own kind
+NEGOTIATED_FORMATS = [ImageFormat.AVIF, ImageFormat.WEBP]
+
+
+class TransformOverloaded(Exception):
+    """Too many transforms are already waiting for a worker process."""
+
+
+@dataclass
+class TransformedImage:
+    path: str
+    media_type: str
+    size: int
+
+
+def accepted_types(accept: str | None) -> set[str]:
+    """Media types an `Accept` header allows explicitly, leaving out those with `q=0`."""
+    types = set()
+    for media_range in (accept or "").split(","):
+        media_type, *params = (part.strip() for part in media_range.split(";"))
+        if any(param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for param in params):
+            continue
+        if media_type:
+            types.add(media_type.lower())
+    return types
+
+
+def negotiate_format(accept: str | None, source_content_type: str | None) -> ImageFormat:
+    """Pick the output format for a client from its `Accept` header.
+
+    Modern formats are used when the client lists them; otherwise the result keeps the source's kind, PNG for
+    sources that may have transparency and JPEG for the rest.
+    """
+    types = accepted_types(accept)
+    supported = supported_formats()
+    for fmt in NEGOTIATED_FORMATS:
+        if fmt.value in supported and FORMATS[fmt.value][1] in types:
+            return fmt
+    if source_content_type in ("image/png", "image/gif", "image/webp"):
+        return ImageFormat.PNG
+    return ImageFormat.JPEG
+
+
+class ImageTransformer:
+    """On-demand resizing and transcoding of stored images, with the results cached on disk.
+
+    Results are stored under a key derived from the source content and the transform parameters, and kept in a least
+    recently used index bounded by total bytes. Concurrent requests for the same missing result share one transform.
+    Transforms run on a pool of worker processes; when more than `IMAGE_TRANSFORM_QUEUE_SIZE` are already waiting
+    for a worker, new ones fail fast with `TransformOverloaded` instead of queuing without bound.
+
+    Parameters
+    ----------
+    directory: str
+        Where transformed images are stored, one `{key}.{ext}` file per result.
+    settings: ImageTransformSettings
+        Encoder quality, number of processes, queue size and cache size.
+    """
+
+    def __init__(self, directory: str, settings: ImageTransformSettings) -> None:
+        self.directory = directory
+        self.quality = settings.IMAGE_TRANSFORM_QUALITY
+        self.max_size = settings.IMAGE_TRANSFORM_CACHE_SIZE
+        self._workers = settings.IMAGE_TRANSFORM_WORKERS
+        self._slots = asyncio.Semaphore(settings.IMAGE_TRANSFORM_WORKERS + settings.IMAGE_TRANSFORM_QUEUE_SIZE)
+        self._executor: ProcessPoolExecutor | None = None
+        self._flights: SingleFlight[TransformedImage] = SingleFlight()
+
+        self._entries: OrderedDict[str, TransformedImage] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Index results already on disk, oldest first, and start the worker processes."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for dir_entry in os.scandir(self.directory):
+            _, _, ext = dir_entry.name.partition(".")
+            if ext not in FORMATS or not dir_entry.is_file():
+                continue
+            stat = dir_entry.stat()
+            entry = TransformedImage(dir_entry.path, FORMATS[ext][1], stat.st_size)
+            entries.append((stat.st_atime, dir_entry.name, entry))
+        for _, name, entry in sorted(entries):
+            self._entries[name.partition(".")[0]] = entry
+            self._bytes += entry.size
+        _remove_files(self._evict())
+
+        # Spawned rather than forked, so the processes don't inherit the event loop, sockets and threads of the app
+        self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def key(self, source_key: str, width: int | None, height: int | None, fit: ImageFit, fmt: ImageFormat) -> str:
+        """Cache key of a transform, which also names its result: equal keys always give the same image."""
+        params = f"{source_key}:{width}:{height}:{fit.value}:{fmt.value}:{self.quality}"
+        return hashlib.sha256(params.encode()).hexdigest()
+
+    async def get(
+        self,
+        source_filename: str,
+        source_key: str,
+        width: int | None,
+        height: int | None,
+        fit: ImageFit,
+        fmt: ImageFormat,
+    ) -> tuple[TransformedImage, bool]:
+        """Return the transformed image and whether it came from the cache, transforming the source if needed.
+
+        `source_filename` names the stored original, which is only read on a miss.
+
+        Raises
+        ------
+        TransformOverloaded
+            If the transform is not cached and too many are already waiting for a worker.
+        """
+        key = self.key(source_key, width, height, fit, fmt)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry, True
+
+        self.misses += 1
+        path = os.path.join(self.directory, f"{key}.{fmt.value}")
+        entry = await self._flights.do(
+            key, lambda: self._transform(key, source_filename, path, width, height, fit == ImageFit.COVER, fmt)
+        )
+        return entry, False
+
+    async def _transform(
+        self,
+        key: str,
+        source_filename: str,
+        path: str,
+        width: int | None,
+        height: int | None,
+        cover: bool,
+        fmt: ImageFormat,
+    ) -> TransformedImage:
+        if self._executor is None:
+            raise RuntimeError("Image transformer is not started")
+        if self._slots.locked():
+            self.rejected += 1
+            raise TransformOverloaded("Too many image transforms in progress")
+
+        async with self._slots, storage.local_copy(source_filename) as source_path:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self._executor, transform_image, source_path, path, width, height, cover, fmt.value, self.quality
+            )
+
+        entry = TransformedImage(path, FORMATS[fmt.value][1], await asyncio.to_thread(os.path.getsize, path))
+        self._entries[key] = entry
+        self._bytes += entry.size
+        evicted = self._evict()
+        if evicted:
+            await asyncio.to_thread(_remove_files, evicted)
+        return entry
+
+    def _evict(self) -> list[str]:
+        evicted = []
+        # The newest entry stays even if it alone exceeds the budget, it is about to be served
+        while self._bytes > self.max_size and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+            evicted.append(entry.path)
+        return evicted
+
+
+def _remove_files(paths: list[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+transformer: ImageTransformer | None = None
+
+
+def get_image_transformer() -> ImageTransformer:
+    """Dependency returning the application's shared `ImageTransformer`."""
+    if transformer is None:
+        raise RuntimeError("Image transformer is not initialized")
+    return transformer
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import IO, Any
+
+from fastapi import HTTPException, Request
+
+from . import metrics, server_timing
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Sub-directory of UPLOAD_DIR receiving uploads while they stream in, on the same filesystem so that moving a
+# finished upload into place is an atomic rename
+UPLOAD_TMP_DIR = ".tmp"
+
+# Allowance for multipart boundaries and part headers when checking Content-Length against the file size limit
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Non-file fields are kept in memory, so their size, number and total size are bounded
+MAX_FIELD_SIZE = 64 * 1024
+MAX_FIELDS = 1000
+MAX_FIELDS_SIZE = 1024 * 1024
+
+# OpenAPI description of a multipart body with a single `file` field, for routes that parse the body themselves
+SINGLE_FILE_REQUEST_BODY: dict[str, Any] = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+# OpenAPI description of a multipart body with many `files` and their `ids`, for the bulk upload route
+BULK_UPLOAD_REQUEST_BODY: dict[str, Any] = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "ids": {"type": "array", "items": {"type": "string", "format": "uuid"}},
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                    },
+                    "required": ["ids", "files"],
+                }
+            }
+        },
+    }
+}
+
+
+@dataclass
+class StreamedFile:
+    """A file part of a multipart body, stored in a temporary file while it was received."""
+
+    field_name: str
+    filename: str
+    content_type: str | None
+    tmp_path: str
+    size: int = 0
+    sha256: str = ""
+
+
+@dataclass
+class StreamedForm:
+    fields: dict[str, list[str]] = field(default_factory=dict)
+    files: list[StreamedFile] = field(default_factory=list)
+
+    def cleanup(self) -> None:
+        """Remove temporary files that were not moved into place."""
+        for streamed in self.files:
+            if os.path.exists(streamed.tmp_path):
+                os.remove(streamed.tmp_path)
+
+
+def check_content_length(request: Request, max_size: int) -> None:
+    """Reject a body that announces itself as too large before reading any of it."""
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_size:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds {max_size} bytes")
+
+
+class _FilePart:
+    def __init__(self, streamed: StreamedFile, buffer: IO[bytes]) -> None:
+        self.streamed = streamed
+        self.buffer = buffer
+        self.hasher = hashlib.sha256()
+        self.pending: list[bytes] = []
+
+    def write(self, chunks: list[bytes]) -> None:
+        for chunk in chunks:
+            self.buffer.write(chunk)
+            self.hasher.update(chunk)
+
+
+async def stream_form(
+    request: Request,
+    directory: str,
+    max_file_size: int,
+    max_files: int = 1,
+    validate_file: Callable[[str, str], None] | None = None,
+) -> StreamedForm:
+    """Parse a multipart body straight from the request stream, spooling file parts to disk chunk by chunk.
+
+    Nothing is buffered beyond the chunk being processed: file data is hashed and written to a temporary file under
+    `directory` as it arrives, with the file I/O and hashing done in a worker thread. A file growing past
+    `max_file_size` aborts the request with 413 at that point, as do more than `MAX_FIELDS` other fields or more than
+    `MAX_FIELDS_SIZE` bytes of them. `validate_file(field_name, filename)` runs as soon as a part's headers are known,
+    so bad files can be rejected before their data is read.
+
+    The caller owns the temporary files of the returned form and must move them into place or call `cleanup`.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    events: list[tuple[str, bytes]] = []
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": lambda: events.append(("part_begin", b"")),
+            "on_part_data": lambda data, start, end: events.append(("part_data", data[start:end])),
+            "on_part_end": lambda: events.append(("part_end", b"")),
+            "on_header_field": lambda data, start, end: events.append(("header_field", data[start:end])),
+            "on_header_value": lambda data, start, end: events.append(("header_value", data[start:end])),
+            "on_header_end": lambda: events.append(("header_end", b"")),
+            "on_headers_finished": lambda: events.append(("headers_finished", b"")),
+        },
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    form = StreamedForm()
+    headers: dict[bytes, bytes] = {}
+    header_field = b""
+    header_value = b""
+    field_name = ""
+    field_data = bytearray()
+    field_count = 0
+    fields_size = 0
+    part: _FilePart | None = None
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, data in events:
+                if event == "part_begin":
+                    headers, field_data = {}, bytearray()
+                elif event == "header_field":
+                    header_field += data
+                elif event == "header_value":
+                    header_value += data
+                elif event == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field, header_value = b"", b""
+                elif event == "headers_finished":
+                    field_name = _field_name(headers)
+                    part = _begin_part(headers, form, directory, max_files, validate_file)
+                    if part is None:
+                        field_count += 1
+                        if field_count > MAX_FIELDS:
+                            raise HTTPException(status_code=413, detail=f"Too many form fields, at most {MAX_FIELDS}")
+                elif event == "part_data":
+                    if part is None:
+                        fields_size += len(data)
+                        if fields_size > MAX_FIELDS_SIZE:
+                            raise HTTPException(
+                                status_code=413, detail=f"Form fields exceed {MAX_FIELDS_SIZE} bytes in total"
+                            )
+                    _append_data(part, field_data, data, max_file_size)
+                elif event == "part_end" and part is not None:
+                    await _flush(part)
+                    with server_timing.phase("disk"), metrics.disk_write_seconds["upload"].time():
+                        await asyncio.to_thread(part.buffer.close)
+                    part.streamed.sha256 = part.hasher.hexdigest()
+                    metrics.upload_file_bytes.observe(part.streamed.size)
+                    part = None
+                elif event == "part_end":
+                    form.fields.setdefault(field_name, []).append(field_data.decode("utf-8", errors="replace"))
+            events.clear()
+
+            if part is not None:
+                await _flush(part)
+
+        parser.finalize()
+    except BaseException:
+        if part is not None:
+            part.buffer.close()
+        form.cleanup()
+        raise
+
+    return form
+
+
+def _field_name(headers: dict[bytes, bytes]) -> str:
+    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+    return options.get(b"name", b"").decode("utf-8")
+
+
+def _begin_part(
+    headers: dict[bytes, bytes],
+    form: StreamedForm,
+    directory: str,
+    max_files: int,
+    validate_file: Callable[[str, str], None] | None,
+) -> _FilePart | None:
+    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+    if b"filename" not in options:
+        return None
+
+    name = options.get(b"name", b"").decode("utf-8")
+    filename = options[b"filename"].decode("utf-8")
+    if len(form.files) >= max_files:
+        raise HTTPException(status_code=400, detail=f"Too many files, at most {max_files} allowed")
+    if validate_file is not None:
+        validate_file(name, filename)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    content_type = headers.get(b"content-type")
+    streamed = StreamedFile(
+        field_name=name,
+        filename=filename,
+        content_type=content_type.decode("latin-1") if content_type else None,
+        tmp_path=tmp_path,
+    )
+    form.files.append(streamed)
+    return _FilePart(streamed, os.fdopen(fd, "wb"))
+
+
+def _append_data(part: _FilePart | None, field_data: bytearray, data: bytes, max_file_size: int) -> None:
+    if part is None:
+        if len(field_data) + len(data) > MAX_FIELD_SIZE:
+            raise HTTPException(status_code=413, detail=f"Form field exceeds {MAX_FIELD_SIZE} bytes")
+        field_data += data
+        return
+
+    part.streamed.size += len(data)
+    if part.streamed.size > max_file_size:
+        raise HTTPException(status_code=413, detail=f"File exceeds the maximum size of {max_file_size} bytes")
+    part.pending.append(data)
+
+
+async def _flush(part: _FilePart) -> None:
+    if part.pending:
+        chunks, part.pending = part.pending, []
+        with server_timing.phase("disk"), metrics.disk_write_seconds["upload"].time():
+            await asyncio.to_thread(part.write, chunks)
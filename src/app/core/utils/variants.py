@@ -0,0 +1,196 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from sqlalchemy import select
+
+from ...models.image_variant import ImageVariant
+from ..config import ImageVariantSettings
+from ..db.database import AsyncSessionLocal
+from ..logger import logging
+from .image_store import image_file_path, image_url
+from .imaging import render_variants, supported_formats
+from .storage import storage
+from .storage_layout import VARIANT_DIR, variant_directory, variant_filename
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingVariants:
+    image_id: str
+    source_path: str
+    # Names the directory holding the derivatives, images sharing their content share it too
+    source_key: str
+
+
+def remove_variants(source_key: str) -> None:
+    # Variants made before uploads were sharded may not have been migrated yet
+    for directory in (variant_directory(source_key), f"{VARIANT_DIR}/{source_key}"):
+        storage.delete_directory(directory)
+
+
+class VariantPipeline:
+    """Makes the configured derivatives of stored images on a pool of worker processes.
+
+    Handlers hand stored images to `submit`, which never blocks: images are queued and background tasks send them to
+    the process pool, where they are decoded and encoded without holding up the event loop, then record an
+    `ImageVariant` row per derivative. When the bounded queue is full the image is skipped and logged.
+
+    Parameters
+    ----------
+    settings: ImageVariantSettings
+        The variants to make, encoder quality, number of processes and queue size.
+    """
+
+    def __init__(self, settings: ImageVariantSettings) -> None:
+        formats = supported_formats()
+        self.specs = {}
+        for name, (size, fmt) in settings.IMAGE_VARIANTS.items():
+            if fmt in formats:
+                self.specs[name] = (size, fmt)
+            else:
+                logger.warning(f"Image variant {name} skipped, format {fmt} is not supported")
+
+        self.quality = settings.IMAGE_VARIANT_QUALITY
+        self._workers_count = settings.IMAGE_VARIANT_WORKERS
+        self._queue: asyncio.Queue[PendingVariants] = asyncio.Queue(maxsize=settings.IMAGE_VARIANT_QUEUE_SIZE)
+        self._workers: list[asyncio.Task[None]] = []
+        self._executor: ProcessPoolExecutor | None = None
+        self.dropped = 0
+
+    def start(self) -> None:
+        # Spawned rather than forked, so the processes don't inherit the event loop, sockets and threads of the app
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers_count, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._workers = [
+            asyncio.create_task(self._run(), name=f"image-variants-{i}") for i in range(self._workers_count)
+        ]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Finish queued images, waiting at most `timeout` seconds, then stop the workers and processes."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"Image variant pipeline stopped with {self._queue.qsize()} images still queued")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped}
+
+    def submit(self, image_id: str, source_path: str, source_key: str) -> bool:
+        if not self.specs:
+            return False
+        try:
+            self._queue.put_nowait(PendingVariants(image_id, source_path, source_key))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Image variant queue is full, not making variants of image {image_id}")
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self.process(item.image_id, item.source_path, item.source_key)
+            except Exception as e:
+                logger.error(f"Error making variants of image {item.image_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def process(self, image_id: str, source_path: str, source_key: str) -> list[ImageVariant]:
+        """Make the variants of one image and record them, returning its variant rows.
+
+        Images sharing their content share their variants, so variants another image already has are only recorded.
+        """
+        if self._executor is None:
+            raise RuntimeError("Image variant pipeline is not started")
+
+        filenames = {name: variant_filename(source_key, name, fmt) for name, (_, fmt) in self.specs.items()}
+        locations = {image_file_path(filename): name for name, filename in filenames.items()}
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(ImageVariant).where(ImageVariant.file_path.in_(locations)))
+            descriptions = {
+                locations[variant.file_path]: {
+                    "name": variant.name,
+                    "content_type": variant.content_type,
+                    "width": variant.width,
+                    "height": variant.height,
+                    "size": variant.size,
+                }
+                for variant in result.scalars()
+            }
+        missing = {name: filename for name, filename in filenames.items() if name not in descriptions}
+        if missing:
+            for description in await self._render(source_path, missing):
+                descriptions[description["name"]] = description
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(ImageVariant).where(ImageVariant.image_id == image_id))
+            variants = {variant.name: variant for variant in result.scalars()}
+            for name, description in descriptions.items():
+                if name in variants:
+                    continue
+                variants[name] = ImageVariant(
+                    image_id=image_id,
+                    file_path=image_file_path(filenames[name]),
+                    url=image_url(filenames[name]),
+                    **description,
+                )
+                db.add(variants[name])
+            await db.commit()
+
+        return list(variants.values())
+
+    async def _render(self, source_path: str, filenames: dict[str, str]) -> list[dict]:
+        """Render variants of a stored image on the process pool and store them, returning their descriptions."""
+        staged = {name: await asyncio.to_thread(storage.staging_path, filename) for name, filename in filenames.items()}
+        specs = [(name, *self.specs[name], path) for name, path in staged.items()]
+        try:
+            async with storage.local_copy(storage.filename(source_path)) as local_source:
+                loop = asyncio.get_running_loop()
+                rendered = await loop.run_in_executor(
+                    self._executor, render_variants, local_source, specs, self.quality
+                )
+            for description in rendered:
+                name = description["name"]
+                await asyncio.to_thread(
+                    storage.put_file, staged.pop(name), filenames[name], description["content_type"]
+                )
+        finally:
+            for path in staged.values():
+                await asyncio.to_thread(storage.discard, path)
+        return rendered
+
+
+def describe_variants(variants: list[ImageVariant]) -> dict[str, dict]:
+    return {
+        variant.name: {
+            "url": variant.url,
+            "content_type": variant.content_type,
+            "width": variant.width,
+            "height": variant.height,
+            "size": variant.size,
+        }
+        for variant in variants
+    }
+
+
+pipeline: VariantPipeline | None = None
+
+
+def get_variant_pipeline() -> VariantPipeline:
+    """Dependency returning the application's shared `VariantPipeline`."""
+    if pipeline is None:
+        raise RuntimeError("Image variant pipeline is not initialized")
+    return pipeline
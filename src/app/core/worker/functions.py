@@ -1,12 +1,27 @@
 import asyncio
-import logging
+from dataclasses import asdict
+from typing import Any
+from uuid import uuid4
 
 import uvloop
 from arq.worker import Worker
 
+from ...schemas.image import FluxModel, ImageGenerationRequest
+from ..config import settings
+from ..db.database import AsyncSessionLocal
+from ..logger import logging, propagate, request_id
+from ..utils.flux import FluxClient
+from ..utils.generation import download_sample, media_type_for, remove_file, wait_for_sample
+from ..utils.image_store import extension_for, record_image
+from ..utils.poller import FluxPoller
+from ..utils.retention import GarbageCollector
+from ..utils.storage import storage
+from ..utils.storage_layout import image_filename
+from ..utils.variants import VariantPipeline, describe_variants
+
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
 
 
 # -------- background tasks --------
@@ -15,10 +30,73 @@ async def sample_background_task(ctx: Worker, name: str) -> str:
     return f"Task {name} is complete!"
 
 
+async def generate_image_task(ctx: Worker, request: dict[str, Any], model: str) -> dict[str, Any]:
+    """Run the submit/poll/download pipeline for a queued generation and store the result as an `Image`."""
+    generation_request = ImageGenerationRequest(**request)
+    flux_model = FluxModel(model)
+
+    sample_url = await wait_for_sample(ctx["flux_client"], ctx["flux_poller"], generation_request, flux_model)
+
+    image_id = str(uuid4())
+    # Named after what upstream sent once it is downloaded, which need not be the requested format
+    staged_path = storage.staging_path(image_filename(image_id, "part"))
+    filename = None
+    try:
+        content_type, size = await download_sample(ctx["flux_client"], sample_url, flux_model, staged_path)
+        content_type = content_type or media_type_for(generation_request)
+        filename = image_filename(image_id, extension_for(content_type))
+        await asyncio.to_thread(storage.put_file, staged_path, filename, content_type)
+        async with AsyncSessionLocal() as db:
+            db_image = await record_image(db, image_id, filename, content_type)
+    except Exception:
+        remove_file(staged_path)
+        if filename is not None:
+            await asyncio.to_thread(storage.delete, filename)
+        raise
+
+    # The image is stored either way, a failure to make its variants does not fail the job
+    try:
+        variants = await ctx["variant_pipeline"].process(image_id, db_image.file_path, image_id)
+    except Exception as e:
+        logger.error(f"Error making variants of image {image_id}: {e}")
+        variants = []
+
+    return {
+        "id": db_image.id,
+        "url": db_image.url,
+        "filename": db_image.filename,
+        "file_path": db_image.file_path,
+        "content_type": db_image.content_type,
+        "size": size,
+        "variants": describe_variants(variants),
+    }
+
+
+async def collect_garbage_task(ctx: Worker) -> dict[str, int]:
+    """Reconcile the storage with the database and enforce the retention policies, run on a schedule."""
+    report = await GarbageCollector(settings=settings).run()
+    return asdict(report)
+
+
 # -------- base functions --------
 async def startup(ctx: Worker) -> None:
-    logging.info("Worker Started")
+    # arq's CLI gives its logger a handler writing to stderr on the event loop
+    propagate("arq")
+    ctx["flux_client"] = FluxClient(api_key=settings.FLUX_API_KEY, settings=settings)
+    ctx["flux_poller"] = FluxPoller(client=ctx["flux_client"], settings=settings)
+    ctx["flux_poller"].start()
+    ctx["variant_pipeline"] = VariantPipeline(settings=settings)
+    ctx["variant_pipeline"].start()
+    logger.info("Worker Started")
+
+
+async def start_job(ctx: Worker) -> None:
+    # The job runs in a task created after this, which inherits the id
+    request_id.set(ctx["job_id"])
 
 
 async def shutdown(ctx: Worker) -> None:
-    logging.info("Worker end")
+    await ctx["variant_pipeline"].stop()
+    await ctx["flux_poller"].stop()
+    await ctx["flux_client"].aclose()
+    logger.info("Worker end")
@@ -1,15 +1,64 @@
 from arq.connections import RedisSettings
+from arq.cron import CronJob, cron
 
 from ...core.config import settings
-from .functions import sample_background_task, shutdown, startup
+from .functions import (
+    collect_garbage_task,
+    generate_image_task,
+    sample_background_task,
+    shutdown,
+    start_job,
+    startup,
+)
 
 REDIS_QUEUE_HOST = settings.REDIS_QUEUE_HOST
 REDIS_QUEUE_PORT = settings.REDIS_QUEUE_PORT
 
 
+def cron_schedule(interval: int) -> tuple[set[int], set[int] | None]:
+    """Minutes and hours at which a job every `interval` minutes runs, evenly spaced across the day.
+
+    Returns
+    -------
+    tuple[set[int], set[int] | None]
+        The `minute` and `hour` arguments of `cron`, the hours being `None` for every hour.
+
+    Raises
+    ------
+    ValueError
+        If `interval` neither divides an hour nor is a whole number of hours dividing a day.
+    """
+    if 0 < interval <= 60 and 60 % interval == 0:
+        return set(range(0, 60, interval)), None
+    if interval > 60 and interval % 60 == 0 and (24 * 60) % interval == 0:
+        return {0}, set(range(0, 24, interval // 60))
+    raise ValueError(f"Interval of {interval} minutes must divide an hour, or be whole hours dividing a day")
+
+
+def garbage_collection_jobs(interval: int = settings.GC_INTERVAL_MINUTES) -> list[CronJob]:
+    if interval <= 0:
+        return []
+    minute, hour = cron_schedule(interval)
+    # Unique across workers, and allowed to run until the next one is due
+    return [
+        cron(
+            collect_garbage_task,
+            minute=minute,
+            hour=hour,
+            timeout=interval * 60,
+            keep_result=settings.GC_RESULT_TTL,
+        )
+    ]
+
+
 class WorkerSettings:
-    functions = [sample_background_task]
+    functions = [sample_background_task, generate_image_task]
+    cron_jobs = garbage_collection_jobs()
     redis_settings = RedisSettings(host=REDIS_QUEUE_HOST, port=REDIS_QUEUE_PORT)
     on_startup = startup
     on_shutdown = shutdown
+    on_job_start = start_job
     handle_signals = False
+    max_jobs = settings.WORKER_MAX_JOBS
+    job_timeout = settings.GENERATION_JOB_TIMEOUT
+    keep_result = settings.GENERATION_JOB_RESULT_TTL
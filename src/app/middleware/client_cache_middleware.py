@@ -1,56 +1,60 @@
-from fastapi import FastAPI, Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
-class ClientCacheMiddleware(BaseHTTPMiddleware):
-    """Middleware to set the `Cache-Control` header for client-side caching on all responses.
+class ClientCacheMiddleware:
+    """Middleware to set a default `Cache-Control` header on responses whose route did not set one.
+
+    Written as plain ASGI middleware: the response is passed through as it is sent, only its start message is
+    touched, so streaming responses are not buffered or moved to another task.
 
     Parameters
     ----------
-    app: FastAPI
-        The FastAPI application instance.
-    max_age: int, optional
-        Duration (in seconds) for which the response should be cached. Defaults to 60 seconds.
+    app: ASGIApp
+        The application to wrap.
+    default: str, optional
+        The `Cache-Control` value for responses without one. Defaults to "no-store".
 
     Attributes
     ----------
-    max_age: int
-        Duration (in seconds) for which the response should be cached.
+    default: str
+        The `Cache-Control` value for responses without one.
 
     Methods
     -------
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        Process the request and set the `Cache-Control` header in the response.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        Handle the request and set the `Cache-Control` header in the response if it is missing.
 
     Note
     ----
-        - The `Cache-Control` header instructs clients (e.g., browsers)
-        to cache the response for the specified duration.
+        - Routes choose their own caching policy by setting `Cache-Control` themselves, e.g. long-lived for images
+        whose URL names their content. Everything else, API results in particular, gets the default.
     """
 
-    def __init__(self, app: FastAPI, max_age: int = 60) -> None:
-        super().__init__(app)
-        self.max_age = max_age
+    def __init__(self, app: ASGIApp, default: str = "no-store") -> None:
+        self.app = app
+        self.default = default
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        """Process the request and set the `Cache-Control` header in the response.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and set the `Cache-Control` header in the response if it is missing.
 
         Parameters
         ----------
-        request: Request
-            The incoming request.
-        call_next: RequestResponseEndpoint
-            The next middleware or route handler in the processing chain.
-
-        Returns
-        -------
-        Response
-            The response object with the `Cache-Control` header set.
-
-        Note
-        ----
-            - This method is automatically called by Starlette for processing the request-response cycle.
+        scope: Scope
+            The connection scope.
+        receive: Receive
+            The channel the request body is read from.
+        send: Send
+            The channel the response is sent on.
         """
-        response: Response = await call_next(request)
-        response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
-        return response
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache_control(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.setdefault("Cache-Control", self.default)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_control)
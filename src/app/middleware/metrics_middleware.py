@@ -0,0 +1,58 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core.utils import metrics
+
+
+class MetricsMiddleware:
+    """Middleware to record the number of requests in progress, their latency and their status codes.
+
+    Parameters
+    ----------
+    app: ASGIApp
+        The application to wrap.
+
+    Methods
+    -------
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        Handle the request and record it in the HTTP metrics.
+
+    Note
+    ----
+        - Latency is measured until the response starts, a streamed body may take longer to be sent.
+        - No labels are derived from the request, so recording allocates nothing per request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and record it in the HTTP metrics.
+
+        Parameters
+        ----------
+        scope: Scope
+            The connection scope.
+        receive: Receive
+            The channel the request body is read from.
+        send: Send
+            The channel the response is sent on.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+
+        async def send_with_metrics(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                metrics.http_request_seconds.observe(time.perf_counter() - started)
+                metrics.http_responses[min(max(message["status"] // 100, 1), 5) - 1].inc()
+            await send(message)
+
+        metrics.http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            metrics.http_requests_in_progress.dec()
@@ -0,0 +1,60 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core.utils import server_timing
+
+
+class ProcessTimeMiddleware:
+    """Middleware to report how long a request took, overall and per phase.
+
+    Parameters
+    ----------
+    app: ASGIApp
+        The application to wrap.
+
+    Methods
+    -------
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        Handle the request and add the `X-Process-Time` and `Server-Timing` headers to the response.
+
+    Note
+    ----
+        - Handlers and the utilities they call mark their phases with `server_timing.phase`, statements run on the
+        database are added to the db phase automatically.
+        - The headers are computed when the response starts. Work done while a body streams, such as the rest of an
+        image download, happens after them and is not included.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request and add the `X-Process-Time` and `Server-Timing` headers to the response.
+
+        Parameters
+        ----------
+        scope: Scope
+            The connection scope.
+        receive: Receive
+            The channel the request body is read from.
+        send: Send
+            The channel the response is sent on.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = server_timing.ServerTiming()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", str(timing.elapsed()))
+                headers.append("Server-Timing", timing.header())
+            await send(message)
+
+        token = server_timing.activate(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            server_timing.deactivate(token)
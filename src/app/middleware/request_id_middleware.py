@@ -0,0 +1,64 @@
+import re
+from uuid import uuid4
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core.logger import request_id
+
+# Ids set by clients or proxies are kept only if they are short and safe to log as they are
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestIdMiddleware:
+    """Middleware to give every request an id, attached to the records logged while handling it.
+
+    Parameters
+    ----------
+    app: ASGIApp
+        The application to wrap.
+
+    Methods
+    -------
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        Handle the request with its id set and add the `X-Request-ID` header to the response.
+
+    Note
+    ----
+        - The `X-Request-ID` header of the request is reused when it holds a valid id, so records can be correlated
+        with those of a proxy or client; otherwise a random one is made.
+        - Tasks started while handling the request, and threads it runs work in, inherit its id.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request with its id set and add the `X-Request-ID` header to the response.
+
+        Parameters
+        ----------
+        scope: Scope
+            The connection scope.
+        receive: Receive
+            The channel the request body is read from.
+        send: Send
+            The channel the response is sent on.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get("x-request-id", "")
+        current = incoming if _VALID_REQUEST_ID.match(incoming) else uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = current
+            await send(message)
+
+        token = request_id.set(current)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
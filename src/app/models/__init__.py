@@ -1,4 +1,6 @@
+from .blob import Blob
 from .image import Image
+from .image_variant import ImageVariant
 
 # List all models that should be created
-__all__ = ["Image"]
+__all__ = ["Blob", "Image", "ImageVariant"]
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String
+
+from ..core.db.base_class import Base
+
+
+class Blob(Base):
+    """Stored file content, kept once per distinct SHA-256 and shared by every `Image` with the same bytes."""
+
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    filename = Column(String)
+    file_path = Column(String)
+    url = Column(String)
+    content_type = Column(String)
+    size = Column(BigInteger)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<Blob {self.sha256} refs={self.ref_count}>"
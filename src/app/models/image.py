@@ -1,12 +1,17 @@
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, String
 
 from ..core.db.base_class import Base
 
 
 class Image(Base):
     __tablename__ = "images"
+    # Listings page through images newest first by (created_at, id), optionally of one content type
+    __table_args__ = (
+        Index("ix_images_created_at_id", "created_at", "id"),
+        Index("ix_images_content_type_created_at_id", "content_type", "created_at", "id"),
+    )
 
     id = Column(String(36), primary_key=True)  # UUID stored as string
     filename = Column(String, unique=True, index=True)
@@ -14,6 +19,8 @@ class Image(Base):
     file_path = Column(String)
     url = Column(String)
     content_type = Column(String)
+    # Content-addressed uploads share their file through a blob, other images own theirs
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
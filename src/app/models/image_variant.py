@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, String, UniqueConstraint
+
+from ..core.db.base_class import Base
+
+
+class ImageVariant(Base):
+    """A resized, re-encoded derivative of an `Image`."""
+
+    __tablename__ = "image_variants"
+    __table_args__ = (UniqueConstraint("image_id", "name"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    image_id = Column(String(36), ForeignKey("images.id"), index=True, nullable=False)
+    name = Column(String, nullable=False)
+    file_path = Column(String)
+    url = Column(String)
+    content_type = Column(String)
+    width = Column(Integer)
+    height = Column(Integer)
+    size = Column(BigInteger)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<ImageVariant {self.image_id}/{self.name}>"
@@ -0,0 +1,60 @@
+from enum import StrEnum
+
+from pydantic import BaseModel, Field
+
+
+class ImageGenerationResultStatus(StrEnum):
+    TASK_NOT_FOUND = "Task not found"
+    PENDING = "Pending"
+    REQUEST_MODERATED = "Request Moderated"
+    CONTENT_MODERATED = "Content Moderated"
+    READY = "Ready"
+    ERROR = "Error"
+
+
+class FluxModel(StrEnum):
+    FLUX_PRO_1_1 = "flux-pro-1.1"
+    FLUX_PRO = "flux-pro"
+    FLUX_DEV = "flux-dev"
+    FLUX_PRO_1_1_ULTRA = "flux-pro-1.1-ultra"
+    FLUX_PRO_1_0_FILL = "flux-pro-1.0-fill"
+    FLUX_PRO_1_0_CANYON = "flux-pro-1.0-canny"
+    FLUX_PRO_1_0_DEPTH = "flux-pro-1.0-depth"
+
+
+class ImageGenerationRequest(BaseModel):
+    prompt: str = Field(..., description="The prompt to generate the image from")
+    width: int = Field(default=1024, ge=64, le=2048, description="Image width in pixels")
+    height: int = Field(default=768, ge=64, le=2048, description="Image height in pixels")
+    prompt_upsampling: bool = Field(default=False, description="Whether to use prompt upsampling")
+    seed: int | None = Field(default=None, description="Random seed for reproducible generations")
+    safety_tolerance: int = Field(default=2, ge=0, le=3, description="Safety filter tolerance level (0-3)")
+    output_format: str = Field(
+        default="jpeg", pattern="^(jpeg|png)$", description="Output format of the generated image"
+    )
+
+
+class BatchGenerationItem(BaseModel):
+    request: ImageGenerationRequest
+    model: FluxModel = FluxModel.FLUX_PRO_1_1
+
+
+class BatchGenerationRequest(BaseModel):
+    items: list[BatchGenerationItem] = Field(..., min_length=1, description="Generations to run, in any order")
+
+
+class ImageFit(StrEnum):
+    CONTAIN = "contain"  # Fit inside the requested box, keeping the aspect ratio
+    COVER = "cover"  # Fill the requested box, cropping what sticks out
+
+
+class ImageFormat(StrEnum):
+    WEBP = "webp"
+    AVIF = "avif"
+    JPEG = "jpeg"
+    PNG = "png"
+
+
+class ExportFormat(StrEnum):
+    NDJSON = "ndjson"
+    CSV = "csv"
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import BinaryIO
+
+from ..app.core.db.database import async_engine
+from ..app.core.utils.export import export_chunks, gzip_chunks
+from ..app.core.utils.pagination import as_naive_utc
+from ..app.schemas.image import ExportFormat
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export the metadata of every image as NDJSON or CSV.")
+    parser.add_argument("--format", type=ExportFormat, choices=list(ExportFormat), default=ExportFormat.NDJSON)
+    parser.add_argument("--created-after", type=datetime.fromisoformat, help="Only images created at or after this")
+    parser.add_argument("--created-before", type=datetime.fromisoformat, help="Only images created before this")
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+    parser.add_argument("--output", "-o", help="File to write, standard output by default")
+    return parser.parse_args()
+
+
+async def export(args: argparse.Namespace, output: BinaryIO) -> int:
+    chunks = export_chunks(
+        async_engine, args.format, as_naive_utc(args.created_after), as_naive_utc(args.created_before)
+    )
+    if args.gzip:
+        chunks = gzip_chunks(chunks)
+    written = 0
+    async for chunk in chunks:
+        output.write(chunk)
+        written += len(chunk)
+    await async_engine.dispose()
+    return written
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        if args.output is None:
+            written = asyncio.run(export(args, sys.stdout.buffer))
+        else:
+            with open(args.output, "wb") as output:
+                written = asyncio.run(export(args, output))
+        logger.info(f"Exported {written} bytes")
+    except KeyboardInterrupt:
+        logger.info("Export interrupted")
+
+
+if __name__ == "__main__":
+    main()
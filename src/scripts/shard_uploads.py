@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import logging
+import os
+from typing import Any
+
+from sqlalchemy import select
+
+from ..app.core.config import settings
+from ..app.core.db.database import AsyncSessionLocal, async_engine
+from ..app.core.utils.image_store import image_file_path, image_url
+from ..app.core.utils.storage import LocalStorage, storage
+from ..app.core.utils.storage_layout import BLOB_DIR, VARIANT_DIR, sharded_path
+from ..app.models.blob import Blob
+from ..app.models.image import Image
+from ..app.models.image_variant import ImageVariant
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Blobs go first so that uploads taking a reference from now on record sharded paths. Their flat files are only
+# removed at the end, once no image row points at them anymore. Variant files shared by images with the same content
+# are removed once one of their rows is moved; the others are served by URL, which falls back to the sharded path.
+TABLES: list[tuple[Any, Any, bool]] = [
+    (Blob, Blob.sha256, False),
+    (Image, Image.id, True),
+    (ImageVariant, ImageVariant.id, True),
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Move files stored flat in UPLOAD_DIR into the sharded layout, while the application is running."
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows updated per transaction")
+    parser.add_argument("--concurrency", type=int, default=16, help="Files linked or removed at the same time")
+    return parser.parse_args()
+
+
+def relative_path(file_path: str) -> str | None:
+    path = os.path.relpath(file_path, settings.UPLOAD_DIR)
+    return None if path.startswith("..") else path.replace(os.sep, "/")
+
+
+def link_file(source: str, target: str) -> bool:
+    """Make the file at `source` also available at `target`, returning whether `target` exists afterwards."""
+    if os.path.exists(target):
+        return True
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        return os.path.exists(target)
+    return True
+
+
+def remove_file(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+async def run_bounded(calls: list[tuple[Any, ...]], concurrency: int) -> list[Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(function: Any, *args: Any) -> Any:
+        async with semaphore:
+            return await asyncio.to_thread(function, *args)
+
+    return await asyncio.gather(*(run(*call) for call in calls))
+
+
+async def migrate_batch(rows: list[Any], concurrency: int) -> int:
+    """Link the files of `rows` into the sharded layout and point the rows at them, returning how many moved.
+
+    Rows are only pointed at files present at their new path. Their flat files are left for the caller to remove
+    once the rows are committed, so readers always find the file of the row they read.
+    """
+    moves = {}
+    for row in rows:
+        path = relative_path(row.file_path) if row.file_path else None
+        new_path = sharded_path(path) if path is not None else None
+        if new_path is not None:
+            moves[row] = (path, new_path)
+    if not moves:
+        return 0
+
+    targets = {image_file_path(path): image_file_path(new_path) for path, new_path in moves.values()}
+    linked = dict(zip(targets, await run_bounded([(link_file, *move) for move in targets.items()], concurrency)))
+
+    migrated = 0
+    for row, (path, new_path) in moves.items():
+        if not linked[image_file_path(path)]:
+            logger.warning(f"File {path} is missing, leaving {row!r} as it is")
+            continue
+        if getattr(row, "filename", None) == path:
+            row.filename = new_path
+        row.file_path = image_file_path(new_path)
+        row.url = image_url(new_path)
+        migrated += 1
+    return migrated
+
+
+async def migrate_table(model: Any, key: Any, remove_sources: bool, batch_size: int, concurrency: int) -> int:
+    migrated = 0
+    last_key = None
+    while True:
+        async with AsyncSessionLocal() as db:
+            query = select(model).order_by(key).limit(batch_size)
+            if last_key is not None:
+                query = query.where(key > last_key)
+            rows = list((await db.execute(query)).scalars())
+            if not rows:
+                return migrated
+            last_key = getattr(rows[-1], key.key)
+
+            sources = {row: row.file_path for row in rows}
+            count = await migrate_batch(rows, concurrency)
+            await db.commit()
+
+        if remove_sources:
+            moved = [
+                (remove_file, source)
+                for row, source in sources.items()
+                if row.file_path != source and getattr(row, "blob_sha256", None) is None
+            ]
+            await run_bounded(moved, concurrency)
+        migrated += count
+        logger.info(f"{model.__tablename__}: {migrated} files moved")
+
+
+def remove_flat_blobs() -> int:
+    """Remove the flat copies of blobs that are in place in the sharded layout."""
+    directory = image_file_path(BLOB_DIR)
+    removed = 0
+    if not os.path.isdir(directory):
+        return removed
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            new_path = sharded_path(f"{BLOB_DIR}/{entry.name}") if entry.is_file() else None
+            if new_path is not None and os.path.exists(image_file_path(new_path)):
+                remove_file(entry.path)
+                removed += 1
+    return removed
+
+
+def remove_flat_variant_directories() -> None:
+    directory = image_file_path(VARIANT_DIR)
+    if not os.path.isdir(directory):
+        return
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir() and sharded_path(f"{VARIANT_DIR}/{entry.name}/_") is not None:
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    logger.warning(f"Directory {entry.path} is not empty, leaving it")
+
+
+async def migrate(batch_size: int, concurrency: int) -> None:
+    for model, key, remove_sources in TABLES:
+        migrated = await migrate_table(model, key, remove_sources, batch_size, concurrency)
+        logger.info(f"{model.__tablename__}: done, {migrated} files moved")
+    removed = await asyncio.to_thread(remove_flat_blobs)
+    logger.info(f"Removed {removed} flat blob files")
+    await asyncio.to_thread(remove_flat_variant_directories)
+    await async_engine.dispose()
+
+
+def main() -> None:
+    args = parse_args()
+    if not isinstance(storage, LocalStorage):
+        # Object storage backends came with the sharded layout, their files never were flat
+        logger.info("Nothing to migrate, files are not stored in UPLOAD_DIR")
+        return
+    try:
+        asyncio.run(migrate(args.batch_size, args.concurrency))
+    except KeyboardInterrupt:
+        logger.info("Migration interrupted, run it again to resume")
+
+
+if __name__ == "__main__":
+    main()
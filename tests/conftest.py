@@ -1,21 +1,30 @@
-from typing import Any, Callable, Generator
+import asyncio
+import os
+import tempfile
+from collections.abc import Awaitable, Callable, Generator
+from typing import Any
 
 import pytest
 from faker import Faker
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.session import Session
 
 from src.app.core.config import settings
+from src.app.core.db.database import create_schema
+from src.app.core.utils import blob_store, image_store, retention, variants
+from src.app.core.utils.storage import LocalStorage
 from src.app.main import app
 
-DATABASE_URI = settings.POSTGRES_URI
-DATABASE_PREFIX = settings.POSTGRES_SYNC_PREFIX
+DATABASE_URI = settings.DATABASE_SYNC_URI
 
-sync_engine = create_engine(DATABASE_PREFIX + DATABASE_URI)
+sync_engine = create_engine(DATABASE_URI)
 local_session = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
 
+# Runs an async test against a database, see `run_with_db`
+RunWithDb = Callable[[Callable[[async_sessionmaker[AsyncSession]], Awaitable[Any]]], Any]
 
 fake = Faker()
 
@@ -35,5 +44,38 @@ def db() -> Generator[Session, Any, None]:
     session.close()
 
 
+@pytest.fixture
+def directory(monkeypatch: pytest.MonkeyPatch) -> Generator[str, Any, None]:
+    """A temporary directory whose `uploads` sub-directory is the storage of every module storing images."""
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalStorage(os.path.join(directory, "uploads"))
+        for module in (blob_store, image_store, retention, variants):
+            monkeypatch.setattr(module, "storage", storage)
+        monkeypatch.setattr(settings, "UPLOAD_DIR", storage.directory)
+        yield directory
+
+
+@pytest.fixture
+def run_with_db(directory: str) -> RunWithDb:
+    """Run an async test against a fresh SQLite database in `directory`, handing it a session factory.
+
+    Returns what the test returns. The engine lives on the test's own event loop and is disposed of afterwards.
+    """
+
+    def run(test: Callable[[async_sessionmaker[AsyncSession]], Awaitable[Any]]) -> Any:
+        async def main() -> Any:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'app.db')}")
+            try:
+                async with engine.begin() as connection:
+                    await connection.run_sync(create_schema)
+                return await test(async_sessionmaker(engine, expire_on_commit=False))
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
 def override_dependency(dependency: Callable[..., Any], mocked_response: Any) -> None:
     app.dependency_overrides[dependency] = lambda: mocked_response
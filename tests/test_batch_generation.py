@@ -0,0 +1,106 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+
+import httpx
+from fastapi import FastAPI
+
+from src.app.api import router
+from src.app.core.config import ClientRateLimitSettings, FluxClientSettings, ResultCacheSettings
+from src.app.core.utils.flux import FluxClient, get_flux_client
+from src.app.core.utils.image_store import PendingImage, get_image_writer
+from src.app.core.utils.poller import get_flux_poller
+from src.app.core.utils.rate_limit import KeyedTokenBuckets, get_client_buckets
+from src.app.core.utils.result_cache import ResultCache, get_result_cache
+from src.app.schemas.image import FluxModel, ImageGenerationResultStatus
+
+# Seconds each prompt takes to generate, and how it ends
+PROMPTS = {
+    "slow": (0.2, ImageGenerationResultStatus.READY),
+    "fast": (0.0, ImageGenerationResultStatus.READY),
+    "moderated": (0.05, ImageGenerationResultStatus.REQUEST_MODERATED),
+}
+
+
+class FakePoller:
+    """Finishes the task of each prompt after its delay in `PROMPTS`."""
+
+    async def wait(self, task_id: str, model: FluxModel) -> dict[str, Any]:
+        delay, status = PROMPTS[task_id]
+        await asyncio.sleep(delay)
+        return {"status": status, "result": {"sample": f"https://cdn.example/{task_id}.png"}}
+
+
+class FakeWriter:
+    def __init__(self) -> None:
+        self.images: list[PendingImage] = []
+
+    def submit(self, image: PendingImage) -> bool:
+        self.images.append(image)
+        return True
+
+
+def make_app(tmp_path: Path, writer: FakeWriter) -> tuple[FastAPI, FluxClient]:
+    submissions: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "cdn.example":
+            content = b"image " + request.url.path.encode()
+            return httpx.Response(200, content=content, headers={"content-type": "image/png"})
+        prompt = json.loads(request.content)["prompt"]
+        submissions.append(prompt)
+        return httpx.Response(200, json={"id": prompt})
+
+    client = FluxClient(api_key="key", settings=FluxClientSettings())
+    client.api._transport = httpx.MockTransport(handler)
+    client.download._transport = httpx.MockTransport(handler)
+    cache = ResultCache(directory=str(tmp_path), settings=ResultCacheSettings())
+    cache.load()
+    # Every generation of the first batch gets a token, the cache hit of the second does not need one
+    client_limits = KeyedTokenBuckets(ClientRateLimitSettings(CLIENT_RATE_LIMIT_BURST=3, CLIENT_RATE_LIMIT_TIMEOUT=0))
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_flux_client] = lambda: client
+    app.dependency_overrides[get_flux_poller] = FakePoller
+    app.dependency_overrides[get_result_cache] = lambda: cache
+    app.dependency_overrides[get_image_writer] = lambda: writer
+    app.dependency_overrides[get_client_buckets] = lambda: client_limits
+    app.state.submissions = submissions
+    return app, client
+
+
+def test_batch_results_stream_in_completion_order(tmp_path: Path) -> None:
+    writer = FakeWriter()
+
+    async def scenario() -> None:
+        app, client = make_app(tmp_path, writer)
+        batch = {
+            "items": [
+                {"request": {"prompt": "slow", "seed": 1, "output_format": "png"}, "model": "flux-dev"},
+                {"request": {"prompt": "fast", "output_format": "png"}},
+                {"request": {"prompt": "moderated"}},
+            ]
+        }
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as http:
+            response = await http.post("/api/v1/generate-images", json=batch)
+            assert response.headers["content-type"] == "application/x-ndjson"
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            assert [line["index"] for line in lines] == [1, 2, 0]
+            assert lines[1] == {"index": 2, "status_code": 400, "detail": "Request was moderated due to content policy"}
+            assert lines[2]["status_code"] == 200 and lines[2]["cache"] == "MISS"
+            assert [image.content for image in writer.images] == [b"image /fast.png", b"image /slow.png"]
+
+            # The seeded item is now cached
+            response = await http.post("/api/v1/generate-images", json={"items": batch["items"][:1]})
+            assert [json.loads(line) for line in response.text.splitlines()] == [{**lines[2], "cache": "HIT"}]
+
+            # The client used up its tokens
+            response = await http.post("/api/v1/generate-images", json={"items": batch["items"][1:2]})
+            [line] = [json.loads(line) for line in response.text.splitlines()]
+            assert line["status_code"] == 429 and line["retry_after"] > 0
+        assert sorted(app.state.submissions) == ["fast", "moderated", "slow"]
+        await client.aclose()
+
+    asyncio.run(scenario())
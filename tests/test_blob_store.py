@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import os
+
+from sqlalchemy import select
+
+from src.app.core.utils.blob_store import store_blob, store_blobs
+from src.app.core.utils.image_store import record_image
+from src.app.core.utils.retention import delete_image_record, remove_image_files
+from src.app.core.utils.uploads import StreamedFile
+from src.app.models.blob import Blob
+from src.app.models.image import Image
+from tests.conftest import RunWithDb
+
+CONTENT = b"\x89PNG same bytes"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+def streamed(directory: str, name: str) -> StreamedFile:
+    tmp_path = os.path.join(directory, f"{name}.part")
+    with open(tmp_path, "wb") as f:
+        f.write(CONTENT)
+    return StreamedFile("file", f"{name}.png", "image/png", tmp_path, size=len(CONTENT), sha256=SHA256)
+
+
+def stored_files(directory: str) -> list[str]:
+    return [name for _, _, names in os.walk(os.path.join(directory, "uploads")) for name in names]
+
+
+def test_same_content_is_stored_once_and_counted(directory: str, run_with_db: RunWithDb) -> None:
+    async def test(sessions) -> None:
+        async with sessions() as db:
+            blob, stored = await store_blob(db, streamed(directory, "first"), "png")
+            await db.commit()
+        assert stored and blob.ref_count == 1
+
+        async with sessions() as db:
+            blob, stored = await store_blob(db, streamed(directory, "second"), "png")
+            await db.commit()
+        assert not stored and blob.ref_count == 2
+
+        # Within one batch too
+        async with sessions() as db:
+            results = await store_blobs(
+                db, [(streamed(directory, "third"), "png"), (streamed(directory, "4th"), "png")]
+            )
+            await db.commit()
+        assert [stored for _, stored in results] == [False, False]
+        assert results[0][0].ref_count == 4
+
+    run_with_db(test)
+    assert stored_files(directory) == [f"{SHA256}.png"]
+    assert not [name for name in os.listdir(directory) if name.endswith(".part")]
+
+
+def test_deleting_every_image_releases_the_blob_and_its_file(directory: str, run_with_db: RunWithDb) -> None:
+    async def test(sessions) -> None:
+        async with sessions() as db:
+            for image_id in ("a", "b"):
+                blob, _ = await store_blob(db, streamed(directory, image_id), "png")
+                db.add(Image(id=image_id, file_path=blob.file_path, url=blob.url, blob_sha256=blob.sha256))
+            await db.commit()
+
+        async with sessions() as db:
+            deleted = await delete_image_record(db, "a")
+            await db.commit()
+        assert deleted is not None and deleted.file_path is None  # Still shared with "b"
+        remove_image_files(deleted)
+        assert stored_files(directory) == [f"{SHA256}.png"]
+        async with sessions() as db:
+            assert (await db.get(Blob, SHA256)).ref_count == 1
+
+        async with sessions() as db:
+            deleted = await delete_image_record(db, "b")
+            await db.commit()
+        assert deleted is not None and deleted.file_path is not None
+        remove_image_files(deleted)
+        async with sessions() as db:
+            assert (await db.execute(select(Blob))).first() is None
+
+    run_with_db(test)
+    assert stored_files(directory) == []
+
+
+def test_concurrent_records_of_an_image_share_its_row(directory: str, run_with_db: RunWithDb) -> None:
+    async def test(sessions) -> None:
+        async def record(content_type: str) -> Image:
+            async with sessions() as db:
+                return await record_image(db, "abcd", "ab/cd/abcd.png", content_type)
+
+        images = await asyncio.gather(*(record("image/png") for _ in range(4)), record("image/jpeg"))
+        assert {(image.id, image.content_type) for image in images} == {("abcd", images[0].content_type)}
+        async with sessions() as db:
+            assert len((await db.execute(select(Image))).scalars().all()) == 1
+
+    run_with_db(test)
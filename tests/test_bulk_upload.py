@@ -0,0 +1,77 @@
+import os
+from uuid import uuid4
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import select
+
+from src.app.api import router
+from src.app.core.db.database import get_db
+from src.app.core.utils.variants import get_variant_pipeline
+from src.app.models.blob import Blob
+from src.app.models.image import Image
+from tests.conftest import RunWithDb
+
+CONTENT = b"\x89PNG shared bytes"
+
+
+class FakePipeline:
+    """Records the images handed over for variants instead of rendering them."""
+
+    def __init__(self) -> None:
+        self.submitted: list[str] = []
+
+    def submit(self, image_id: str, source_path: str, source_key: str) -> bool:
+        self.submitted.append(image_id)
+        return True
+
+
+def test_each_file_is_reported_and_accepted_ones_are_stored_together(directory: str, run_with_db: RunWithDb) -> None:
+    taken, first, second = str(uuid4()), str(uuid4()), str(uuid4())
+    pipeline = FakePipeline()
+
+    async def scenario(sessions) -> dict:
+        async with sessions() as db:
+            db.add(Image(id=taken, file_path="elsewhere.png"))
+            await db.commit()
+
+        async def get_test_db():
+            async with sessions() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[get_db] = get_test_db
+        app.dependency_overrides[get_variant_pipeline] = lambda: pipeline
+
+        files = [
+            ("files", ("first.png", CONTENT, "image/png")),
+            ("files", ("second.png", CONTENT, "image/png")),
+            ("files", ("taken.png", CONTENT, "image/png")),
+            ("files", ("script.exe", b"MZ", "application/octet-stream")),
+            ("files", ("bad-id.png", CONTENT, "image/png")),
+        ]
+        data = {"ids": [first, f"{second},{taken}", str(uuid4()), "not-a-uuid"]}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            response = await client.post("/api/v1/upload", files=files, data=data)
+        assert response.status_code == 200
+
+        async with sessions() as db:
+            images = {image.id: image for image in (await db.execute(select(Image))).scalars()}
+            blobs = list((await db.execute(select(Blob))).scalars())
+
+        assert sorted(images) == sorted([taken, first, second])
+        assert len(blobs) == 1 and blobs[0].ref_count == 2
+        assert images[first].file_path == images[second].file_path == blobs[0].file_path
+        return response.json()
+
+    body = run_with_db(scenario)
+    assert body["uploaded"] == 2 and body["failed"] == 3
+    assert [result["status_code"] for result in body["results"]] == [200, 200, 400, 400, 400]
+    assert [result["deduplicated"] for result in body["results"][:2]] == [False, True]
+    assert body["results"][2]["detail"] == f"Image with ID {taken} already exists"
+    assert body["results"][3]["detail"] == "File type not allowed"
+    assert body["results"][4]["detail"] == "Invalid image ID not-a-uuid"
+    assert pipeline.submitted == [first, second]
+    # Nothing is left behind of the upload in progress
+    assert not [name for _, _, names in os.walk(directory) for name in names if name.endswith(".part")]
@@ -0,0 +1,80 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from src.app.api import router
+from src.app.api.v1 import images
+from src.app.core.utils.export import EXPORT_COLUMNS, csv_header, encode_csv, encode_ndjson, gzip_chunks
+from src.app.models.image import Image
+from tests.conftest import RunWithDb
+
+ROW = tuple(
+    datetime(2026, 10, 17, 9, 30) if name.endswith("_at") else (None if name == "blob_sha256" else f'{name}, "1"')
+    for name in EXPORT_COLUMNS
+)
+
+
+def test_rows_are_encoded_as_ndjson_and_csv() -> None:
+    line = json.loads(encode_ndjson([ROW]))
+    assert line["created_at"] == "2026-10-17T09:30:00"
+    assert line["blob_sha256"] is None
+    assert line["id"] == 'id, "1"'
+
+    rows = list(csv.reader(io.StringIO((csv_header() + encode_csv([ROW, ROW])).decode())))
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert len(rows) == 3
+    assert dict(zip(rows[0], rows[1]))["id"] == 'id, "1"'
+
+
+def test_gzip_chunks_form_one_gzip_stream() -> None:
+    async def chunks() -> AsyncIterator[bytes]:
+        for i in range(100):
+            yield f"line {i}\n".encode()
+
+    async def compress() -> bytes:
+        return b"".join([chunk async for chunk in gzip_chunks(chunks())])
+
+    assert gzip.decompress(asyncio.run(compress())) == "".join(f"line {i}\n" for i in range(100)).encode()
+
+
+def test_images_are_exported_oldest_first(run_with_db: RunWithDb, monkeypatch: pytest.MonkeyPatch) -> None:
+    created = datetime(2026, 10, 17, 9, 30)
+
+    async def scenario(sessions) -> None:
+        async with sessions() as db:
+            db.add_all(
+                Image(id=f"image-{n}", original_filename=f"fox, {n}.png", created_at=created + timedelta(n))
+                for n in (2, 0, 1)
+            )
+            await db.commit()
+        # The endpoint streams from the engine rather than through a session
+        monkeypatch.setattr(images, "async_engine", sessions.kw["bind"])
+
+        app = FastAPI()
+        app.include_router(router)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            response = await client.get("/api/v1/images/export")
+            assert response.headers["content-type"] == "application/x-ndjson"
+            assert response.headers["content-disposition"] == 'attachment; filename="images.ndjson"'
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            assert [line["id"] for line in lines] == ["image-0", "image-1", "image-2"]
+            assert lines[0]["created_at"] == created.isoformat()
+
+            params = {"format": "csv", "created_after": (created + timedelta(1)).isoformat(), "compress": "true"}
+            response = await client.get("/api/v1/images/export", params=params)
+            assert response.headers["content-disposition"] == 'attachment; filename="images.csv.gz"'
+            rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode())))
+            assert [(row["id"], row["original_filename"]) for row in rows] == [
+                ("image-1", "fox, 1.png"),
+                ("image-2", "fox, 2.png"),
+            ]
+
+    run_with_db(scenario)
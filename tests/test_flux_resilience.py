@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.app.core.config import FluxClientSettings
+from src.app.core.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from src.app.core.utils.flux import FluxClient
+from src.app.core.utils.generation import GenerationError, iter_sample, open_sample, passthrough_headers
+from src.app.core.utils.rate_limit import RateLimitExceeded
+from src.app.schemas.image import FluxModel, ImageGenerationRequest
+
+
+def make_client(handler, **overrides) -> FluxClient:
+    settings = FluxClientSettings(FLUX_RETRY_BACKOFF=0.001, **overrides)
+    client = FluxClient(api_key="key", settings=settings)
+    client.api._transport = httpx.MockTransport(handler)
+    client.download._transport = httpx.MockTransport(handler)
+    return client
+
+
+def test_breaker_opens_then_probes_and_closes() -> None:
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=60, open_duration=0.05)
+    for success in (True, False, True, False):
+        breaker.check()
+        breaker.record(success)
+    assert breaker.state == CircuitState.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.06)
+    breaker.check()
+    # Only one probe at a time while half open
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record(True)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_polls_are_retried_but_submissions_are_not() -> None:
+    calls = {"get_result": 0, "submit": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("get_result"):
+            calls["get_result"] += 1
+            if calls["get_result"] < 3:
+                raise httpx.ReadError("connection reset")
+            return httpx.Response(200, json={"status": "Ready"})
+        calls["submit"] += 1
+        raise httpx.ReadError("connection reset")
+
+    async def scenario() -> None:
+        client = make_client(handler)
+        assert (await client.get_result("task"))["status"] == "Ready"
+
+        with pytest.raises(httpx.ReadError):
+            await client.submit(FluxModel.FLUX_DEV, ImageGenerationRequest(prompt="a"))
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert calls == {"get_result": 3, "submit": 1}
+
+
+def test_every_attempt_takes_a_token() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503)
+
+    async def scenario() -> None:
+        client = make_client(handler, FLUX_POLL_BURST=2, FLUX_POLL_RATE=0.01)
+        # Two attempts use up the burst, the third finds no token
+        with pytest.raises(RateLimitExceeded):
+            await client.get_result("task", timeout=0.05)
+        assert client.poll_limiter.stats()["acquired"] == 2
+        await client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_slow_download_is_hedged() -> None:
+    requests = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal requests
+        requests += 1
+        if requests == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, content=b"image")
+
+    async def scenario() -> None:
+        client = make_client(handler, FLUX_HEDGE_DELAY=0.02)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await client.stream_sample("https://cdn.example/sample.jpeg")
+        assert await response.aread() == b"image"
+        assert loop.time() - started < 1
+        await response.aclose()
+        assert client.download_limiter.stats()["acquired"] == 2
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert requests == 2
+
+
+def test_hedged_sample_is_streamed_in_chunks_up_to_the_size_cap() -> None:
+    requests: list[str] = []
+
+    async def endless():
+        while True:
+            yield b"x" * 4
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        if request.url.path == "/slow.jpeg" and requests.count("/slow.jpeg") == 1:
+            await asyncio.sleep(5)
+        if request.url.path == "/large.jpeg":
+            return httpx.Response(200, content=b"x" * 100)
+        if request.url.path == "/endless.jpeg":
+            return httpx.Response(200, content=endless())
+        return httpx.Response(200, content=b"image")
+
+    async def scenario() -> None:
+        client = make_client(handler, FLUX_HEDGE_DELAY=0.02, FLUX_MAX_IMAGE_SIZE=16, FLUX_DOWNLOAD_CHUNK_SIZE=4)
+
+        response = await open_sample(client, "https://cdn.example/slow.jpeg", FluxModel.FLUX_DEV)
+        assert passthrough_headers(response) == {"Content-Length": "5"}
+        assert [chunk async for chunk in iter_sample(client, response)] == [b"imag", b"e"]
+        assert response.is_closed
+        assert requests.count("/slow.jpeg") == 2
+
+        # Rejected up front by its Content-Length
+        with pytest.raises(GenerationError) as exc_info:
+            await open_sample(client, "https://cdn.example/large.jpeg", FluxModel.FLUX_DEV)
+        assert exc_info.value.status_code == 502
+
+        # Cut off once it grows past the cap
+        response = await open_sample(client, "https://cdn.example/endless.jpeg", FluxModel.FLUX_DEV)
+        assert passthrough_headers(response) == {}
+        with pytest.raises(GenerationError):
+            async for _ in iter_sample(client, response):
+                pass
+        assert response.is_closed
+        await client.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+
+import httpx
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.routing import Mount
+
+from src.app.core.config import ClientSideCacheSettings
+from src.app.core.utils.http_cache import CachedStaticFiles, is_not_modified
+from src.app.core.utils.storage_layout import blob_filename, image_filename, variant_filename
+
+ETAG = '"c4f465c7"'
+LAST_MODIFIED = "Wed, 21 Oct 2026 07:28:00 GMT"
+IMAGE_ID = "9d4f1f0e-7c1a-4d5e-9a3b-2f6c8e0b1d47"
+
+
+def test_if_none_match_is_compared_weakly_and_accepts_any() -> None:
+    assert is_not_modified(Headers({"if-none-match": ETAG}), ETAG)
+    assert is_not_modified(Headers({"if-none-match": f'"other", W/{ETAG}'}), ETAG)
+    assert is_not_modified(Headers({"if-none-match": "*"}), ETAG)
+    assert not is_not_modified(Headers({"if-none-match": '"other"'}), ETAG)
+    assert not is_not_modified(Headers({}), ETAG)
+
+
+def test_if_modified_since_only_applies_without_if_none_match() -> None:
+    assert is_not_modified(Headers({"if-modified-since": LAST_MODIFIED}), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(Headers({"if-modified-since": "Tue, 20 Oct 2026 07:28:00 GMT"}), ETAG, LAST_MODIFIED)
+    headers = Headers({"if-none-match": '"other"', "if-modified-since": LAST_MODIFIED})
+    assert not is_not_modified(headers, ETAG, LAST_MODIFIED)
+    assert not is_not_modified(Headers({"if-modified-since": "not a date"}), ETAG, LAST_MODIFIED)
+
+
+def test_uploads_are_cached_by_whether_their_path_names_their_content(tmp_path: Path) -> None:
+    content = b"image"
+    sha256 = hashlib.sha256(content).hexdigest()
+    filenames = {
+        "blob": blob_filename(sha256, "png"),
+        "variant": variant_filename(sha256, "thumb", "webp"),
+        "image": image_filename(IMAGE_ID, "png"),
+    }
+    for filename in filenames.values():
+        os.makedirs(tmp_path / os.path.dirname(filename), exist_ok=True)
+        (tmp_path / filename).write_bytes(content)
+    settings = ClientSideCacheSettings(CLIENT_CACHE_MAX_AGE=60, CLIENT_CACHE_IMMUTABLE_MAX_AGE=3600)
+    app = Starlette(routes=[Mount("/uploads", CachedStaticFiles(directory=str(tmp_path), settings=settings))])
+
+    async def scenario() -> None:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            responses = {kind: await client.get(f"/uploads/{filename}") for kind, filename in filenames.items()}
+            assert responses["blob"].headers["cache-control"] == "public, max-age=3600, immutable"
+            assert responses["variant"].headers["cache-control"] == "public, max-age=3600, immutable"
+            assert responses["image"].headers["cache-control"] == "public, max-age=60"
+            # Every ETag is the hash of the content, named by the path of blobs and computed for other files
+            assert {response.headers["etag"] for response in responses.values()} == {f'"{sha256}"'}
+
+            # A flat URL from before files were sharded is served with the same policy
+            response = await client.get(f"/uploads/{IMAGE_ID}.png")
+            assert response.content == content and response.headers["cache-control"] == "public, max-age=60"
+
+            response = await client.get(f"/uploads/{filenames['image']}", headers={"If-None-Match": f'"{sha256}"'})
+            assert response.status_code == 304
+            assert response.headers["etag"] == f'"{sha256}"'
+            assert response.headers["cache-control"] == "public, max-age=60"
+            response = await client.get(f"/uploads/{filenames['image']}", headers={"If-None-Match": '"other"'})
+            assert response.status_code == 200
+
+    asyncio.run(scenario())
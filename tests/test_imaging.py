@@ -0,0 +1,39 @@
+import os
+
+from PIL import Image
+
+from src.app.core.utils.imaging import render_variants
+
+
+def test_variants_fit_their_size_and_keep_aspect_ratio(tmp_path) -> None:
+    source = tmp_path / "source.jpeg"
+    Image.new("RGB", (2000, 1000), (200, 10, 10)).save(source, "JPEG")
+    specs = [
+        ("thumb", 256, "webp", str(tmp_path / "v" / "thumb.webp")),
+        ("medium", 1024, "png", str(tmp_path / "v" / "medium.png")),
+    ]
+
+    results = {result["name"]: result for result in render_variants(str(source), specs, quality=80)}
+
+    assert (results["thumb"]["width"], results["thumb"]["height"]) == (256, 128)
+    assert (results["medium"]["width"], results["medium"]["height"]) == (1024, 512)
+    assert results["thumb"]["content_type"] == "image/webp"
+    with Image.open(specs[0][3]) as thumb:
+        assert thumb.format == "WEBP"
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path / "v"))
+
+
+def test_existing_variants_are_measured_not_rendered(tmp_path) -> None:
+    source = tmp_path / "source.png"
+    Image.new("RGBA", (100, 50), (1, 2, 3, 100)).save(source, "PNG")
+    target = tmp_path / "thumb.webp"
+    specs = [("thumb", 64, "webp", str(target))]
+
+    (first,) = render_variants(str(source), specs, quality=80)
+    mtime = target.stat().st_mtime_ns
+    (second,) = render_variants(str(source), specs, quality=80)
+
+    assert first == second
+    assert target.stat().st_mtime_ns == mtime
+    with Image.open(target) as thumb:
+        assert thumb.mode == "RGBA"
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from typing import Any
+
+import httpx
+import pytest
+from arq.jobs import JobResult, JobStatus
+from fastapi import FastAPI
+
+from src.app.api import router
+from src.app.api.v1 import jobs
+from src.app.api.v1.jobs import get_job
+from src.app.core.config import ClientRateLimitSettings, FluxClientSettings, settings
+from src.app.core.utils import queue
+from src.app.core.utils.flux import FluxClient, get_flux_client
+from src.app.core.utils.generation import GenerationError
+from src.app.core.utils.image_store import get_image_writer
+from src.app.core.utils.poller import get_flux_poller
+from src.app.core.utils.rate_limit import KeyedTokenBuckets, get_client_buckets
+from src.app.core.utils.result_cache import get_result_cache
+from src.app.core.utils.storage import LocalStorage
+from src.app.core.worker import functions
+from src.app.schemas.image import FluxModel
+from tests.conftest import RunWithDb
+
+NOW = datetime(2026, 10, 17, 9, 30)
+
+
+class FakeJob:
+    def __init__(self, job_id: str, status: JobStatus = JobStatus.queued, result: Any = None, success: bool = True):
+        self.job_id = job_id
+        self._status = status
+        self._result = result
+        self._success = success
+
+    async def status(self) -> JobStatus:
+        return self._status
+
+    async def result_info(self) -> JobResult | None:
+        if self._status != JobStatus.complete:
+            return None
+        return JobResult(
+            function="generate_image_task",
+            args=(),
+            kwargs={},
+            job_try=1,
+            enqueue_time=NOW,
+            score=None,
+            job_id=self.job_id,
+            success=self._success,
+            result=self._result,
+            start_time=NOW,
+            finish_time=NOW,
+            queue_name="arq:queue",
+        )
+
+
+class FakePool:
+    """Records enqueued jobs instead of sending them to Redis."""
+
+    def __init__(self) -> None:
+        self.enqueued: list[tuple[str, tuple[Any, ...]]] = []
+
+    async def enqueue_job(self, function: str, *args: Any) -> FakeJob:
+        self.enqueued.append((function, args))
+        return FakeJob(f"job-{len(self.enqueued)}")
+
+
+def make_app(jobs_by_id: dict[str, FakeJob], client_limits: KeyedTokenBuckets | None = None) -> FastAPI:
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_job] = lambda job_id: jobs_by_id[job_id]
+    limits = client_limits if client_limits is not None else KeyedTokenBuckets(ClientRateLimitSettings())
+    app.dependency_overrides[get_client_buckets] = lambda: limits
+    # Queued generations never reach the Flux pipeline
+    for dependency in (get_flux_client, get_flux_poller, get_result_cache, get_image_writer):
+        app.dependency_overrides[dependency] = lambda: None
+    return app
+
+
+def request(app: FastAPI, method: str, url: str, **kwargs: Any) -> httpx.Response:
+    async def send() -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return await client.request(method, url, **kwargs)
+
+    return asyncio.run(send())
+
+
+def test_async_generation_is_enqueued(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = FakePool()
+    monkeypatch.setattr(queue, "pool", pool)
+
+    response = request(
+        make_app({}), "POST", "/api/v1/generate-image?async=true&model=flux-dev", json={"prompt": "A red fox"}
+    )
+    assert response.status_code == 202
+    assert response.json() == {"id": "job-1", "status": "queued"}
+    [(function, (payload, model))] = pool.enqueued
+    assert function == "generate_image_task"
+    assert payload["prompt"] == "A red fox" and model == "flux-dev"
+
+    # Queued generations count against the rate limit of their client
+    limits = ClientRateLimitSettings(CLIENT_RATE_LIMIT_BURST=1, CLIENT_RATE_LIMIT_TIMEOUT=0)
+    app = make_app({}, KeyedTokenBuckets(limits))
+    headers = {"X-API-Key": "client-a"}
+    assert request(app, "POST", "/api/v1/generate-image?async=true", json={"prompt": "a"}, headers=headers).is_success
+    response = request(app, "POST", "/api/v1/generate-image?async=true", json={"prompt": "b"}, headers=headers)
+    assert response.status_code == 429 and "Retry-After" in response.headers
+    assert request(app, "POST", "/api/v1/generate-image?async=true", json={"prompt": "c"}).is_success
+    assert len(pool.enqueued) == 3
+
+    monkeypatch.setattr(queue, "pool", None)
+    response = request(make_app({}), "POST", "/api/v1/generate-image?async=true", json={"prompt": "A red fox"})
+    assert response.status_code == 503
+
+
+def test_job_status_and_result(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalStorage(directory)
+        monkeypatch.setattr(jobs, "storage", storage)
+        storage.put_bytes("ab/cd/abcd.png", b"image", "image/png")
+        image = {
+            "id": "abcd",
+            "url": "http://t/uploads/ab/cd/abcd.png",
+            "filename": "ab/cd/abcd.png",
+            "file_path": storage.location("ab/cd/abcd.png"),
+            "content_type": "image/png",
+            "size": 5,
+            "variants": {},
+        }
+        app = make_app(
+            {
+                "running": FakeJob("running", JobStatus.in_progress),
+                "done": FakeJob("done", JobStatus.complete, image),
+                "moderated": FakeJob(
+                    "moderated", JobStatus.complete, GenerationError("Request was moderated", 400), success=False
+                ),
+            }
+        )
+
+        response = request(app, "GET", "/api/v1/jobs/running/result")
+        assert response.status_code == 202
+        assert response.json() == {"id": "running", "status": "in_progress"}
+        assert response.headers["Retry-After"] == str(settings.GENERATION_JOB_RETRY_AFTER)
+
+        status = request(app, "GET", "/api/v1/jobs/done").json()
+        assert status["status"] == "complete" and status["success"]
+        assert status["image_id"] == "abcd" and status["url"] == image["url"]
+
+        response = request(app, "GET", "/api/v1/jobs/done/result")
+        assert response.status_code == 200
+        assert response.content == b"image"
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["X-Image-Id"] == "abcd"
+
+        status = request(app, "GET", "/api/v1/jobs/moderated").json()
+        assert not status["success"] and status["error"] == "Request was moderated"
+        response = request(app, "GET", "/api/v1/jobs/moderated/result")
+        assert response.status_code == 400 and response.text == "Request was moderated"
+
+        os.remove(image["file_path"])
+        assert request(app, "GET", "/api/v1/jobs/done/result").status_code == 404
+
+
+class FakePoller:
+    async def wait(self, task_id: str, model: FluxModel) -> dict[str, Any]:
+        return {"status": "Ready", "result": {"sample": "https://cdn.example/sample.jpeg"}}
+
+
+class FakeVariantPipeline:
+    async def process(self, image_id: str, source_path: str, source_key: str) -> list:
+        return []
+
+
+def test_queued_generation_is_stored_under_the_type_it_came_in(
+    directory: str, run_with_db: RunWithDb, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "cdn.example":
+            return httpx.Response(200, content=b"jpeg image", headers={"content-type": "image/jpeg"})
+        return httpx.Response(200, json={"id": "task"})
+
+    async def scenario(sessions) -> dict[str, Any]:
+        monkeypatch.setattr(functions, "AsyncSessionLocal", sessions)
+        client = FluxClient(api_key="key", settings=FluxClientSettings())
+        client.api._transport = httpx.MockTransport(handler)
+        client.download._transport = httpx.MockTransport(handler)
+        ctx = {"flux_client": client, "flux_poller": FakePoller(), "variant_pipeline": FakeVariantPipeline()}
+        try:
+            return await functions.generate_image_task(ctx, {"prompt": "A red fox", "output_format": "png"}, "flux-dev")
+        finally:
+            await client.aclose()
+
+    monkeypatch.setattr(functions, "storage", LocalStorage(settings.UPLOAD_DIR))
+    image = run_with_db(scenario)
+    # PNG was asked for, but upstream sent a JPEG
+    assert image["filename"].endswith(f"{image['id']}.jpeg") and image["content_type"] == "image/jpeg"
+    with open(image["file_path"], "rb") as f:
+        assert f.read() == b"jpeg image"
+    assert not [name for _, _, names in os.walk(directory) for name in names if name.endswith(".part")]
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import logging
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from src.app.core.logger import JsonFormatter, RequestIdFilter, SamplingFilter, request_id
+from src.app.middleware.request_id_middleware import RequestIdMiddleware
+
+
+def record(name: str, level: int = logging.INFO, **extra: object) -> logging.LogRecord:
+    log_record = logging.LogRecord(name, level, __file__, 1, "polled %s", ("task-1",), None)
+    log_record.__dict__.update(extra)
+    return log_record
+
+
+def test_sampling_applies_to_children_and_keeps_warnings() -> None:
+    sampling = SamplingFilter({"httpx": 0.0, "src.app": 1.0})
+    assert not sampling.filter(record("httpx"))
+    assert not sampling.filter(record("httpx._client"))
+    assert sampling.filter(record("httpx", logging.WARNING))
+    assert sampling.filter(record("src.app.core.utils.poller"))
+    assert sampling.filter(record("other"))
+
+    line = json.loads(JsonFormatter().format(record("httpx", image_id="abc", request_id="r-1")))
+    assert line["message"] == "polled task-1"
+    assert line["request_id"] == "r-1"
+    assert line["image_id"] == "abc"
+
+
+def test_request_id_is_set_while_handling_requests() -> None:
+    async def endpoint(request: Request) -> PlainTextResponse:
+        log_record = record("src.app")
+        RequestIdFilter().filter(log_record)
+        return PlainTextResponse(log_record.request_id)
+
+    app = RequestIdMiddleware(Starlette(routes=[Route("/", endpoint)]))
+
+    async def get(headers: dict[str, str]) -> httpx.Response:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return await client.get("/", headers=headers)
+
+    response = asyncio.run(get({"X-Request-ID": "abc-123"}))
+    assert response.text == response.headers["X-Request-ID"] == "abc-123"
+
+    response = asyncio.run(get({"X-Request-ID": "not valid\t"}))
+    assert response.text == response.headers["X-Request-ID"] != "not valid\t"
+    assert len(response.text) == 32
+    assert request_id.get() == "-"
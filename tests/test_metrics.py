@@ -0,0 +1,19 @@
+from prometheus_client import CollectorRegistry, generate_latest
+
+from src.app.core.utils.circuit_breaker import CircuitBreaker
+from src.app.core.utils.metrics import ComponentStatsCollector
+from src.app.core.utils.rate_limit import TokenBucket
+
+
+def test_component_stats_are_read_at_scrape_time() -> None:
+    breaker = CircuitBreaker(failure_rate=0.5, min_calls=2, window=60, open_duration=30)
+    bucket = TokenBucket(rate=1, burst=1, max_queue=10)
+    registry = CollectorRegistry()
+    registry.register(ComponentStatsCollector(lambda: {"breaker": breaker.stats(), "limiter": bucket.stats()}))
+
+    assert b"breaker_state 0.0" in generate_latest(registry)
+    breaker.record(False)
+    breaker.record(False)
+    output = generate_latest(registry)
+    assert b"breaker_state 2.0" in output
+    assert b"limiter_queued 0.0" in output
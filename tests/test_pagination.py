@@ -0,0 +1,76 @@
+from datetime import UTC, datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from src.app.api import router
+from src.app.core.db.database import get_db
+from src.app.core.utils.pagination import as_naive_utc, decode_cursor, encode_cursor
+from src.app.models.image import Image
+from tests.conftest import RunWithDb
+
+
+def test_cursor_round_trips() -> None:
+    created_at = datetime(2026, 10, 17, 9, 30, 15, 123456)
+    cursor = encode_cursor(created_at, "3f2b7c1e-0000-4000-8000-000000000000")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "3f2b7c1e-0000-4000-8000-000000000000")
+
+    for invalid in ("not a cursor!", "Zm9v", ""):
+        with pytest.raises(HTTPException) as exc_info:
+            decode_cursor(invalid)
+        assert exc_info.value.status_code == 400
+
+
+def test_filters_are_compared_as_naive_utc() -> None:
+    naive = datetime(2026, 10, 17, 9, 30)
+    assert as_naive_utc(naive) == naive
+    assert as_naive_utc(naive.replace(tzinfo=UTC)) == naive
+    assert as_naive_utc(datetime(2026, 10, 17, 11, 30, tzinfo=timezone(timedelta(hours=2)))) == naive
+    assert as_naive_utc(None) is None
+
+
+def test_images_are_listed_newest_first_a_page_at_a_time(run_with_db: RunWithDb) -> None:
+    created = datetime(2026, 10, 17, 9, 30)
+    # Two images share a timestamp, pages must neither repeat nor skip either of them
+    images = [
+        Image(id=f"image-{n}", content_type="image/png" if n % 2 else "image/jpeg", created_at=created + timedelta(n))
+        for n in range(5)
+    ] + [Image(id="image-3b", content_type="image/jpeg", created_at=created + timedelta(3))]
+
+    async def scenario(sessions) -> None:
+        async with sessions() as db:
+            db.add_all(images)
+            await db.commit()
+
+        async def get_test_db():
+            async with sessions() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[get_db] = get_test_db
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+
+            async def list_ids(**params) -> list[list[str]]:
+                pages = []
+                while True:
+                    response = await client.get("/api/v1/images", params={"limit": 2, **params})
+                    assert response.status_code == 200
+                    body = response.json()
+                    pages.append([item["id"] for item in body["items"]])
+                    if body["next_cursor"] is None:
+                        return pages
+                    params["cursor"] = body["next_cursor"]
+
+            assert await list_ids() == [["image-4", "image-3b"], ["image-3", "image-2"], ["image-1", "image-0"]]
+            assert await list_ids(content_type="image/jpeg") == [["image-4", "image-3b"], ["image-2", "image-0"]]
+            after, before = (created + timedelta(1)).isoformat(), (created + timedelta(3)).isoformat()
+            assert await list_ids(created_after=after, created_before=before) == [["image-2", "image-1"]]
+
+            response = await client.get("/api/v1/images", params={"cursor": "not a cursor!"})
+            assert response.status_code == 400
+
+    run_with_db(scenario)
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from src.app.core.config import FluxPollerSettings
+from src.app.core.utils.poller import EWMA_ALPHA, FluxPoller
+from src.app.schemas.image import FluxModel
+
+
+class FakeClient:
+    """Answers `get_result` with `Ready` once a task was polled `polls[task_id]` times, after `delays[task_id]`."""
+
+    def __init__(self, polls: dict[str, int], delays: dict[str, float] | None = None) -> None:
+        self.polls = polls
+        self.delays = delays or {}
+        self.calls: dict[str, int] = {}
+
+    async def get_result(self, task_id: str, timeout: float | None = None) -> dict[str, Any]:
+        self.calls[task_id] = self.calls.get(task_id, 0) + 1
+        await asyncio.sleep(self.delays.get(task_id, 0))
+        if self.calls[task_id] >= self.polls.get(task_id, 1):
+            return {"status": "Ready", "result": {"sample": f"https://cdn.example/{task_id}.jpg"}}
+        return {"status": "Pending"}
+
+
+def make_poller(client: FakeClient, **overrides: Any) -> FluxPoller:
+    settings = FluxPollerSettings(
+        FLUX_POLL_MIN_INTERVAL=0.01,
+        FLUX_POLL_MAX_INTERVAL=0.02,
+        FLUX_POLL_JITTER=0,
+        FLUX_POLL_EXPECTED_DURATION=0.01,
+        **overrides,
+    )
+    return FluxPoller(client=client, settings=settings)  # type: ignore[arg-type]
+
+
+def test_slow_poll_does_not_hold_up_other_tasks() -> None:
+    async def run() -> float:
+        client = FakeClient(polls={"slow": 1, "fast": 3}, delays={"slow": 1.0})
+        poller = make_poller(client)
+        poller.start()
+        slow = asyncio.create_task(poller.wait("slow", FluxModel.FLUX_DEV))
+        await asyncio.sleep(0.05)  # The poll of "slow" is in flight
+        started = asyncio.get_running_loop().time()
+        result = await poller.wait("fast", FluxModel.FLUX_DEV)
+        elapsed = asyncio.get_running_loop().time() - started
+        assert result["status"] == "Ready"
+        assert client.calls["slow"] == 1  # Not polled again while its poll is in flight
+        await slow
+        await poller.stop()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+
+
+def test_expected_duration_is_learned_and_waits_clean_up() -> None:
+    async def run() -> None:
+        client = FakeClient(polls={"done": 1, "stuck": 1000})
+        poller = make_poller(client, FLUX_POLL_DEADLINE=0.1)
+        poller.start()
+
+        previous = poller.expected_duration(FluxModel.FLUX_DEV)
+        started = asyncio.get_running_loop().time()
+        await poller.wait("done", FluxModel.FLUX_DEV)
+        elapsed = asyncio.get_running_loop().time() - started
+        expected = poller.expected_duration(FluxModel.FLUX_DEV)
+        assert expected == pytest.approx((1 - EWMA_ALPHA) * previous + EWMA_ALPHA * elapsed, abs=0.01)
+        # Other models keep the initial guess
+        assert poller.expected_duration(FluxModel.FLUX_PRO) == previous
+
+        with pytest.raises(TimeoutError):
+            await poller.wait("stuck", FluxModel.FLUX_DEV)
+        assert poller._pending == {}
+        await poller.stop()
+        assert poller._polls == set()
+
+    asyncio.run(run())
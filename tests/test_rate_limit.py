@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from src.app.core.config import ClientRateLimitSettings
+from src.app.core.utils.rate_limit import KeyedTokenBuckets, RateLimitExceeded, TokenBucket
+
+
+def test_burst_is_served_immediately_then_rate_applies() -> None:
+    async def scenario() -> None:
+        bucket = TokenBucket(rate=50, burst=5, max_queue=100)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        waits = await asyncio.gather(*(bucket.acquire() for _ in range(10)))
+        elapsed = loop.time() - started
+
+        assert waits[:5] == [0.0] * 5
+        # Five more tokens at 50/s take about 0.1s
+        assert 0.08 <= elapsed < 0.3
+        assert bucket.stats()["acquired"] == 10
+        assert bucket.stats()["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_served_in_arrival_order() -> None:
+    async def scenario() -> None:
+        bucket = TokenBucket(rate=100, burst=1, max_queue=100)
+        order: list[int] = []
+
+        async def take(i: int) -> None:
+            await bucket.acquire()
+            order.append(i)
+
+        tasks = []
+        for i in range(8):
+            tasks.append(asyncio.create_task(take(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == list(range(8))
+
+    asyncio.run(scenario())
+
+
+def test_timeout_and_full_queue_raise() -> None:
+    async def scenario() -> None:
+        bucket = TokenBucket(rate=1, burst=1, max_queue=1)
+        await bucket.acquire()
+
+        with pytest.raises(RateLimitExceeded):
+            await bucket.acquire(timeout=0.05)
+
+        waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceeded):
+            await bucket.acquire()
+        waiter.cancel()
+
+        stats = bucket.stats()
+        assert stats["timeouts"] == 1
+        assert stats["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_token_handed_back_by_a_late_waiter_does_not_overfill() -> None:
+    async def scenario() -> None:
+        bucket = TokenBucket(rate=1, burst=1, max_queue=1)
+        # The waiter was granted a token and gave up in the same loop iteration, while the bucket refilled
+        granted: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        granted.set_result(None)
+        bucket._waiters.append(granted)
+        bucket._abandon(granted)
+        assert bucket._tokens == 1
+
+    asyncio.run(scenario())
+
+
+def test_pause_holds_tokens_back() -> None:
+    async def scenario() -> None:
+        bucket = TokenBucket(rate=1000, burst=10, max_queue=100)
+        bucket.pause(0.1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bucket.acquire()
+        assert loop.time() - started >= 0.1
+
+    asyncio.run(scenario())
+
+
+def test_each_key_has_its_own_bucket() -> None:
+    async def scenario() -> None:
+        buckets = KeyedTokenBuckets(
+            ClientRateLimitSettings(CLIENT_RATE_LIMIT_RATE=1, CLIENT_RATE_LIMIT_BURST=2, CLIENT_RATE_LIMIT_TIMEOUT=0)
+        )
+        await buckets.acquire("key:a")
+        await buckets.acquire("key:a")
+        with pytest.raises(RateLimitExceeded):
+            await buckets.acquire("key:a")
+        # Another client still has its burst
+        assert await buckets.acquire("ip:10.0.0.1") == 0.0
+        assert buckets.stats()["keys"] == 2
+        assert buckets.stats()["timeouts"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_idle_buckets_are_dropped() -> None:
+    async def scenario() -> None:
+        buckets = KeyedTokenBuckets(
+            ClientRateLimitSettings(
+                CLIENT_RATE_LIMIT_RATE=1, CLIENT_RATE_LIMIT_BURST=1, CLIENT_RATE_LIMIT_MAX_CLIENTS=2
+            )
+        )
+        await buckets.acquire("a")
+        waiter = asyncio.create_task(buckets.acquire("a"))  # "a" is empty and has a caller waiting
+        await asyncio.sleep(0)
+        await buckets.acquire("b")
+        await buckets.acquire("c")
+        # "a" is least recently used but busy, so "b" goes
+        assert list(buckets._buckets) == ["a", "c"]
+        assert buckets.stats()["evicted"] == 1
+
+        for key in ("d", "e", "f"):
+            buckets.bucket(key)
+        assert list(buckets._buckets) == ["a", "f"]
+
+        # The newest bucket is never the one dropped, and the cap holds when every bucket is busy
+        await buckets.acquire("f")
+        other = asyncio.create_task(buckets.acquire("f"))
+        await asyncio.sleep(0)
+        assert buckets.bucket("g") is buckets._buckets["g"]
+        assert list(buckets._buckets) == ["f", "g"]
+        waiter.cancel()
+        other.cancel()
+
+    asyncio.run(scenario())
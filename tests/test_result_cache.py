@@ -0,0 +1,99 @@
+import asyncio
+import os
+from pathlib import Path
+
+from src.app.core.config import ResultCacheSettings
+from src.app.core.utils.generation import tee
+from src.app.core.utils.result_cache import ResultCache
+
+
+def make_cache(directory: Path, **overrides: int) -> ResultCache:
+    settings = ResultCacheSettings(
+        **{
+            "RESULT_CACHE_MEMORY_SIZE": 100,
+            "RESULT_CACHE_DISK_SIZE": 250,
+            "RESULT_CACHE_MAX_ENTRY_SIZE": 100,
+            "RESULT_CACHE_TTL": 60,
+            **overrides,
+        }
+    )
+    cache = ResultCache(directory=str(directory), settings=settings)
+    cache.load()
+    return cache
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        cache = make_cache(tmp_path)
+        await cache.put("a", b"a" * 40, "image/png")
+        await cache.put("b", b"b" * 40, "image/png")
+        assert await cache.get("a") is not None
+        await cache.put("c", b"c" * 40, "image/png")
+
+        assert cache.stats()["memory_entries"] == 2
+        # "b" was evicted from memory but is still served from disk
+        image = await cache.get("b")
+        assert image is not None and image.content == b"b" * 40
+        assert cache.disk_hits == 1
+
+    asyncio.run(scenario())
+
+
+def test_disk_tier_is_bounded_by_size(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        cache = make_cache(tmp_path)
+        for key in "abcd":
+            await cache.put(key, key.encode() * 80, "image/jpeg")
+
+        assert cache.stats()["disk_bytes"] <= 250
+        assert sorted(os.listdir(tmp_path)) == ["b.jpeg", "c.jpeg", "d.jpeg"]
+
+    asyncio.run(scenario())
+
+
+def test_expired_entries_are_misses(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        cache = make_cache(tmp_path, RESULT_CACHE_TTL=-1)
+        await cache.put("a", b"a", "image/png")
+        assert await cache.get("a") is None
+        assert cache.misses == 1
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(scenario())
+
+
+def test_disk_entries_survive_restart(tmp_path: Path) -> None:
+    async def scenario() -> None:
+        await make_cache(tmp_path).put("a", b"a" * 10, "image/png")
+        image = await make_cache(tmp_path).get("a")
+        assert image is not None and image.media_type == "image/png"
+
+    asyncio.run(scenario())
+
+
+def test_tee_caches_only_complete_bodies(tmp_path: Path) -> None:
+    async def chunks(*parts: bytes):
+        for part in parts:
+            yield part
+
+    async def scenario() -> None:
+        cache = make_cache(tmp_path)
+
+        def put(key: str):
+            return lambda content: cache.put(key, content, "image/png")
+
+        assert [c async for c in tee(chunks(b"ab", b"cd"), 100, put("a"))] == [b"ab", b"cd"]
+        image = await cache.get("a")
+        assert image is not None and image.content == b"abcd"
+
+        # Too large to collect, but still streamed in full
+        assert [c async for c in tee(chunks(b"x" * 60, b"y" * 60), 100, put("big"))] == [b"x" * 60, b"y" * 60]
+        assert await cache.get("big") is None
+
+        # A client that goes away mid-stream leaves nothing behind
+        stream = tee(chunks(b"ab", b"cd"), 100, put("cut"))
+        assert await anext(stream) == b"ab"
+        await stream.aclose()
+        assert await cache.get("cut") is None
+
+    asyncio.run(scenario())
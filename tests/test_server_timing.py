@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from src.app.core.utils import server_timing
+from src.app.middleware.client_cache_middleware import ClientCacheMiddleware
+from src.app.middleware.process_time_middleware import ProcessTimeMiddleware
+
+
+async def generate(request) -> PlainTextResponse:
+    server_timing.handler_started()
+    with server_timing.phase("poll"):
+        await asyncio.sleep(0.02)
+    with server_timing.phase("submit"):
+        pass
+    with server_timing.phase("poll"):
+        await asyncio.sleep(0.01)
+    return PlainTextResponse("ok")
+
+
+async def cached(request) -> PlainTextResponse:
+    return PlainTextResponse("ok", headers={"Cache-Control": "public, max-age=60"})
+
+
+def test_phases_are_summed_and_reported_in_order() -> None:
+    app = Starlette(routes=[Route("/generate", generate), Route("/cached", cached)])
+    app.add_middleware(ClientCacheMiddleware)
+    app.add_middleware(ProcessTimeMiddleware)
+
+    async def scenario() -> None:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/generate")
+            metrics = [metric.split(";") for metric in response.headers["server-timing"].split(", ")]
+            assert [metric[0] for metric in metrics] == ["validation", "submit", "poll", "total"]
+            # asyncio wakes sleepers up to a clock tick early, so allow a millisecond of slack
+            assert float(metrics[2][1].removeprefix("dur=")) >= 29
+            assert float(response.headers["x-process-time"]) >= 0.029
+            assert response.headers["cache-control"] == "no-store"
+
+            response = await client.get("/cached")
+            assert response.headers["cache-control"] == "public, max-age=60"
+
+    asyncio.run(scenario())
+
+
+def test_phase_outside_of_a_request_does_nothing() -> None:
+    with server_timing.phase("db"):
+        pass
+    server_timing.handler_started()
@@ -0,0 +1,77 @@
+import hashlib
+import os
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from src.app.core.utils.image_store import image_file_path, image_url
+from src.app.core.utils.storage_layout import blob_filename, image_filename, variant_filename
+from src.app.models.blob import Blob
+from src.app.models.image import Image
+from src.app.models.image_variant import ImageVariant
+from src.scripts import shard_uploads
+from tests.conftest import RunWithDb
+
+CONTENT = b"\x89PNG flat bytes"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+def write(filename: str) -> str:
+    path = image_file_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    return path
+
+
+def flat_row(model, path: str, **columns):
+    return model(file_path=image_file_path(path), url=image_url(path), **columns)
+
+
+def test_flat_files_are_moved_into_shards(run_with_db: RunWithDb, monkeypatch: pytest.MonkeyPatch) -> None:
+    owned, shared, missing = str(uuid4()), str(uuid4()), str(uuid4())
+    flat = {
+        "image": write(f"{owned}.png"),
+        "blob": write(f"blobs/{SHA256}.png"),
+        "variant": write(f"variants/{SHA256}/thumb.webp"),
+    }
+
+    async def scenario(sessions) -> None:
+        async with sessions() as db:
+            db.add_all(
+                [
+                    flat_row(Image, f"{owned}.png", id=owned, filename=f"{owned}.png"),
+                    flat_row(Blob, f"blobs/{SHA256}.png", sha256=SHA256, filename=f"blobs/{SHA256}.png", ref_count=1),
+                    flat_row(Image, f"blobs/{SHA256}.png", id=shared, blob_sha256=SHA256),
+                    flat_row(Image, f"{missing}.png", id=missing, filename=f"{missing}.png"),
+                ]
+            )
+            await db.flush()
+            db.add(flat_row(ImageVariant, f"variants/{SHA256}/thumb.webp", image_id=shared, name="thumb"))
+            await db.commit()
+
+        monkeypatch.setattr(shard_uploads, "AsyncSessionLocal", sessions)
+        monkeypatch.setattr(shard_uploads, "async_engine", sessions.kw["bind"])
+        # Running again after an interruption, or after it finished, changes nothing more
+        for _ in range(2):
+            await shard_uploads.migrate(batch_size=2, concurrency=2)
+
+        async with sessions() as db:
+            images = {image.id: image for image in (await db.execute(select(Image))).scalars()}
+            blob = await db.get(Blob, SHA256)
+            variant = (await db.execute(select(ImageVariant))).scalar_one()
+
+        assert images[owned].filename == image_filename(owned, "png")
+        assert images[owned].url == image_url(image_filename(owned, "png"))
+        assert blob.file_path == images[shared].file_path == image_file_path(blob_filename(SHA256, "png"))
+        assert variant.file_path == image_file_path(variant_filename(SHA256, "thumb", "webp"))
+        # Rows whose file is gone are left as they are
+        assert images[missing].file_path == image_file_path(f"{missing}.png")
+
+    run_with_db(scenario)
+    for filename in (image_filename(owned, "png"), blob_filename(SHA256, "png")):
+        assert os.path.exists(image_file_path(filename))
+    assert os.path.exists(image_file_path(variant_filename(SHA256, "thumb", "webp")))
+    assert not [path for path in flat.values() if os.path.exists(path)]
+    assert not os.path.exists(image_file_path(f"variants/{SHA256}"))
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from src.app.core.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution() -> None:
+    calls = 0
+
+    async def work() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def scenario() -> None:
+        flights: SingleFlight[str] = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        assert results == ["done"] * 5
+        assert calls == 1
+        assert not flights.in_flight("key")
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_shared_call() -> None:
+    async def scenario() -> None:
+        flights: SingleFlight[str] = SingleFlight()
+        release = asyncio.Event()
+
+        async def work() -> str:
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flights.do("key", work))
+        second = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+
+def test_call_is_cancelled_when_every_caller_is_gone() -> None:
+    async def scenario() -> None:
+        flights: SingleFlight[None] = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work() -> None:
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flights.do("key", work))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert not flights.in_flight("key")
+
+    asyncio.run(scenario())
+
+
+def test_errors_are_shared() -> None:
+    async def work() -> None:
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def scenario() -> None:
+        flights: SingleFlight[None] = SingleFlight()
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(scenario())
@@ -0,0 +1,112 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.app.core.config import ObjectStorageSettings
+from src.app.core.utils.storage import LocalStorage, S3Storage
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+def test_local_storage_round_trip() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalStorage(directory)
+        staged = storage.staging_path("ab/cd/abcd.png")
+        with open(staged, "wb") as f:
+            f.write(b"image")
+        storage.put_file(staged, "ab/cd/abcd.png", "image/png")
+        storage.put_bytes("variants/ab/cd/abcd/thumb.webp", b"thumb", "image/webp")
+
+        location = storage.location("ab/cd/abcd.png")
+        assert storage.filename(location) == "ab/cd/abcd.png"
+        assert storage.fetch("ab/cd/abcd.png") == location
+        assert storage.redirect("ab/cd/abcd.png") is None
+
+        storage.delete_directory("variants/ab/cd/abcd")
+        storage.delete("ab/cd/abcd.png")
+        assert not storage.exists("ab/cd/abcd.png")
+        assert not storage.exists("variants/ab/cd/abcd/thumb.webp")
+        with pytest.raises(FileNotFoundError):
+            storage.fetch("ab/cd/abcd.png")
+
+
+def test_local_storage_lists_files_but_not_caches() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalStorage(directory)
+        storage.put_bytes("ab/cd/abcd.png", b"image", "image/png")
+        storage.put_bytes("variants/ab/cd/abcd/thumb.webp", b"thumb", "image/webp")
+        storage.put_bytes(".transforms/ab/cd/abcd-256.webp", b"cached", "image/webp")
+        storage.put_bytes(".gitkeep", b"", None)
+        storage.put_bytes("ab/.DS_Store", b"finder", None)
+
+        files = {file.filename: file for file in storage.iter_files()}
+        assert sorted(files) == ["ab/cd/abcd.png", "variants/ab/cd/abcd/thumb.webp"]
+        assert files["ab/cd/abcd.png"].size == 5
+        assert storage.size("ab/cd/abcd.png") == 5
+        assert storage.size("ab/cd/missing.png") is None
+
+
+def test_local_storage_concurrent_writes_of_a_file_do_not_interleave() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalStorage(directory)
+        contents = [bytes([n]) * 1024 * 1024 for n in range(8)]
+        with ThreadPoolExecutor(max_workers=len(contents)) as executor:
+            list(executor.map(lambda content: storage.put_bytes("ab/cd/abcd.png", content, "image/png"), contents))
+
+        with open(storage.location("ab/cd/abcd.png"), "rb") as f:
+            assert f.read() in contents
+        assert os.listdir(storage.location("ab/cd")) == ["abcd.png"]
+
+
+def test_s3_storage_uploads_in_parts_and_redirects_reads() -> None:
+    moto = pytest.importorskip("moto")
+    with moto.mock_aws(), tempfile.TemporaryDirectory() as directory:
+        settings = ObjectStorageSettings(
+            STORAGE_BACKEND="s3",
+            S3_BUCKET="images",
+            S3_PREFIX="img/",
+            S3_REGION="us-east-1",
+            S3_ACCESS_KEY_ID="test",
+            S3_SECRET_ACCESS_KEY="test",
+            S3_PART_SIZE=PART_SIZE,
+        )
+        storage = S3Storage(settings, directory)
+        storage.client.create_bucket(Bucket="images")
+
+        content = os.urandom(PART_SIZE + 1024)
+        staged = storage.staging_path("blobs/ab/cd/abcd.png")
+        with open(staged, "wb") as f:
+            f.write(content)
+        storage.put_file(staged, "blobs/ab/cd/abcd.png", "image/png")
+        assert not os.path.exists(staged)
+
+        head = storage.client.head_object(Bucket="images", Key="img/blobs/ab/cd/abcd.png")
+        assert head["ETag"].strip('"').endswith("-2")  # Uploaded as two parts
+        assert head["ContentType"] == "image/png"
+        assert storage.filename(storage.location("blobs/ab/cd/abcd.png")) == "blobs/ab/cd/abcd.png"
+
+        path = storage.fetch("blobs/ab/cd/abcd.png")
+        with open(path, "rb") as f:
+            assert f.read() == content
+        storage.discard(path)
+
+        redirect = storage.redirect("blobs/ab/cd/abcd.png")
+        assert redirect is not None and redirect.status_code == 307
+        assert "img/blobs/ab/cd/abcd.png" in redirect.headers["location"]
+
+        storage.put_bytes("variants/ab/cd/abcd/thumb.webp", b"thumb", "image/webp")
+        storage.put_bytes(".gitkeep", b"", None)
+        files = {file.filename: file.size for file in storage.iter_files()}
+        assert files == {"blobs/ab/cd/abcd.png": len(content), "variants/ab/cd/abcd/thumb.webp": 5}
+        assert storage.size("variants/ab/cd/abcd/thumb.webp") == 5
+
+        storage.delete_directory("variants/ab/cd/abcd")
+        storage.delete("blobs/ab/cd/abcd.png")
+        storage.delete(".gitkeep")
+        assert not storage.exists("variants/ab/cd/abcd/thumb.webp")
+        assert not storage.exists("blobs/ab/cd/abcd.png")
+        with pytest.raises(FileNotFoundError):
+            storage.fetch("blobs/ab/cd/abcd.png")
+        assert os.listdir(directory) == []
@@ -0,0 +1,48 @@
+import asyncio
+import os
+from pathlib import Path
+
+import httpx
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from src.app.core.utils.storage_layout import (
+    ShardedStaticFiles,
+    blob_filename,
+    image_filename,
+    sharded_path,
+    variant_filename,
+)
+
+IMAGE_ID = "9d4f1f0e-7c1a-4d5e-9a3b-2f6c8e0b1d47"
+SHA256 = "0a794b7ab2a9413ffcf2f0a16dc23804207ea7207fee4eb83a51f56d1639fcc7"
+
+
+def test_files_are_sharded_by_key_prefix() -> None:
+    assert image_filename(IMAGE_ID, "png") == f"9d/4f/{IMAGE_ID}.png"
+    assert blob_filename(SHA256, "png") == f"blobs/0a/79/{SHA256}.png"
+    assert variant_filename(SHA256, "thumb", "webp") == f"variants/0a/79/{SHA256}/thumb.webp"
+
+
+def test_flat_paths_map_to_their_sharded_location() -> None:
+    assert sharded_path(f"{IMAGE_ID}.png") == image_filename(IMAGE_ID, "png")
+    assert sharded_path(f"blobs/{SHA256}.png") == blob_filename(SHA256, "png")
+    assert sharded_path(f"variants/{SHA256}/thumb.webp") == variant_filename(SHA256, "thumb", "webp")
+
+    for path in (image_filename(IMAGE_ID, "png"), blob_filename(SHA256, "png"), ".results/abcd.png", "README"):
+        assert sharded_path(path) is None
+
+
+def test_hidden_files_are_not_served(tmp_path: Path) -> None:
+    for filename in (image_filename(IMAGE_ID, "png"), f".tmp/{IMAGE_ID}.png", ".transforms/abcd.webp"):
+        os.makedirs(tmp_path / os.path.dirname(filename), exist_ok=True)
+        (tmp_path / filename).write_bytes(b"image")
+    app = Starlette(routes=[Mount("/uploads", ShardedStaticFiles(directory=str(tmp_path)))])
+
+    async def get(url: str) -> int:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return (await client.get(url)).status_code
+
+    assert asyncio.run(get(f"/uploads/{IMAGE_ID}.png")) == 200
+    assert asyncio.run(get(f"/uploads/.tmp/{IMAGE_ID}.png")) == 404
+    assert asyncio.run(get("/uploads/.transforms/abcd.webp")) == 404
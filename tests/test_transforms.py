@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+from PIL import Image
+
+from src.app.core.utils.imaging import transform_image
+from src.app.core.utils.transforms import negotiate_format
+from src.app.schemas.image import ImageFormat
+
+
+def test_transform_image_fits_and_covers_without_enlarging() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.png")
+        Image.new("RGB", (400, 200), "red").save(source)
+        target = os.path.join(directory, "target.webp")
+
+        assert transform_image(source, target, 100, 100, False, "webp", 80) == (100, 50)
+        assert transform_image(source, target, 100, 100, True, "webp", 80) == (100, 100)
+        assert transform_image(source, target, None, 50, False, "webp", 80) == (100, 50)
+        # A box larger than the image keeps the box's aspect ratio at the image's scale
+        assert transform_image(source, target, 800, 800, True, "webp", 80) == (200, 200)
+        assert transform_image(source, target, 1000, None, False, "webp", 80) == (400, 200)
+        with Image.open(target) as result:
+            assert result.format == "WEBP"
+
+
+def test_negotiate_format_prefers_modern_formats_the_client_accepts() -> None:
+    assert negotiate_format("image/avif,image/webp,*/*", "image/jpeg") == ImageFormat.AVIF
+    assert negotiate_format("image/webp,*/*;q=0.8", "image/jpeg") == ImageFormat.WEBP
+    assert negotiate_format("image/avif;q=0,image/webp", "image/jpeg") == ImageFormat.WEBP
+    assert negotiate_format("*/*", "image/jpeg") == ImageFormat.JPEG
+    assert negotiate_format(None, "image/png") == ImageFormat.PNG
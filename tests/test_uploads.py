@@ -0,0 +1,72 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.types import Message
+
+from src.app.core.utils.uploads import MAX_FIELDS, stream_form
+
+BOUNDARY = "upload-boundary"
+
+
+def file_part(name: str, filename: str, content: bytes) -> bytes:
+    return (
+        (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: image/png\r\n\r\n"
+        ).encode()
+        + content
+        + b"\r\n"
+    )
+
+
+def field_part(name: str, value: str) -> bytes:
+    return f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+
+
+def make_request(chunks: list[bytes], received: list[int]) -> Request:
+    """A request whose body arrives in `chunks`, counting in `received` how many were read."""
+
+    async def receive() -> Message:
+        index = received[0]
+        received[0] += 1
+        return {"type": "http.request", "body": chunks[index], "more_body": index + 1 < len(chunks)}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }
+    return Request(scope, receive)
+
+
+def test_oversized_file_aborts_mid_stream_without_leaving_files() -> None:
+    body = file_part("file", "big.png", b"x" * 64 * 1024) + f"--{BOUNDARY}--\r\n".encode()
+    chunks = [body[i : i + 4096] for i in range(0, len(body), 4096)]
+    received = [0]
+
+    with tempfile.TemporaryDirectory() as directory:
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(stream_form(make_request(chunks, received), directory, max_file_size=16 * 1024))
+        assert exc_info.value.status_code == 413
+        assert received[0] < len(chunks) // 2
+        assert os.listdir(directory) == []
+
+
+def test_number_of_form_fields_is_bounded() -> None:
+    fields = b"".join(field_part(f"field{i}", "value") for i in range(MAX_FIELDS + 1))
+    body = fields + f"--{BOUNDARY}--\r\n".encode()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(stream_form(make_request([body], [0]), directory, max_file_size=1024))
+        assert exc_info.value.status_code == 413
+
+        form = asyncio.run(
+            stream_form(make_request([field_part("ids", "a") + f"--{BOUNDARY}--\r\n".encode()], [0]), directory, 1024)
+        )
+        assert form.fields == {"ids": ["a"]}
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from PIL import Image as PILImage
+
+from src.app.core.config import ImageVariantSettings
+from src.app.core.utils import image_store, variants
+from src.app.core.utils.variants import VariantPipeline, describe_variants
+from src.app.models.image import Image
+from tests.conftest import RunWithDb
+
+SETTINGS = ImageVariantSettings(
+    IMAGE_VARIANTS={"thumb": (256, "webp"), "small": (64, "png"), "unknown": (64, "bmp")},
+    IMAGE_VARIANT_WORKERS=1,
+)
+
+
+def with_pipeline(monkeypatch: pytest.MonkeyPatch, test):
+    """Wrap a test taking a session factory and a running `VariantPipeline` for `run_with_db`."""
+
+    async def main(sessions) -> None:
+        monkeypatch.setattr(variants, "AsyncSessionLocal", sessions)
+        pipeline = VariantPipeline(SETTINGS)
+        pipeline.start()
+        try:
+            await test(sessions, pipeline)
+        finally:
+            await pipeline.stop()
+
+    return main
+
+
+def test_variants_are_rendered_once_per_content(run_with_db: RunWithDb, monkeypatch: pytest.MonkeyPatch) -> None:
+    storage = variants.storage
+    source = storage.staging_path("ab/cd/abcd.png")
+    PILImage.new("RGB", (600, 400), "red").save(source)
+
+    async def test(sessions, pipeline: VariantPipeline) -> None:
+        assert sorted(pipeline.specs) == ["small", "thumb"]  # BMP is not a variant format
+        async with sessions() as db:
+            for image_id in ("a", "b"):
+                db.add(Image(id=image_id, file_path=source, url=image_store.image_url("ab/cd/abcd.png")))
+            await db.commit()
+
+        described = describe_variants(await pipeline.process("a", source, "abcd"))
+        assert (described["thumb"]["width"], described["thumb"]["height"]) == (256, 171)
+        assert described["thumb"]["content_type"] == "image/webp"
+        assert (described["small"]["width"], described["small"]["height"]) == (64, 43)
+
+        # Images sharing the content get the same files without rendering them again
+        os.remove(source)
+        assert describe_variants(await pipeline.process("b", source, "abcd")) == described
+        # Processing an image again returns the variants it has
+        assert describe_variants(await pipeline.process("a", source, "abcd")) == described
+
+    run_with_db(with_pipeline(monkeypatch, test))
+    files = sorted(file.filename for file in storage.iter_files())
+    assert len(files) == 2 and all(name.startswith("variants/") for name in files)
@@ -0,0 +1,17 @@
+import pytest
+
+from src.app.core.worker.settings import cron_schedule, garbage_collection_jobs
+
+
+def test_garbage_collection_runs_evenly_spaced_across_the_day() -> None:
+    assert cron_schedule(15) == ({0, 15, 30, 45}, None)
+    assert cron_schedule(60) == ({0}, None)
+    assert cron_schedule(360) == ({0}, {0, 6, 12, 18})
+
+    [job] = garbage_collection_jobs(120)
+    assert (job.minute, job.hour, job.timeout_s) == ({0}, set(range(0, 24, 2)), 120 * 60)
+    assert garbage_collection_jobs(0) == []
+
+    for interval in (7, 90, 300):
+        with pytest.raises(ValueError):
+            garbage_collection_jobs(interval)